@@ -0,0 +1,82 @@
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+from .datetime_parser import JST
+
+logger = logging.getLogger(__name__)
+
+# 自動決定のモード: "off"（既定）/ "propose"（スレッドで決定を提案する）/ "finalize"（手動の決定と同じ処理で決定する）
+AUTO_CLOSE_MODE = os.getenv("AUTO_CLOSE_MODE", "off")
+# 最多のスタンプの参加者がこの人数に達したら決定する（0 で無効）
+AUTO_CLOSE_MIN_VOTES = int(os.getenv("AUTO_CLOSE_MIN_VOTES", "0"))
+# 候補日投稿からこの時間（時間）が過ぎたら、その時点で最多のスタンプで決定する（0 で無効）
+AUTO_CLOSE_DEADLINE_HOURS = float(os.getenv("AUTO_CLOSE_DEADLINE_HOURS", "0"))
+# 最多のスタンプが 2 番目をこの人数以上上回っている場合だけ決定する（既定 1 で同数のときは決定しない）
+AUTO_CLOSE_MIN_LEAD = int(os.getenv("AUTO_CLOSE_MIN_LEAD", "1"))
+# 締め切りを確認する間隔（秒）
+AUTO_CLOSE_CHECK_INTERVAL = float(os.getenv("AUTO_CLOSE_CHECK_INTERVAL", "300"))
+
+
+class AutoCloseRules:
+    """
+    スタンプごとの参加者数から、候補日投稿を自動で決定するかどうかを判定するルール
+
+    判定には集計（ScheduleIndex.tally）だけを使い、DB は参照しない。
+    同じスケジュール・スタンプについて提案や決定を繰り返さないよう、行った判定を記録する。
+    """
+
+    def __init__(self, mode: str = AUTO_CLOSE_MODE, min_votes: int = AUTO_CLOSE_MIN_VOTES,
+                 deadline_hours: float = AUTO_CLOSE_DEADLINE_HOURS, min_lead: int = AUTO_CLOSE_MIN_LEAD):
+        self.mode = mode
+        self.min_votes = min_votes
+        self.deadline_hours = deadline_hours
+        self.min_lead = min_lead
+        self._lock = threading.Lock()
+        self._acted: dict[str, str] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("propose", "finalize") and (self.min_votes > 0 or self.deadline_hours > 0)
+
+    def evaluate(self, message_ts: str, options: dict, tally: dict, now: datetime = None) -> Optional[tuple]:
+        """
+        決定すべきであれば (スタンプ, 理由) を、そうでなければ None を返す
+
+        日時を過ぎた候補は対象外とし、参加者数が同じ場合は日時の早い候補を上位とする。
+        """
+        now = now or datetime.now(JST)
+        ranked = sorted(
+            ((tally.get(emoji, 0), datetime.fromisoformat(dt_str), emoji) for emoji, dt_str in options.items()
+             if datetime.fromisoformat(dt_str) > now),
+            key=lambda item: (-item[0], item[1]))
+        if not ranked or ranked[0][0] == 0:
+            return None
+        votes, _, emoji = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0
+        if votes - runner_up < self.min_lead:
+            return None
+        if self.min_votes > 0 and votes >= self.min_votes:
+            return emoji, f"参加者が{votes}人に達した"
+        if self.deadline_hours > 0 and now.timestamp() >= float(message_ts) + self.deadline_hours * 3600:
+            return emoji, f"締め切り（投稿から{self.deadline_hours:g}時間）を過ぎた"
+        return None
+
+    def has_acted(self, message_ts: str, emoji: str) -> bool:
+        with self._lock:
+            return self._acted.get(message_ts) == emoji
+
+    def mark_acted(self, message_ts: str, emoji: str) -> bool:
+        """
+        提案・決定を行ったことを記録する。同じスタンプで既に行っていれば False を返す
+        """
+        with self._lock:
+            if self._acted.get(message_ts) == emoji:
+                return False
+            self._acted[message_ts] = emoji
+            return True
+
+    def forget(self, message_ts: str):
+        with self._lock:
+            self._acted.pop(message_ts, None)
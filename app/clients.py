@@ -0,0 +1,245 @@
+import io
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.message import Message
+from typing import Optional
+from urllib.error import HTTPError
+from urllib.request import Request
+import httpx
+from .metrics import InstrumentedWebClient
+
+logger = logging.getLogger(__name__)
+
+# Slack / Supabase への HTTP 接続プールの上限（同時接続数と、使い回すために保持する接続数）
+SLACK_HTTP_MAX_CONNECTIONS = int(os.getenv("SLACK_HTTP_MAX_CONNECTIONS", "20"))
+SLACK_HTTP_MAX_KEEPALIVE = int(os.getenv("SLACK_HTTP_MAX_KEEPALIVE", "10"))
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20"))
+SUPABASE_HTTP_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "10"))
+# 使われていない接続を保持する秒数
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# 1回のリクエストのタイムアウト（秒）
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+# OAuth で複数のワークスペースにインストールする Slack アプリのクライアント ID（未設定なら SLACK_BOT_TOKEN の1ワークスペースのみ）
+SLACK_CLIENT_ID = os.getenv("SLACK_CLIENT_ID")
+# 複数ワークスペースで使う場合に保持するワークスペースごとの Slack クライアントの数と、
+# インストール情報がないワークスペースを記憶する秒数
+SLACK_CLIENT_POOL_SIZE = int(os.getenv("SLACK_CLIENT_POOL_SIZE", "100"))
+SLACK_INSTALLATION_NEGATIVE_TTL = float(os.getenv("SLACK_INSTALLATION_NEGATIVE_TTL", "60"))
+
+# 処理中のイベントやジョブのワークスペース（team_id）
+_current_team: ContextVar[Optional[str]] = ContextVar("slack_team_id", default=None)
+
+
+def current_team_id() -> Optional[str]:
+    return _current_team.get()
+
+
+@contextmanager
+def team_context(team_id: Optional[str]):
+    """
+    この中で呼び出す get_slack_client() やレート制限を、指定したワークスペースのものにする
+    """
+    token = _current_team.set(team_id or None)
+    try:
+        yield
+    finally:
+        _current_team.reset(token)
+
+
+def _limits(max_connections: int, max_keepalive: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+
+
+class PooledWebClient(InstrumentedWebClient):
+    """
+    接続プールを持つ httpx.Client で Web API を呼び出す WebClient
+
+    標準の WebClient は呼び出しごとに urllib で接続を張り直すため、同じ接続を使い回すように HTTP の送受信だけを置き換える。
+    エラー応答は urllib と同じく HTTPError にするので、リトライやレート制限の扱いは WebClient のまま変わらない。
+    """
+
+    def __init__(self, *args, http_client: Optional[httpx.Client] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 渡された接続プールは共有しているので、close() では閉じない
+        self._owns_http_client = http_client is None
+        self.http_client = http_client or httpx.Client(
+            limits=_limits(SLACK_HTTP_MAX_CONNECTIONS, SLACK_HTTP_MAX_KEEPALIVE),
+            timeout=self.timeout, proxy=self.proxy, verify=self.ssl or True,
+        )
+
+    def _perform_urllib_http_request_internal(self, url: str, req: Request) -> dict:
+        response = self.http_client.request(req.get_method(), url, content=req.data, headers=dict(req.header_items()))
+        headers = Message()
+        for name, value in response.headers.multi_items():
+            headers[name] = value
+        if response.status_code >= 400:
+            raise HTTPError(url, response.status_code, response.reason_phrase, headers, io.BytesIO(response.content))
+        if headers.get_content_type() == "application/gzip":
+            return {"status": response.status_code, "headers": headers, "body": response.content}
+        return {"status": response.status_code, "headers": headers, "body": response.text}
+
+    def close(self):
+        if self._owns_http_client:
+            self.http_client.close()
+
+
+_slack_http: Optional[httpx.Client] = None
+_slack_client = None
+_supabase = None
+_clients_lock = threading.Lock()
+
+
+def new_slack_client(token: Optional[str] = None) -> PooledWebClient:
+    """
+    Slack の HTTP 接続プールを共有する WebClient を作成する（API呼び出しの所要時間とエラー数を記録する）
+    """
+    global _slack_http
+    with _clients_lock:
+        if _slack_http is None:
+            _slack_http = httpx.Client(
+                limits=_limits(SLACK_HTTP_MAX_CONNECTIONS, SLACK_HTTP_MAX_KEEPALIVE), timeout=HTTP_TIMEOUT,
+            )
+    return PooledWebClient(token=token, timeout=int(HTTP_TIMEOUT), http_client=_slack_http)
+
+
+class SlackClientPool:
+    """
+    OAuth でインストールされたワークスペース（team_id）ごとの Slack クライアントを LRU で保持するプール
+
+    クライアントは HTTP の接続プールを共有するトークンだけの軽いオブジェクトなので、
+    追い出しても接続は閉じず、ワークスペースが増えてもメモリと接続数は上限を超えない。
+    """
+
+    def __init__(self, maxsize: int = SLACK_CLIENT_POOL_SIZE,
+                 negative_ttl: float = SLACK_INSTALLATION_NEGATIVE_TTL):
+        self._maxsize = maxsize
+        self._negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._clients: OrderedDict[str, PooledWebClient] = OrderedDict()
+        self._missing: dict[str, float] = {}
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, team_id: str) -> Optional[PooledWebClient]:
+        """
+        ワークスペースの Slack クライアントを返す。インストール情報がなければ None
+        """
+        now = time.monotonic()
+        with self._lock:
+            client = self._clients.get(team_id)
+            if client is not None:
+                self._clients.move_to_end(team_id)
+                self._counters["hits"] += 1
+                return client
+            if self._missing.get(team_id, 0) > now:
+                return None
+            self._counters["misses"] += 1
+
+        from .storage import get_store
+
+        installation = get_store().get_installation(team_id)
+        with self._lock:
+            if installation is None or not installation.get('bot_token'):
+                self._missing[team_id] = now + self._negative_ttl
+                return None
+            self._missing.pop(team_id, None)
+            client = self._clients.get(team_id) or new_slack_client(installation['bot_token'])
+            self._clients[team_id] = client
+            self._clients.move_to_end(team_id)
+            while len(self._clients) > self._maxsize:
+                self._clients.popitem(last=False)
+                self._counters["evictions"] += 1
+        return client
+
+    def invalidate(self, team_id: str):
+        """
+        インストール・再インストールされたワークスペースのクライアントを作り直させる
+        """
+        with self._lock:
+            self._clients.pop(team_id, None)
+            self._missing.pop(team_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "size": len(self._clients)}
+
+
+# アプリ全体で共有するワークスペースごとのクライアント
+slack_client_pool = SlackClientPool()
+
+
+def get_slack_client():
+    """
+    Slack の WebClient を返す
+
+    SLACK_CLIENT_ID が設定されていて、処理中のワークスペースがインストール済みであればそのトークンのクライアントを、
+    そうでなければ SLACK_BOT_TOKEN のクライアント（初回呼び出し時に作成する）を返す。
+    """
+    global _slack_client
+    team_id = current_team_id()
+    if team_id and SLACK_CLIENT_ID:
+        client = slack_client_pool.get(team_id)
+        if client is not None:
+            return client
+    if _slack_client is None:
+        bot_token = os.getenv("SLACK_BOT_TOKEN")
+        if not bot_token:
+            raise ValueError(f"SLACK_BOT_TOKEN is not set and the workspace is not installed: {team_id}")
+        client = new_slack_client(bot_token)
+        with _clients_lock:
+            if _slack_client is None:
+                _slack_client = client
+                logger.info("Slack クライアントを作成しました")
+    return _slack_client
+
+
+def set_slack_client(client):
+    """
+    使用する Slack クライアントを差し替える（ベンチマークやローカル実行用）
+    """
+    global _slack_client
+    _slack_client = client
+
+
+def get_supabase():
+    """
+    Supabase クライアントを返す（初回呼び出し時に作成する）
+    """
+    global _supabase
+    if _supabase is None:
+        with _clients_lock:
+            if _supabase is None:
+                from supabase import create_client, ClientOptions
+
+                url = os.getenv("SUPABASE_URL")
+                key = os.getenv("SUPABASE_KEY")
+                if not url or not key:
+                    raise ValueError("SUPABASE_URL / SUPABASE_KEY is not set in environment variables")
+                http_client = httpx.Client(
+                    limits=_limits(SUPABASE_HTTP_MAX_CONNECTIONS, SUPABASE_HTTP_MAX_KEEPALIVE), timeout=HTTP_TIMEOUT,
+                )
+                _supabase = create_client(url, key, options=ClientOptions(
+                    httpx_client=http_client, postgrest_client_timeout=HTTP_TIMEOUT,
+                ))
+                logger.info("Supabase クライアントを作成しました")
+    return _supabase
+
+
+def close_clients():
+    """
+    作成したクライアントの接続プールを閉じる（シャットダウン時に main.py から呼ぶ）
+    """
+    global _slack_http, _slack_client, _supabase
+    with _clients_lock:
+        if _slack_http is not None:
+            _slack_http.close()
+        if _supabase is not None and _supabase.options.httpx_client is not None:
+            _supabase.options.httpx_client.close()
+        _slack_http = None
+        _slack_client = None
+        _supabase = None
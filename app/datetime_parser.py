@@ -0,0 +1,172 @@
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import pytz
+
+# 日本時間のタイムゾーンオブジェクトを定義
+JST = pytz.timezone('Asia/Tokyo')
+
+# 正規化済みテキストの解析結果をキャッシュする件数
+DATETIME_PARSE_CACHE_SIZE = int(os.getenv("DATETIME_PARSE_CACHE_SIZE", "4096"))
+
+# 全角コロン・全角数字を半角に変換するテーブル
+_NORMALIZE_TABLE = str.maketrans('：１２３４５６７８９０', ':1234567890')
+
+# 曜日表記・ひらがなの除去（元の実装と同じ順序で適用する）
+_WEEKDAY_FULLWIDTH_PAREN = re.compile(r'（[月火水木金土日]）')
+_WEEKDAY_PAREN = re.compile(r'\([月火水木金土日]\)')
+_WEEKDAY_SUFFIX = re.compile(r'[月火水木金土日]曜日')
+_HIRAGANA = re.compile(r'[ぁ-ん]')
+
+# 「月/日」または「月月日日」の形式
+_DATE = re.compile(r'(\d{1,2})[月/](\d{1,2})日?')
+
+# 時刻表記を優先度順（時半 > 時分 > 時 > HH:MM）に並べた1つのパターン
+# 先読みで各位置の候補をゼロ幅で拾うため、1回の走査で
+# 「最も優先度の高い表記のうち最も左にあるもの」を選べる
+_TIME = re.compile(
+    r'(?=(?:'
+    r'(?P<half>\d{1,2})時半'
+    r'|(?P<hm_h>\d{1,2})時(?P<hm_m>\d{1,2})分'
+    r'|(?P<h>\d{1,2})時'
+    r'|(?P<colon_h>\d{1,2}):(?P<colon_m>\d{2})'
+    r'))'
+)
+# マッチした最後のグループ名から優先度を引く
+_TIME_PRIORITY = {'half': 0, 'hm_m': 1, 'h': 2, 'colon_m': 3}
+
+# 候補日行（:emoji: 日時）
+_OPTION_LINE = re.compile(r':(\w+):\s*(?:[:：]\s*)?(.+)')
+
+
+class ParsedDateTime(NamedTuple):
+    """
+    候補日テキストの解析結果。見つからなかった項目は None
+    """
+    month: Optional[int]
+    day: Optional[int]
+    hour: Optional[int]
+    minute: Optional[int]
+    # 整形済みテキスト（「月/日 時:分」。どちらも見つからなければ不要な文字を除いた元テキスト）
+    text: str
+
+
+def normalize_datetime_text(text: str) -> str:
+    """
+    全角コロン・全角数字を半角に変換する
+    """
+    return text.translate(_NORMALIZE_TABLE)
+
+
+def _strip_noise(text: str) -> str:
+    if '（' in text:
+        text = _WEEKDAY_FULLWIDTH_PAREN.sub('', text)
+    if '(' in text:
+        text = _WEEKDAY_PAREN.sub('', text)
+    if '曜日' in text:
+        text = _WEEKDAY_SUFFIX.sub('', text)
+    return _HIRAGANA.sub('', text)
+
+
+def _search_time(text: str):
+    best = None
+    best_priority = len(_TIME_PRIORITY)
+    for m in _TIME.finditer(text):
+        priority = _TIME_PRIORITY[m.lastgroup]
+        if priority < best_priority:
+            best, best_priority = m, priority
+            if priority == 0:
+                break
+    return best
+
+
+def _parse_once(text: str) -> ParsedDateTime:
+    text = _strip_noise(text)
+    month = day = hour = minute = None
+    date_part = time_part = ''
+
+    m = _DATE.search(text)
+    if m:
+        month, day = int(m.group(1)), int(m.group(2))
+        date_part = f"{m.group(1)}/{m.group(2)}"
+
+    t = _search_time(text)
+    if t is not None:
+        if t.lastgroup == 'half':
+            hour, minute = int(t.group('half')), 30
+            time_part = f"{t.group('half')}:30"
+        elif t.lastgroup == 'hm_m':
+            hour, minute = int(t.group('hm_h')), int(t.group('hm_m'))
+            time_part = f"{t.group('hm_h')}:{t.group('hm_m').zfill(2)}"
+        elif t.lastgroup == 'h':
+            hour, minute = int(t.group('h')), 0
+            time_part = f"{t.group('h')}:00"
+        else:
+            hour, minute = int(t.group('colon_h')), int(t.group('colon_m'))
+            time_part = f"{t.group('colon_h')}:{t.group('colon_m')}"
+
+    if date_part and time_part:
+        cleaned = f"{date_part} {time_part}"
+    else:
+        cleaned = date_part or time_part or text.strip()
+    return ParsedDateTime(month, day, hour, minute, cleaned)
+
+
+@lru_cache(maxsize=DATETIME_PARSE_CACHE_SIZE)
+def _parse_normalized(text: str) -> ParsedDateTime:
+    parsed = _parse_once(text)
+    if parsed.month is None and parsed.hour is None and parsed.text != text.strip():
+        # 旧実装は整形済みテキストを再度整形してから日時を読んでいたため、
+        # ひらがなを除いて初めて現れた曜日表記なども取り除いてもう一度だけ解析する
+        retried = _parse_once(parsed.text)
+        parsed = parsed._replace(month=retried.month, day=retried.day,
+                                 hour=retried.hour, minute=retried.minute)
+    return parsed
+
+
+def parse_datetime_text(text: str) -> ParsedDateTime:
+    """
+    候補日テキストを1回の走査で解析する（正規化後のテキストで結果をキャッシュする）
+    """
+    return _parse_normalized(normalize_datetime_text(text))
+
+
+def resolve_datetime(parsed: ParsedDateTime, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    解析結果を JST の datetime に変換する
+
+    日付がなければ今日、時刻がなければ 0:00 とし、過去になる場合は翌年の日時とする。
+    """
+    now = now or datetime.now(JST)
+    month = parsed.month if parsed.month is not None else now.month
+    day = parsed.day if parsed.day is not None else now.day
+    hour = parsed.hour if parsed.hour is not None else 0
+    minute = parsed.minute if parsed.minute is not None else 0
+    try:
+        # naiveなdatetimeオブジェクトを作成
+        naive_dt = datetime(now.year, month, day, hour, minute)
+        dt = JST.localize(naive_dt)
+        if dt < now:
+            dt = dt.replace(year=dt.year + 1)
+        return dt
+    except ValueError:
+        return None
+
+
+def parse_option_lines(text: str) -> list[tuple[str, str, ParsedDateTime]]:
+    """
+    メッセージ全体から候補日行を取り出し、(スタンプ名, 日時テキスト, 解析結果) のリストを返す
+    """
+    results = []
+    for line in text.split('\n'):
+        match = _OPTION_LINE.search(line)
+        if match:
+            emoji, datetime_str = match.groups()
+            results.append((emoji, datetime_str, parse_datetime_text(datetime_str)))
+    return results
+
+
+def parse_cache_info():
+    return _parse_normalized.cache_info()
@@ -0,0 +1,109 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from .storage import get_store
+
+logger = logging.getLogger(__name__)
+
+# 同じ event_id を重複とみなす期間（秒）と、メモリに保持する最大件数
+EVENT_DEDUP_TTL = float(os.getenv("EVENT_DEDUP_TTL", "900"))
+EVENT_DEDUP_MAXSIZE = int(os.getenv("EVENT_DEDUP_MAXSIZE", "50000"))
+# 複数ワーカー・複数ノードで重複を判定するために、ストアにも受信記録を残すか
+EVENT_DEDUP_SHARED = os.getenv("EVENT_DEDUP_SHARED", "false").lower() in ("1", "true", "yes")
+
+
+class EventDeduplicator:
+    """
+    Slack イベントの再送を envelope の event_id で判定して捨てる
+
+    メモリ上の TTL 付き LRU で判定し、共有モードではメモリにない event_id だけをストアで確認する。
+    """
+
+    def __init__(self, ttl: float = EVENT_DEDUP_TTL, maxsize: int = EVENT_DEDUP_MAXSIZE,
+                 shared: bool = EVENT_DEDUP_SHARED):
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._counters = {"checked": 0, "duplicates_dropped": 0, "retries_received": 0, "evictions": 0}
+
+    def _remember(self, event_id: str) -> bool:
+        """
+        メモリ上で未登録なら登録して True、TTL 内に登録済みなら False を返す
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._counters["checked"] += 1
+            expires_at = self._seen.get(event_id)
+            if expires_at is not None and expires_at > now:
+                self._counters["duplicates_dropped"] += 1
+                return False
+            self._seen[event_id] = now + self._ttl
+            self._seen.move_to_end(event_id)
+            while len(self._seen) > self._maxsize:
+                self._seen.popitem(last=False)
+                self._counters["evictions"] += 1
+            return True
+
+    async def is_duplicate(self, event_id: str, retry_num: str = None, retry_reason: str = None) -> bool:
+        """
+        初めて受け取った event_id なら記録して False、再送なら True を返す
+        """
+        if retry_num:
+            with self._lock:
+                self._counters["retries_received"] += 1
+            logger.info(f"Slackからの再送を受信しました: event_id={event_id}, retry={retry_num}, reason={retry_reason}")
+        if not event_id:
+            return False
+        if not self._remember(event_id):
+            logger.info(f"重複イベントを破棄しました: {event_id}")
+            return True
+        if self.shared:
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=self._ttl)
+            try:
+                claimed = await asyncio.to_thread(get_store().claim_event, event_id, expires_at)
+            except Exception as e:
+                # ストアに記録できない場合は処理を優先する
+                logger.error(f"イベントの受信記録に失敗しました: {event_id}, Error: {e}")
+                return False
+            if not claimed:
+                with self._lock:
+                    self._counters["duplicates_dropped"] += 1
+                logger.info(f"他のワーカーが処理済みの重複イベントを破棄しました: {event_id}")
+                return True
+        return False
+
+    async def forget(self, event_id: str):
+        """
+        受け付けられなかったイベントの記録を取り消し、Slack の再送を処理できるようにする
+        """
+        if not event_id:
+            return
+        with self._lock:
+            self._seen.pop(event_id, None)
+        if self.shared:
+            try:
+                await asyncio.to_thread(get_store().release_event, event_id)
+            except Exception as e:
+                logger.error(f"イベントの受信記録の取り消しに失敗しました: {event_id}, Error: {e}")
+
+    def purge_expired(self) -> int:
+        """
+        共有モードで期限切れになった受信記録をストアから削除する（スケジューラから定期実行）
+        """
+        removed = get_store().purge_events(datetime.now(timezone.utc))
+        logger.info(f"期限切れのイベント受信記録を削除しました: {removed}件")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "size": len(self._seen)}
+
+
+# アプリ全体で共有する重複判定
+event_deduplicator = EventDeduplicator()
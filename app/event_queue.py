@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import zlib
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# ワーカー停止用の番兵
+_STOP = object()
+
+
+class EventWorkerPool:
+    """
+    Slackイベントをキューに積み、バックグラウンドのワーカーで順次処理するプール
+
+    同じキー（main_message_ts）のイベントは必ず同じワーカーに割り当てるため、
+    同一メッセージに対する追加・削除イベントの順序が入れ替わることはない。
+    """
+
+    def __init__(self, handler: Callable[[dict], Any], concurrency: int = 4,
+                 maxsize: int = 1000, put_timeout: float = 1.0):
+        # handler は同期関数。イベントループを塞がないようスレッドで実行する
+        self._handler = handler
+        self.concurrency = max(1, concurrency)
+        # maxsize はプール全体の上限。各ワーカーのキューに均等に割り振る
+        self._shard_maxsize = max(1, maxsize // self.concurrency)
+        self._put_timeout = put_timeout
+        self._queues: list[asyncio.Queue] = []
+        self._workers: list[asyncio.Task] = []
+        self._accepting = False
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def qsize(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def start(self):
+        """
+        ワーカーを起動する（イベントループ上で呼び出すこと）
+        """
+        if self._workers:
+            return
+        self._queues = [asyncio.Queue(maxsize=self._shard_maxsize) for _ in range(self.concurrency)]
+        self._workers = [
+            asyncio.create_task(self._worker(i, q), name=f"slack-event-worker-{i}")
+            for i, q in enumerate(self._queues)
+        ]
+        self._accepting = True
+        logger.info(f"イベントワーカーを起動しました: concurrency={self.concurrency}")
+
+    def _shard(self, key: str) -> asyncio.Queue:
+        # プロセス間で安定したハッシュでワーカーを決める
+        index = zlib.crc32(key.encode("utf-8")) % self.concurrency
+        return self._queues[index]
+
+    async def submit(self, key: str, body: dict) -> bool:
+        """
+        イベントをキューに積む。キューが満杯のまま put_timeout を過ぎた場合は False を返す
+        """
+        if not self._accepting:
+            return False
+        queue = self._shard(key or "")
+        try:
+            queue.put_nowait(body)
+            return True
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(queue.put(body), timeout=self._put_timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"イベントキューが満杯のため受け付けできません: key={key}, qsize={self.qsize()}")
+            return False
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        while True:
+            body = await queue.get()
+            try:
+                if body is _STOP:
+                    return
+                await asyncio.to_thread(self._handler, body)
+            except Exception as e:
+                logger.error(f"イベント処理中にエラーが発生しました (worker={index}): {e}")
+            finally:
+                queue.task_done()
+
+    async def drain(self, timeout: float = 10.0):
+        """
+        新規受付を止め、キューに残ったイベントを処理し終えてからワーカーを停止する
+        """
+        if not self._workers:
+            return
+        self._accepting = False
+        remaining = self.qsize()
+        logger.info(f"イベントキューを排出します: 残り{remaining}件")
+        for queue in self._queues:
+            # 番兵は満杯でも必ず積む（既存のイベントの後ろに並ぶ）
+            await queue.put(_STOP)
+        done, pending = await asyncio.wait(self._workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"タイムアウトのため未処理のイベントを破棄しました: 残り{self.qsize()}件")
+        self._workers = []
+        self._queues = []
+        logger.info("イベントワーカーを停止しました。")
+
+
+class TeamInflightLimiter:
+    """
+    ワークスペース（team_id）ごとに、受け付けてから処理し終えるまでのイベント数を制限する
+
+    1つのワークスペースから大量のイベントが届いても、キューとワーカーを占有して
+    他のワークスペースのイベントを受け付けられなくなることはない。limit が 0 の場合は制限しない。
+    """
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._inflight: dict[str, int] = {}
+        self._rejected = 0
+
+    def try_acquire(self, team_id: str) -> bool:
+        with self._lock:
+            count = self._inflight.get(team_id, 0)
+            if self.limit > 0 and count >= self.limit:
+                self._rejected += 1
+                return False
+            self._inflight[team_id] = count + 1
+            return True
+
+    def release(self, team_id: str):
+        with self._lock:
+            count = self._inflight.get(team_id, 0) - 1
+            if count > 0:
+                self._inflight[team_id] = count
+            else:
+                self._inflight.pop(team_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "teams": len(self._inflight),
+                "inflight": sum(self._inflight.values()),
+                "rejected": self._rejected,
+            }
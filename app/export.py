@@ -0,0 +1,112 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import os, io, csv, hmac, json, logging, asyncio
+from typing import Iterator, Optional
+from .storage import get_store
+from .rollups import rollups, summarize
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# エクスポート・集計APIの Bearer トークン（未設定ならAPIを無効にする）
+EXPORT_API_TOKEN = os.getenv("EXPORT_API_TOKEN")
+# エクスポートで1回にDBから読み込む件数
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+# CSV に出力するカラム（JSON のカラムは JSON 文字列にする）
+EXPORT_CSV_COLUMNS = [
+    'main_message_ts', 'team_id', 'channel_id', 'options', 'participants', 'vote_counts',
+    'selected_emoji', 'selected_datetime', 'reminder_at', 'is_reminder_sent', 'reminder_deliveries', 'created_at',
+]
+
+
+def _authorized(request: Request) -> Optional[PlainTextResponse]:
+    """
+    API が無効であれば 404、トークンが一致しなければ 401 の応答を返す
+    """
+    if not EXPORT_API_TOKEN:
+        return PlainTextResponse("Export API is not configured", status_code=404)
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), EXPORT_API_TOKEN.encode()):
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return None
+
+
+def iter_export_rows(cursor: Optional[str], limit: Optional[int], team_id: Optional[str]) -> Iterator[dict]:
+    """
+    cursor（main_message_ts）より後のスケジュールを main_message_ts の順に返す
+
+    DB からは EXPORT_PAGE_SIZE 件ずつ読み込むため、テーブル全体をメモリに載せない。
+    """
+    count = 0
+    page_size = min(EXPORT_PAGE_SIZE, limit) if limit else EXPORT_PAGE_SIZE
+    for page in get_store().iter_schedules(page_size, after=cursor, team_id=team_id):
+        for row in page:
+            yield row
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def _ndjson_lines(rows: Iterator[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+
+
+def _csv_lines(rows: Iterator[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values: list) -> str:
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(EXPORT_CSV_COLUMNS)
+    for row in rows:
+        values = []
+        for column in EXPORT_CSV_COLUMNS:
+            value = row.get(column)
+            values.append(json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value)
+        yield line(values)
+
+
+@router.get("/export/schedules")
+async def export_schedules(request: Request, format: str = "ndjson", cursor: str = None, limit: int = None,
+                           team_id: str = None):
+    """
+    スケジュールを NDJSON または CSV で main_message_ts の順に返す（読み取り専用）
+
+    続きを取得する場合は、最後に受け取った行の main_message_ts を cursor に指定する。
+    """
+    denied = _authorized(request)
+    if denied:
+        return denied
+    if format not in ("ndjson", "csv"):
+        return PlainTextResponse("format must be ndjson or csv", status_code=400)
+    if limit is not None and limit <= 0:
+        return PlainTextResponse("limit must be positive", status_code=400)
+    rows = iter_export_rows(cursor, limit, team_id)
+    # 同期のジェネレーターはスレッドプールで1ページずつ読み込まれる
+    if format == "csv":
+        return StreamingResponse(_csv_lines(rows), media_type="text/csv; charset=utf-8",
+                                 headers={"Content-Disposition": 'attachment; filename="schedules.csv"'})
+    return StreamingResponse(_ndjson_lines(rows), media_type="application/x-ndjson")
+
+
+@router.get("/export/stats")
+async def export_stats(request: Request, team_id: str = None, channel_id: str = None):
+    """
+    チャンネルごとの統計を、逐次更新している集計値から返す（スケジュールのテーブルは走査しない）
+    """
+    denied = _authorized(request)
+    if denied:
+        return denied
+    rows = await asyncio.to_thread(get_store().get_rollups, team_id, channel_id)
+    # まだDBに書き込んでいない増分も含める
+    for row_team, row_channel, metric, dimension, value in rollups.pending():
+        if (team_id is None or row_team == team_id) and (channel_id is None or row_channel == channel_id):
+            rows.append({'team_id': row_team, 'channel_id': row_channel, 'metric': metric,
+                         'dimension': dimension, 'value': value})
+    return JSONResponse(summarize(rows))
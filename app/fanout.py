@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional, Union
+from slack_sdk.errors import SlackApiError
+from .clients import current_team_id
+
+logger = logging.getLogger(__name__)
+
+# DMを同時に送信するスレッド数
+REMINDER_FANOUT_CONCURRENCY = int(os.getenv("REMINDER_FANOUT_CONCURRENCY", "8"))
+# 何件送信するごとに配信状況をDBに記録するか
+REMINDER_FANOUT_CHECKPOINT = int(os.getenv("REMINDER_FANOUT_CHECKPOINT", "50"))
+# 429 を受けたときに同じ宛先へ再送する最大回数
+REMINDER_FANOUT_MAX_RETRIES = int(os.getenv("REMINDER_FANOUT_MAX_RETRIES", "5"))
+
+# Slack Web API のレート制限ティア（1分あたりのリクエスト数）
+SLACK_RATE_TIERS = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+# メソッドごとの1秒あたりの上限とバースト量
+# chat.postMessage はティア外（チャンネルごとに約1件/秒）なので、DM先が分散する前提で個別に設定する
+SLACK_METHOD_LIMITS = {
+    "chat.postMessage": (float(os.getenv("SLACK_POST_MESSAGE_RATE", "10")), 10),
+    "chat.postEphemeral": (SLACK_RATE_TIERS[4] / 60, 10),
+    "reactions.get": (SLACK_RATE_TIERS[3] / 60, 5),
+}
+
+# 配信状況
+DELIVERY_SENT = "sent"
+DELIVERY_FAILED = "failed"      # 再送しても成功しない失敗（ユーザーが存在しない等）
+DELIVERY_PENDING = "pending"    # 一時的な失敗。次回のリマインドで再送する
+DELIVERY_DONE = (DELIVERY_SENT, DELIVERY_FAILED)
+
+
+class TokenBucket:
+    """
+    スレッドセーフなトークンバケット
+
+    pause() で Retry-After の間はすべての呼び出し元を待たせる。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None, reserve: float = 0) -> bool:
+        """
+        トークンを1つ取得する。timeout 秒以内に取得できなければ False を返す（None なら取得できるまで待つ）
+
+        reserve を指定すると、その数のトークンを優先度の高い呼び出し元のために残し、それを超える分だけを使う。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1 + reserve:
+                        self._tokens -= 1
+                        return True
+                    wait = (1 + reserve - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+_buckets: dict[tuple, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(method: str) -> TokenBucket:
+    """
+    Slack API メソッドごとに共有されるトークンバケットを返す
+
+    Slack のレート制限はワークスペースごとにかかるため、処理中のワークスペース（team_id）ごとに分ける。
+    """
+    key = (current_team_id(), method)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            rate, capacity = SLACK_METHOD_LIMITS.get(method, (SLACK_RATE_TIERS[2] / 60, 1))
+            bucket = TokenBucket(rate, capacity)
+            _buckets[key] = bucket
+        return bucket
+
+
+def retry_after_seconds(error: SlackApiError) -> Optional[float]:
+    """
+    429 応答であれば Retry-After の秒数を返す
+    """
+    response = error.response
+    if response is None or response.status_code != 429:
+        return None
+    headers = response.headers or {}
+    value = headers.get("Retry-After") or headers.get("retry-after") or "1"
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def _deliver_one(client, user_id: str, text: Union[str, Callable[[str], str]], bucket: TokenBucket) -> str:
+    if callable(text):
+        text = text(user_id)
+    for _ in range(REMINDER_FANOUT_MAX_RETRIES + 1):
+        bucket.acquire()
+        try:
+            client.chat_postMessage(channel=user_id, text=text)
+            logger.info(f"{user_id} にリマインドを送信しました。")
+            return DELIVERY_SENT
+        except SlackApiError as e:
+            wait = retry_after_seconds(e)
+            if wait is None:
+                logger.error(f"{user_id} へのリマインド送信に失敗しました: {e.response.get('error')}")
+                return DELIVERY_FAILED
+            logger.warning(f"レート制限のため {wait} 秒待って再送します: {user_id}")
+            bucket.pause(wait)
+        except Exception as e:
+            logger.error(f"{user_id} へのリマインド送信中にエラーが発生しました: {e}")
+            return DELIVERY_PENDING
+    return DELIVERY_PENDING
+
+
+def fan_out_messages(client, user_ids: Iterable[str], text: Union[str, Callable[[str], str]],
+                     on_checkpoint: Optional[Callable[[dict], None]] = None,
+                     concurrency: int = REMINDER_FANOUT_CONCURRENCY,
+                     checkpoint_size: int = REMINDER_FANOUT_CHECKPOINT) -> dict:
+    """
+    複数ユーザーへ同じDMを並列に送信し、宛先ごとの配信状況を返す
+
+    宛先ごとに本文を変える場合は、text に user_id を受け取って本文を返す関数を渡す。
+
+    checkpoint_size 件ごとに on_checkpoint(その区間の配信状況) を呼び出すので、途中で落ちても
+    記録済みの宛先には送信せずに再開できる（最後の記録の後に送信した、最大 checkpoint_size - 1 件には再び送信される）。
+    on_checkpoint が False を返した場合は、残りの宛先には送信せずに終了する（結果にも含めない）。
+    """
+    bucket = get_rate_limiter("chat.postMessage")
+    user_ids = list(dict.fromkeys(user_ids))
+    results: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="reminder-fanout") as executor:
+        for start in range(0, len(user_ids), max(1, checkpoint_size)):
+            chunk = user_ids[start:start + checkpoint_size]
+            statuses = executor.map(lambda u: _deliver_one(client, u, text, bucket), chunk)
+            chunk_results = dict(zip(chunk, statuses))
+            results.update(chunk_results)
+            if on_checkpoint and on_checkpoint(chunk_results) is False:
+                logger.warning(f"送信を中断しました: 残り{len(user_ids) - len(results)}件")
+                break
+    return results
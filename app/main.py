@@ -1,33 +1,135 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
-import logging
+import logging, os, asyncio
 from dotenv import load_dotenv
-from .scheduler import scheduler
+from datetime import datetime
 
-# .envファイルの読み込みとロギング設定
+# .envファイルの読み込み（各モジュールは import 時に環境変数から設定を読むため、アプリのモジュールより先に行う）
 load_dotenv()
+
+from .scheduler import scheduler
+from .datetime_parser import JST
+from .schedule_index import schedule_index
+from .dedup import event_deduplicator
+from .reconcile import REACTION_RECONCILE_INTERVAL
+from .auto_close import AUTO_CLOSE_CHECK_INTERVAL
+from .rollups import rollups, ROLLUP_FLUSH_INTERVAL
+from .retention import retention_policy, RETENTION_INTERVAL_HOURS
+from .clients import get_slack_client, close_clients, slack_client_pool, SLACK_CLIENT_ID
+from .metrics import Gauge, instrument_scheduler, render_metrics
+
+# ロギング設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# シャットダウン時にイベントキューの排出を待つ最大秒数
+EVENT_DRAIN_TIMEOUT = float(os.getenv("EVENT_DRAIN_TIMEOUT", "10"))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     アプリケーションの起動時と終了時に処理を実行するライフスパンマネージャー
     """
     logger.info("アプリケーションの起動を開始します...")
+    if not SLACK_CLIENT_ID:
+        # Slack クライアントを作成する（DB のクライアントはストアの初回利用時に作成され、接続はアプリ全体で使い回す）
+        # OAuth で複数のワークスペースにインストールする場合は、ワークスペースごとのクライアントを使うときに作成する
+        get_slack_client()
+    # アクティブなスケジュールをインデックスに読み込む
+    await asyncio.to_thread(schedule_index.load)
+    # 停止中に取りこぼしたリアクションがあり得るので、アクティブなスケジュールをすべて同期の対象にする
+    for message_ts, channel in schedule_index.active_channels().items():
+        reaction_reconciler.mark_dirty(message_ts, channel)
+    # 変更のあったスケジュールのリアクションを定期的に取り直す
+    scheduler.add_job(reaction_reconciler.run_pending, trigger='interval', seconds=REACTION_RECONCILE_INTERVAL,
+                      id='reaction_reconcile', replace_existing=True, max_instances=1)
+    # チャンネルごとの集計値の増分を定期的にまとめてDBに加算する
+    scheduler.add_job(rollups.flush, trigger='interval', seconds=ROLLUP_FLUSH_INTERVAL,
+                      id='rollup_flush', replace_existing=True, max_instances=1)
+    if retention_policy.enabled:
+        # 予定日時を過ぎた決定済みのスケジュールと、放置されたスケジュールを定期的にアーカイブに移す（起動直後にも1回実行）
+        scheduler.add_job(retention_policy.run, trigger='interval', hours=RETENTION_INTERVAL_HOURS,
+                          id='schedule_retention', replace_existing=True, max_instances=1,
+                          next_run_time=datetime.now(JST))
+    # 再起動で失われたリマインドをDBから登録し直す（スケジューラの開始前にまとめて登録する）
+    await asyncio.to_thread(rehydrate_reminders)
+    if REMINDER_MODE == "sweep":
+        # 送信予定のリマインドを定期的にまとめて確保して送信する（起動直後にも1回実行）
+        scheduler.add_job(sweep_reminders, trigger='interval', seconds=REMINDER_SWEEP_INTERVAL,
+                          id='reminder_sweep', replace_existing=True, max_instances=1,
+                          next_run_time=datetime.now(JST))
+    if auto_close_rules.enabled:
+        # 締め切りと、他のワーカーが受けたリアクションを含めた参加者数を DB で定期的に確認する
+        # （このワーカーが受けたリアクションについてはその都度評価する）
+        scheduler.add_job(check_auto_close_all, trigger='interval', seconds=AUTO_CLOSE_CHECK_INTERVAL,
+                          id='auto_close', replace_existing=True, max_instances=1)
     # アプリケーション起動時にスケジューラを開始
+    if event_deduplicator.shared:
+        # 期限切れのイベント受信記録を定期的に削除する
+        scheduler.add_job(event_deduplicator.purge_expired, trigger='interval', hours=1,
+                          id='purge_event_receipts', replace_existing=True)
+    instrument_scheduler(scheduler)
     scheduler.start()
     logger.info("スケジューラを開始しました。")
+    # Slackイベントを処理するワーカーを起動
+    await event_pool.start()
     yield
     # アプリケーション終了時にスケジューラを停止
     logger.info("アプリケーションのシャットダウンを開始します...")
+    # 受付済みのイベントを処理し終えてからワーカーを停止
+    await event_pool.drain(timeout=EVENT_DRAIN_TIMEOUT)
+    # ためている参加者情報をDBに書き込む
+    await asyncio.to_thread(participant_buffer.flush_all)
     scheduler.shutdown()
+    # スケジューラの停止後に、ためている集計値の増分をDBに書き込む
+    await asyncio.to_thread(rollups.flush)
     logger.info("スケジューラを停止しました。")
+    # 接続プールを閉じる
+    close_clients()
+    logger.info(f"スケジュールインデックスの統計: {schedule_index.stats()}")
+    logger.info(f"イベント重複判定の統計: {event_deduplicator.stats()}")
+    logger.info(f"リアクション同期の統計: {reaction_reconciler.stats()}")
 
 app = FastAPI(lifespan=lifespan)
 
 # Slack Bot 用の処理は slack_events.py に切り出し
-from .slack_events import router as slack_router
+from .slack_events import (
+    router as slack_router, event_pool, participant_buffer, reaction_reconciler, rehydrate_reminders, sweep_reminders,
+    auto_close_rules, check_auto_close_all, team_limiter, REMINDER_MODE, REMINDER_SWEEP_INTERVAL,
+)
 app.include_router(slack_router)
 
+# 複数のワークスペースへのインストール（SLACK_CLIENT_ID / SLACK_CLIENT_SECRET を設定した場合のみ有効）
+from .oauth import router as oauth_router
+app.include_router(oauth_router)
+
+# スケジュールのエクスポートと集計API（EXPORT_API_TOKEN を設定した場合のみ有効）
+from .export import router as export_router
+app.include_router(export_router)
+
+# 内部状態のゲージ（/metrics の出力時に値を取得する）
+Gauge('slack_event_queue_depth', 'イベントキューに積まれている件数', callback=event_pool.qsize)
+Gauge('participant_buffer_pending', 'DBへの書き込み待ちの参加者差分の件数', callback=participant_buffer.pending_count)
+Gauge('rollup_buffer_pending', 'DBへの書き込み待ちの集計値の件数', callback=rollups.pending_count)
+Gauge('schedule_index_stats', 'スケジュールインデックスの件数とヒット・ミス・退避の累計', ('kind',),
+      callback=lambda: {(k,): v for k, v in schedule_index.stats().items()})
+Gauge('event_dedup_stats', 'イベント重複判定の件数と破棄した重複の累計', ('kind',),
+      callback=lambda: {(k,): v for k, v in event_deduplicator.stats().items()})
+Gauge('reaction_reconcile_stats', 'リアクション同期の待ち件数と同期・変更・失敗・処理しなかったイベントの累計', ('kind',),
+      callback=lambda: {(k,): v for k, v in reaction_reconciler.stats().items()})
+Gauge('schedule_retention_stats', 'アーカイブの実行回数・失敗回数と、理由ごとに移したスケジュール数・削減したバイト数の累計', ('kind',),
+      callback=lambda: {(k,): v for k, v in retention_policy.stats().items()})
+Gauge('slack_client_pool_stats', 'ワークスペースごとの Slack クライアントの件数とヒット・ミス・退避の累計', ('kind',),
+      callback=lambda: {(k,): v for k, v in slack_client_pool.stats().items()})
+Gauge('event_team_inflight_stats', '処理中のイベントがあるワークスペース数・イベント数と、上限で受け付けなかったイベントの累計', ('kind',),
+      callback=lambda: {(k,): v for k, v in team_limiter.stats().items()})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus のテキスト形式でメトリクスを返す
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 logger.info("FastAPIアプリケーションの設定が完了しました。")
\ No newline at end of file
@@ -0,0 +1,265 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+from slack_sdk.web import WebClient
+
+logger = logging.getLogger(__name__)
+
+# レイテンシ用のヒストグラムの既定のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    値を set() するか、出力時に callback() を呼んで値を取得するゲージ
+
+    callback はラベルなしなら数値を、ラベル付きなら {ラベル値のタプル: 数値} を返す。
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> list:
+        lines = super().render()
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logger.error(f"メトリクスの取得に失敗しました: {self.name}, Error: {e}")
+                return lines
+            items = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [バケットごとの件数..., +Inf の件数], 合計
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = super().render()
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    """
+    登録済みのすべてのメトリクスを Prometheus のテキスト形式で出力する
+    """
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- アプリ全体のメトリクス ---------------------------------------------------
+
+SLACK_EVENT_ACK_SECONDS = Histogram(
+    'slack_event_ack_seconds', '/slack/events が応答するまでの時間', ('event_type',))
+SLACK_EVENT_PROCESSING_SECONDS = Histogram(
+    'slack_event_processing_seconds', 'Slackイベント1件の処理時間', ('event_type',))
+SLACK_EVENTS_TOTAL = Counter(
+    'slack_events_total', '受信したSlackイベント数', ('event_type', 'outcome'))
+
+STORAGE_CALL_SECONDS = Histogram(
+    'storage_call_seconds', 'ストア（Supabase / SQLite）呼び出しの所要時間', ('backend', 'method'))
+STORAGE_CALL_ERRORS = Counter(
+    'storage_call_errors_total', 'ストア呼び出しのエラー数', ('backend', 'method'))
+
+SLACK_API_CALL_SECONDS = Histogram(
+    'slack_api_call_seconds', 'Slack Web API 呼び出しの所要時間', ('method',))
+SLACK_API_CALL_ERRORS = Counter(
+    'slack_api_call_errors_total', 'Slack Web API 呼び出しのエラー数', ('method', 'error'))
+
+DATETIME_PARSE_TOTAL = Counter(
+    'datetime_parse_total', '候補日行の日時解析の結果', ('result',))
+
+SCHEDULER_JOB_LAG_SECONDS = Histogram(
+    'scheduler_job_lag_seconds', '予定時刻からジョブが実行に回されるまでの遅れ', ('job',))
+SCHEDULER_JOBS_TOTAL = Counter(
+    'scheduler_jobs_total', 'スケジューラのジョブ実行結果', ('job', 'outcome'))
+SCHEDULER_PENDING_JOBS = Gauge(
+    'scheduler_pending_jobs', 'スケジューラに登録済みのジョブ数')
+
+REMINDER_FANOUT_SECONDS = Histogram(
+    'reminder_fanout_seconds', 'send_reminder のDM一斉送信にかかった時間')
+REMINDER_DELIVERIES_TOTAL = Counter(
+    'reminder_deliveries_total', 'リマインドDMの配信結果', ('status',))
+
+
+# --- 計装 ---------------------------------------------------------------------
+
+class InstrumentedStore:
+    """
+    ストアの各メソッドの所要時間とエラー数を記録するラッパー
+    """
+
+    def __init__(self, store, backend: str):
+        self._store = store
+        self._backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                STORAGE_CALL_ERRORS.inc(backend=self._backend, method=name)
+                raise
+            finally:
+                STORAGE_CALL_SECONDS.observe(time.perf_counter() - start, backend=self._backend, method=name)
+        # 次回以降は __getattr__ を通らないようにキャッシュする
+        setattr(self, name, call)
+        return call
+
+
+class InstrumentedWebClient(WebClient):
+    """
+    すべての Web API 呼び出し（api_call を経由する）の所要時間とエラー数を記録する WebClient
+    """
+
+    def api_call(self, api_method: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().api_call(api_method, *args, **kwargs)
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            error = response.get('error', 'unknown') if response is not None else type(e).__name__
+            SLACK_API_CALL_ERRORS.inc(method=api_method, error=error)
+            raise
+        finally:
+            SLACK_API_CALL_SECONDS.observe(time.perf_counter() - start, method=api_method)
+
+
+def instrument_scheduler(scheduler):
+    """
+    APScheduler のイベントからジョブの遅れと実行結果を記録する
+    """
+    from apscheduler.events import (
+        EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED,
+    )
+
+    def job_name(job_id: str) -> str:
+        # reminder_{ts}_{emoji} のような ID ごとにラベルが増えないよう、先頭の種別だけを使う
+        return job_id.split('_', 1)[0] if job_id else ''
+
+    def listener(event):
+        name = job_name(event.job_id)
+        if event.code == EVENT_JOB_SUBMITTED:
+            now = time.time()
+            for run_time in event.scheduled_run_times:
+                SCHEDULER_JOB_LAG_SECONDS.observe(max(0.0, now - run_time.timestamp()), job=name)
+        elif event.code == EVENT_JOB_EXECUTED:
+            SCHEDULER_JOBS_TOTAL.inc(job=name, outcome='executed')
+        elif event.code == EVENT_JOB_ERROR:
+            SCHEDULER_JOBS_TOTAL.inc(job=name, outcome='error')
+        elif event.code == EVENT_JOB_MISSED:
+            SCHEDULER_JOBS_TOTAL.inc(job=name, outcome='missed')
+
+    scheduler.add_listener(listener, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+    SCHEDULER_PENDING_JOBS.callback = lambda: len(scheduler.get_jobs())
@@ -0,0 +1,109 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse, RedirectResponse
+import os, hmac, time, hashlib, secrets, logging, asyncio
+from urllib.parse import urlencode
+from slack_sdk.errors import SlackApiError
+from .clients import SLACK_CLIENT_ID, new_slack_client, slack_client_pool
+from .storage import get_store
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# OAuth でワークスペースにインストールする場合の設定（SLACK_CLIENT_ID は clients.py で読み込む）
+SLACK_CLIENT_SECRET = os.getenv("SLACK_CLIENT_SECRET")
+SLACK_OAUTH_REDIRECT_URI = os.getenv("SLACK_OAUTH_REDIRECT_URI")
+SLACK_BOT_SCOPES = os.getenv("SLACK_BOT_SCOPES", "app_mentions:read,chat:write,reactions:read")
+# インストール開始から完了までに許す秒数（state の有効期限）
+SLACK_OAUTH_STATE_TTL = int(os.getenv("SLACK_OAUTH_STATE_TTL", "600"))
+# state の乱数を保存し、インストールを始めたブラウザからのコールバックか確認する Cookie
+SLACK_OAUTH_STATE_COOKIE = "slack_oauth_state"
+
+
+def _sign_state(nonce: str, issued_at: int) -> str:
+    message = f"{nonce}.{issued_at}".encode()
+    return hmac.new(SLACK_CLIENT_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def issue_state() -> tuple:
+    """
+    サーバー側に保存せずに検証できる state（乱数・発行時刻・署名）と、ブラウザの Cookie に保存する乱数を発行する
+    """
+    nonce = secrets.token_urlsafe(16)
+    issued_at = int(time.time())
+    return f"{nonce}.{issued_at}.{_sign_state(nonce, issued_at)}", nonce
+
+
+def verify_state(state: str, cookie_nonce: str) -> bool:
+    """
+    state の署名と有効期限に加えて、インストールを始めたブラウザの Cookie の乱数と一致するかを確認する
+
+    他人が発行させた state を自分のコールバックに渡されても（ログイン CSRF）、Cookie が一致しないため受け付けない。
+    """
+    try:
+        nonce, issued_at, signature = state.split(".")
+        issued_at = int(issued_at)
+    except (AttributeError, ValueError):
+        return False
+    if time.time() - issued_at > SLACK_OAUTH_STATE_TTL:
+        return False
+    if not cookie_nonce or not hmac.compare_digest(nonce.encode(), cookie_nonce.encode()):
+        return False
+    return hmac.compare_digest(signature, _sign_state(nonce, issued_at))
+
+
+@router.get("/slack/install")
+async def install(request: Request):
+    """
+    Slack の OAuth 画面にリダイレクトしてワークスペースへのインストールを始める
+    """
+    if not SLACK_CLIENT_ID or not SLACK_CLIENT_SECRET:
+        return PlainTextResponse("OAuth is not configured", status_code=404)
+    state, nonce = issue_state()
+    params = {"client_id": SLACK_CLIENT_ID, "scope": SLACK_BOT_SCOPES, "state": state}
+    if SLACK_OAUTH_REDIRECT_URI:
+        params["redirect_uri"] = SLACK_OAUTH_REDIRECT_URI
+    response = RedirectResponse(f"https://slack.com/oauth/v2/authorize?{urlencode(params)}")
+    # Slack からのリダイレクト（トップレベルの GET）でも送られるよう SameSite=Lax にする
+    secure = (SLACK_OAUTH_REDIRECT_URI or str(request.url)).startswith("https://")
+    response.set_cookie(SLACK_OAUTH_STATE_COOKIE, nonce, max_age=SLACK_OAUTH_STATE_TTL, path="/slack/oauth",
+                        httponly=True, secure=secure, samesite="lax")
+    return response
+
+
+@router.get("/slack/oauth/callback")
+async def oauth_callback(request: Request, code: str = None, state: str = None, error: str = None):
+    """
+    認可コードをボットトークンに交換し、ワークスペースのインストール情報を保存する
+    """
+    if not SLACK_CLIENT_ID or not SLACK_CLIENT_SECRET:
+        return PlainTextResponse("OAuth is not configured", status_code=404)
+    if error or not code:
+        logger.info(f"インストールがキャンセルされました: {error}")
+        return PlainTextResponse("インストールがキャンセルされました。", status_code=400)
+    if not verify_state(state, request.cookies.get(SLACK_OAUTH_STATE_COOKIE)):
+        return PlainTextResponse(
+            "インストールの有効期限が切れたか、インストールを始めたブラウザではありません。もう一度お試しください。",
+            status_code=400)
+    try:
+        response = await asyncio.to_thread(
+            new_slack_client().oauth_v2_access,
+            client_id=SLACK_CLIENT_ID, client_secret=SLACK_CLIENT_SECRET, code=code,
+            redirect_uri=SLACK_OAUTH_REDIRECT_URI,
+        )
+    except SlackApiError as e:
+        logger.error(f"ボットトークンの取得に失敗しました: {e.response.get('error')}")
+        return PlainTextResponse("インストールに失敗しました。", status_code=400)
+    team = response.get("team") or {}
+    installation = {
+        'team_id': team.get("id"),
+        'team_name': team.get("name"),
+        'bot_token': response["access_token"],
+        'bot_user_id': response.get("bot_user_id"),
+    }
+    await asyncio.to_thread(get_store().save_installation, installation)
+    # 再インストールでトークンが変わった場合に備えて、保持しているクライアントを作り直させる
+    slack_client_pool.invalidate(installation['team_id'])
+    logger.info(f"ワークスペースにインストールしました: {installation['team_name']} ({installation['team_id']})")
+    response = PlainTextResponse(f"{installation['team_name']} へのインストールが完了しました。")
+    response.delete_cookie(SLACK_OAUTH_STATE_COOKIE, path="/slack/oauth")
+    return response
@@ -0,0 +1,137 @@
+import os
+import logging
+import threading
+import zlib
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# リアクションをまとめて書き込むまでの待ち時間（秒）。0 の場合は即時に書き込む
+PARTICIPANT_FLUSH_WINDOW = float(os.getenv("PARTICIPANT_FLUSH_WINDOW", "0.2"))
+# 書き込みに失敗した差分を再試行する最大回数
+PARTICIPANT_FLUSH_MAX_ATTEMPTS = 3
+# スケジュールごとの書き込みを直列化するためのロック数
+_LOCK_STRIPES = 64
+
+
+def apply_participant_deltas(participants: dict, deltas: list) -> bool:
+    """
+    参加者マップに差分（("add" | "remove", emoji, user_id)）を到着順に適用する
+
+    変更があった場合は True を返す。
+    """
+    changed = False
+    for op, emoji, user_id in deltas:
+        if op == "add":
+            users = participants.setdefault(emoji, [])
+            if user_id not in users:
+                users.append(user_id)
+                changed = True
+                logger.info(f"参加者を追加: {user_id} -> {emoji}")
+            else:
+                logger.info(f"参加者は既に追加済みです: {user_id} -> {emoji}")
+        elif op == "remove":
+            if emoji in participants and user_id in participants[emoji]:
+                participants[emoji].remove(user_id)
+                # もしそのスタンプの参加者が誰もいなくなったら、キーごと削除する
+                if not participants[emoji]:
+                    del participants[emoji]
+                changed = True
+                logger.info(f"参加者を削除: {user_id} -> {emoji}")
+            else:
+                logger.info(f"削除対象の参加者が見つかりません: {user_id} -> {emoji}")
+    return changed
+
+
+def count_votes(participants: dict) -> dict:
+    """
+    参加者マップからスタンプごとの参加者数（vote_counts）を求める
+    """
+    return {emoji: len(users) for emoji, users in participants.items() if users}
+
+
+class ParticipantWriteBuffer:
+    """
+    リアクションの追加・削除を main_message_ts ごとに短時間ためて、1回の更新にまとめるバッファ
+
+    同じスケジュールへの書き込みはロックで直列化されるため、
+    同時に届いたリアクション同士で更新が失われることはない。
+    他のプロセスとの同時更新は、ストアの apply_participant_deltas が DB の中で1回の更新として反映する。
+    """
+
+    def __init__(self, writer: Callable[[str, list], None], window: float = PARTICIPANT_FLUSH_WINDOW):
+        # writer(message_ts, deltas) は差分をまとめてDBに反映する同期関数
+        self._writer = writer
+        self._window = window
+        self._lock = threading.Lock()
+        self._pending: dict[str, list] = {}
+        self._attempts: dict[str, int] = {}
+        self._timers: dict[str, threading.Timer] = {}
+        self._flush_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    def add(self, message_ts: str, emoji: str, user_id: str):
+        self._enqueue(message_ts, ("add", emoji, user_id))
+
+    def remove(self, message_ts: str, emoji: str, user_id: str):
+        self._enqueue(message_ts, ("remove", emoji, user_id))
+
+    def _enqueue(self, message_ts: str, delta: tuple):
+        with self._lock:
+            self._pending.setdefault(message_ts, []).append(delta)
+            if self._window > 0 and message_ts not in self._timers:
+                timer = threading.Timer(self._window, self.flush, args=[message_ts])
+                timer.daemon = True
+                self._timers[message_ts] = timer
+                timer.start()
+        if self._window <= 0:
+            self.flush(message_ts)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(len(d) for d in self._pending.values())
+
+    def flush(self, message_ts: str):
+        """
+        指定スケジュールの未書き込みの差分を1回の更新で反映する
+        """
+        stripe = zlib.crc32(message_ts.encode("utf-8")) % _LOCK_STRIPES
+        with self._flush_locks[stripe]:
+            with self._lock:
+                deltas = self._pending.pop(message_ts, [])
+                timer = self._timers.pop(message_ts, None)
+            if timer:
+                timer.cancel()
+            if not deltas:
+                return
+            try:
+                self._writer(message_ts, deltas)
+                with self._lock:
+                    self._attempts.pop(message_ts, None)
+            except Exception as e:
+                self._requeue(message_ts, deltas, e)
+
+    def _requeue(self, message_ts: str, deltas: list, error: Exception):
+        with self._lock:
+            attempts = self._attempts.get(message_ts, 0) + 1
+            if attempts >= PARTICIPANT_FLUSH_MAX_ATTEMPTS:
+                self._attempts.pop(message_ts, None)
+                logger.error(f"❌ 参加者情報の書き込みを断念しました: ts={message_ts}, 差分{len(deltas)}件, Error: {error}")
+                return
+            self._attempts[message_ts] = attempts
+            # 失敗した差分を新しい差分より前に戻し、順序を保ったまま次回に再試行する
+            self._pending[message_ts] = deltas + self._pending.get(message_ts, [])
+            if self._window > 0 and message_ts not in self._timers:
+                timer = threading.Timer(self._window, self.flush, args=[message_ts])
+                timer.daemon = True
+                self._timers[message_ts] = timer
+                timer.start()
+        logger.warning(f"参加者情報の書き込みに失敗したため再試行します: ts={message_ts}, Error: {error}")
+
+    def flush_all(self):
+        """
+        すべての未書き込みの差分を同期的に反映する（シャットダウン時に呼び出す）
+        """
+        with self._lock:
+            timestamps = list(self._pending)
+        for message_ts in timestamps:
+            self.flush(message_ts)
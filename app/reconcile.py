@@ -0,0 +1,145 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable
+from slack_sdk.errors import SlackApiError
+from .fanout import get_rate_limiter, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# 変更のあったスケジュールのリアクションを reactions.get で取り直す間隔（秒）と、1回に処理する件数
+REACTION_RECONCILE_INTERVAL = float(os.getenv("REACTION_RECONCILE_INTERVAL", "300"))
+REACTION_RECONCILE_BATCH_SIZE = int(os.getenv("REACTION_RECONCILE_BATCH_SIZE", "100"))
+# イベントキューにこの件数以上たまっている間は、リアクションのイベントを処理せずに後の取り直しに任せる（0 で無効）
+REACTION_SHED_QUEUE_DEPTH = int(os.getenv("REACTION_SHED_QUEUE_DEPTH", "0"))
+# reactions.get がレート制限された場合に再試行する回数
+REACTION_FETCH_MAX_RETRIES = int(os.getenv("REACTION_FETCH_MAX_RETRIES", "3"))
+# 決定前の同期のために残しておく reactions.get のトークン数（定期的な取り直しはこれを超える分だけを使う）
+REACTION_PRIORITY_RESERVE = float(os.getenv("REACTION_PRIORITY_RESERVE", "2"))
+# 決定前の同期で reactions.get のトークンを待つ最大秒数（取得できなければ DB の参加者情報で決定する）
+REACTION_DECISION_SYNC_TIMEOUT = float(os.getenv("REACTION_DECISION_SYNC_TIMEOUT", "1.0"))
+
+
+class ReactionFetchDeferred(RuntimeError):
+    """
+    決定前の同期で、待てる時間内に reactions.get を呼び出せなかった
+    """
+
+
+def fetch_reactions(client, channel: str, message_ts: str, priority: bool = False) -> dict:
+    """
+    reactions.get でメッセージのリアクションを1回で取得し、{リアクション名: [user_id, ...]} を返す
+
+    priority の場合（決定前の同期）は残しておいたトークンを使い、REACTION_DECISION_SYNC_TIMEOUT 秒以内に
+    呼び出せなければ、レート制限の解除を待たずに ReactionFetchDeferred を送出する。
+    """
+    bucket = get_rate_limiter("reactions.get")
+    for _ in range(REACTION_FETCH_MAX_RETRIES + 1):
+        if priority:
+            if not bucket.acquire(timeout=REACTION_DECISION_SYNC_TIMEOUT):
+                raise ReactionFetchDeferred(f"reactions.get のレート制限のため同期を見送りました: {message_ts}")
+        else:
+            bucket.acquire(reserve=REACTION_PRIORITY_RESERVE)
+        try:
+            response = client.reactions_get(channel=channel, timestamp=message_ts, full=True)
+        except SlackApiError as e:
+            wait = retry_after_seconds(e)
+            if wait is None:
+                raise
+            if priority:
+                bucket.pause(wait)
+                raise ReactionFetchDeferred(f"reactions.get がレート制限されたため同期を見送りました: {message_ts}")
+            logger.warning(f"レート制限のため {wait} 秒待って再取得します: {message_ts}")
+            bucket.pause(wait)
+            continue
+        reactions = (response.get("message") or {}).get("reactions") or []
+        return {r["name"]: list(r.get("users") or []) for r in reactions}
+    raise RuntimeError(f"レート制限によりリアクションを取得できませんでした: {message_ts}")
+
+
+class ReactionReconciler:
+    """
+    リアクションのスナップショットから参加者を書き直す対象（前回の同期以降に変更があった ts）を管理する
+
+    sync(message_ts, channel, priority) が実際の取得と書き込みを行い、参加者が変わった場合に True を返す。
+    """
+
+    def __init__(self, sync: Callable[[str, str, bool], bool], batch_size: int = REACTION_RECONCILE_BATCH_SIZE):
+        self._sync = sync
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._dirty: OrderedDict[str, str] = OrderedDict()
+        self._counters = {"synced": 0, "changed": 0, "failed": 0, "shed": 0, "deferred": 0}
+
+    def mark_dirty(self, message_ts: str, channel: str):
+        if not message_ts or not channel:
+            return
+        with self._lock:
+            self._dirty[message_ts] = channel
+
+    def shed(self, message_ts: str, channel: str):
+        """
+        処理しなかったリアクションのイベントを記録し、次の取り直しの対象にする
+        """
+        with self._lock:
+            self._counters["shed"] += 1
+        self.mark_dirty(message_ts, channel)
+
+    def reconcile(self, message_ts: str, channel: str, priority: bool = False) -> bool:
+        with self._lock:
+            # 取得中に届いたイベントで再び対象になるよう、先に外しておく
+            self._dirty.pop(message_ts, None)
+        try:
+            changed = self._sync(message_ts, channel, priority)
+        except ReactionFetchDeferred as e:
+            logger.info(str(e))
+            with self._lock:
+                self._counters["deferred"] += 1
+            self.mark_dirty(message_ts, channel)
+            return False
+        except Exception as e:
+            logger.error(f"リアクションの同期に失敗しました: {message_ts}, Error: {e}")
+            with self._lock:
+                self._counters["failed"] += 1
+            self.mark_dirty(message_ts, channel)
+            return False
+        with self._lock:
+            self._counters["synced"] += 1
+            if changed:
+                self._counters["changed"] += 1
+        return changed
+
+    def reconcile_before_decision(self, message_ts: str, channel: str) -> bool:
+        """
+        決定の前に、前回の同期以降にリアクションのイベントがあったスケジュールだけを優先して同期する
+
+        イベントがなければ DB の参加者情報は最新なので取得しない。トークンを待てる時間内に取得できなければ、
+        同期は定期的な取り直しに任せて DB の参加者情報で決定する（イベントを処理するワーカーを長く止めない）。
+        """
+        with self._lock:
+            if message_ts not in self._dirty:
+                return False
+        return self.reconcile(message_ts, channel, priority=True)
+
+    def run_pending(self, batch_size: int = None) -> int:
+        """
+        変更のあったスケジュールを古い順に batch_size 件まで同期する（スケジューラから定期実行）
+        """
+        batch_size = batch_size or self._batch_size
+        with self._lock:
+            batch = []
+            while self._dirty and len(batch) < batch_size:
+                batch.append(self._dirty.popitem(last=False))
+        changed = sum(1 for message_ts, channel in batch if self.reconcile(message_ts, channel))
+        if batch:
+            logger.info(f"リアクションを同期しました: {len(batch)}件（変更 {changed}件, 残り {self.pending_count()}件）")
+        return changed
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "pending": len(self._dirty)}
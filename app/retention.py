@@ -0,0 +1,89 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from .storage import get_store, ARCHIVE_DECIDED, ARCHIVE_ABANDONED
+from .schedule_index import schedule_index
+
+logger = logging.getLogger(__name__)
+
+# 決定した日時からこの日数が過ぎたスケジュールをアーカイブに移す（0 で無効）
+RETENTION_DECIDED_DAYS = float(os.getenv("RETENTION_DECIDED_DAYS", "0"))
+# 決定されないまま投稿からこの日数が過ぎたスケジュールをアーカイブに移す（0 で無効）
+RETENTION_ABANDONED_DAYS = float(os.getenv("RETENTION_ABANDONED_DAYS", "0"))
+# アーカイブを行う間隔（時間）
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+# 1回のトランザクションで移す件数と、1回の実行で処理するバッチ数の上限（残りは次回に回す）
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "200"))
+RETENTION_MAX_BATCHES = int(os.getenv("RETENTION_MAX_BATCHES", "50"))
+
+
+class RetentionPolicy:
+    """
+    予定日時を過ぎた決定済みのスケジュールと、放置されたスケジュールを schedules_archive に移す保持ポリシー
+
+    バッチごとに移した行をスケジュールインデックスからも取り除くため、
+    リアクションやリマインドが参照するアクティブなスケジュールは最近のものだけになる。
+    """
+
+    def __init__(self, decided_days: float = RETENTION_DECIDED_DAYS,
+                 abandoned_days: float = RETENTION_ABANDONED_DAYS,
+                 batch_size: int = RETENTION_BATCH_SIZE, max_batches: int = RETENTION_MAX_BATCHES):
+        self.decided_days = decided_days
+        self.abandoned_days = abandoned_days
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._lock = threading.Lock()
+        self._counters = {"runs": 0, ARCHIVE_DECIDED: 0, ARCHIVE_ABANDONED: 0, "bytes": 0, "archived_bytes": 0,
+                          "failures": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.decided_days > 0 or self.abandoned_days > 0
+
+    def run(self, now: datetime = None) -> dict:
+        """
+        対象のスケジュールをバッチごとにアーカイブに移し、移した件数と大きさ（バイト）を返す
+        """
+        now = now or datetime.now(timezone.utc)
+        decided_before = now - timedelta(days=self.decided_days) if self.decided_days > 0 else None
+        abandoned_before = now - timedelta(days=self.abandoned_days) if self.abandoned_days > 0 else None
+        report = {ARCHIVE_DECIDED: 0, ARCHIVE_ABANDONED: 0, "bytes": 0, "archived_bytes": 0, "batches": 0}
+        if decided_before is None and abandoned_before is None:
+            return report
+        try:
+            for _ in range(self.max_batches):
+                moved = get_store().archive_schedules(decided_before, abandoned_before, self.batch_size)
+                if not moved:
+                    break
+                report["batches"] += 1
+                for row in moved:
+                    schedule_index.remove(row['main_message_ts'])
+                    report[row['reason']] += 1
+                    report["bytes"] += row['bytes']
+                    report["archived_bytes"] += row['archived_bytes']
+                if len(moved) < self.batch_size:
+                    break
+        except Exception as e:
+            logger.error(f"❌ スケジュールのアーカイブに失敗しました: Error: {e}")
+            with self._lock:
+                self._counters["failures"] += 1
+        with self._lock:
+            self._counters["runs"] += 1
+            for key in (ARCHIVE_DECIDED, ARCHIVE_ABANDONED, "bytes", "archived_bytes"):
+                self._counters[key] += report[key]
+        moved_count = report[ARCHIVE_DECIDED] + report[ARCHIVE_ABANDONED]
+        if moved_count:
+            logger.info(
+                f"スケジュールをアーカイブに移しました: 決定済み{report[ARCHIVE_DECIDED]}件, "
+                f"放置{report[ARCHIVE_ABANDONED]}件, schedules から {report['bytes']} バイト削減, "
+                f"アーカイブ {report['archived_bytes']} バイト（{report['batches']}バッチ）")
+        return report
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+# アプリ全体で共有する保持ポリシー（定期実行は main.py で登録する）
+retention_policy = RetentionPolicy()
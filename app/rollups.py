@@ -0,0 +1,128 @@
+import os
+import logging
+import threading
+from typing import Optional
+from .clients import current_team_id
+from .fanout import DELIVERY_SENT, DELIVERY_FAILED
+
+logger = logging.getLogger(__name__)
+
+# 集計値の増分をためてDBに書き込む間隔（秒）
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "30"))
+
+# 集計する値（metric）。dimension はスタンプや送信結果など、値を分ける軸（不要なら空文字）
+POSTS = "posts"                         # 候補日投稿の数
+RESPONDED_POSTS = "responded_posts"     # 1人以上が参加のスタンプを付けた候補日投稿の数
+VOTES = "votes"                         # スタンプ（dimension）ごとの参加者数
+DECISIONS = "decisions"                 # 決定された候補日投稿の数
+DECISION_SECONDS = "decision_seconds"   # 候補日投稿から決定までの秒数の合計
+DECIDED_OPTIONS = "decided_options"     # 決定されたスタンプ（dimension）ごとの数
+DELIVERIES = "deliveries"               # 送信結果（dimension）ごとのリマインドDMの数（pending は再送の前の一時的な失敗）
+
+
+class RollupBuffer:
+    """
+    チャンネルごとの集計値の増分をメモリにためて、定期的にまとめてDBに加算するバッファ
+
+    リアクションや決定のたびに書き込まず、同じ集計値への増分は1つにまとめてから
+    1回の加算で反映する。集計APIはDBの値にまだ書き込んでいない増分を足して返す。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple, float] = {}
+
+    def add(self, channel_id: Optional[str], metric: str, dimension: str = "", value: float = 1,
+            team_id: Optional[str] = None):
+        if not value:
+            return
+        key = (team_id or current_team_id() or "", channel_id or "", metric, dimension or "")
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + value
+
+    def record_tally_change(self, channel_id: Optional[str], before: dict, after: dict,
+                            team_id: Optional[str] = None):
+        """
+        スケジュール1件のスタンプごとの参加者数の変化を集計値に反映する
+        """
+        for emoji in before.keys() | after.keys():
+            self.add(channel_id, VOTES, emoji, after.get(emoji, 0) - before.get(emoji, 0), team_id=team_id)
+        responded, now_responded = sum(before.values()) > 0, sum(after.values()) > 0
+        if responded != now_responded:
+            self.add(channel_id, RESPONDED_POSTS, value=1 if now_responded else -1, team_id=team_id)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def pending(self) -> list:
+        """
+        まだDBに書き込んでいない増分を (team_id, channel_id, metric, dimension, value) の一覧で返す
+        """
+        with self._lock:
+            return [(*key, value) for key, value in self._pending.items()]
+
+    def flush(self) -> int:
+        """
+        ためている増分をDBに加算し、書き込んだ件数を返す（失敗した増分は次回に持ち越す）
+        """
+        from .storage import get_store
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        rows = [(*key, value) for key, value in pending.items() if value]
+        if not rows:
+            return 0
+        try:
+            get_store().increment_rollups(rows)
+        except Exception as e:
+            logger.error(f"❌ 集計値の書き込みに失敗しました（次回に再試行します）: {len(rows)}件, Error: {e}")
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+            return 0
+        return len(rows)
+
+
+def summarize(rows: list) -> dict:
+    """
+    集計値の行からチャンネルごとの統計（回答率・スタンプごとの参加者数・決定までの時間・リマインドの送信結果）を求める
+    """
+    channels: dict = {}
+    for row in rows:
+        key = (row['team_id'], row['channel_id'])
+        values = channels.setdefault(key, {})
+        bucket = (row['metric'], row['dimension'])
+        values[bucket] = values.get(bucket, 0) + row['value']
+
+    stats = []
+    for (team_id, channel_id), values in sorted(channels.items()):
+        def total(metric: str) -> float:
+            return sum(v for (m, _), v in values.items() if m == metric)
+
+        def by_dimension(metric: str) -> dict:
+            return {d: int(v) for (m, d), v in sorted(values.items()) if m == metric and v}
+
+        posts, decisions = int(total(POSTS)), int(total(DECISIONS))
+        deliveries = by_dimension(DELIVERIES)
+        # 再送で結果が変わる pending を除き、送信を終えた宛先のうち送信できた割合
+        delivered = deliveries.get(DELIVERY_SENT, 0) + deliveries.get(DELIVERY_FAILED, 0)
+        stats.append({
+            'team_id': team_id or None,
+            'channel_id': channel_id,
+            'posts': posts,
+            'responded_posts': int(total(RESPONDED_POSTS)),
+            'response_rate': round(total(RESPONDED_POSTS) / posts, 4) if posts else None,
+            'votes': by_dimension(VOTES),
+            'decisions': decisions,
+            'decision_rate': round(decisions / posts, 4) if posts else None,
+            'avg_decision_seconds': round(total(DECISION_SECONDS) / decisions, 1) if decisions else None,
+            'decided_options': by_dimension(DECIDED_OPTIONS),
+            'deliveries': deliveries,
+            'delivery_success_rate': round(deliveries.get(DELIVERY_SENT, 0) / delivered, 4) if delivered else None,
+        })
+    return {'channels': stats}
+
+
+# アプリ全体で共有する集計値のバッファ（定期的な書き込みとシャットダウン時の flush は main.py で行う）
+rollups = RollupBuffer()
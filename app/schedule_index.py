@@ -0,0 +1,224 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from .storage import get_store
+from .clients import current_team_id
+
+logger = logging.getLogger(__name__)
+
+# 候補日投稿ではないと分かっている ts をキャッシュする期間（秒）と最大件数
+SCHEDULE_NEGATIVE_TTL = float(os.getenv("SCHEDULE_NEGATIVE_TTL", "600"))
+SCHEDULE_NEGATIVE_MAXSIZE = int(os.getenv("SCHEDULE_NEGATIVE_MAXSIZE", "10000"))
+# 投稿からこの秒数が経っていない ts はネガティブキャッシュに記録しない
+# （別のワーカーがまだ候補日投稿を保存していない間に届いたリアクションで、以降のリアクションを捨てないため）
+SCHEDULE_NEGATIVE_MIN_AGE = float(os.getenv("SCHEDULE_NEGATIVE_MIN_AGE", "300"))
+# 起動後に DB から読み込んだ（リマインド送信済みなどの）スケジュールを保持する最大件数
+SCHEDULE_LOADED_MAXSIZE = int(os.getenv("SCHEDULE_LOADED_MAXSIZE", "10000"))
+# 起動時の一括読み込みで1回に取得する件数
+SCHEDULE_INDEX_PAGE_SIZE = int(os.getenv("SCHEDULE_INDEX_PAGE_SIZE", "1000"))
+
+
+class ScheduleIndex:
+    """
+    アクティブな候補日投稿（main_message_ts）と options を保持するプロセス内インデックス
+
+    候補日投稿ではないメッセージへのリアクションを DB に問い合わせずに捨てられるよう、
+    「スケジュールではない」と分かった ts は TTL 付き LRU のネガティブキャッシュに記録する。
+    ネガティブキャッシュはプロセスごとに持つため、他のワーカーが保存中かもしれない最近の ts は記録しない。
+    起動時の読み込みと新しい投稿で登録したスケジュールはリマインドを送信するまで保持し、
+    それ以外に DB から読み込んだスケジュールは件数を上限とした LRU で保持する。
+    スタンプごとの参加者数（集計）もリアクションの差分で更新して保持し、DB を参照せずに読めるようにする。
+    ワークスペース（team_id）を記録したスケジュールは、処理中のワークスペースが異なる場合は存在しないものとして扱う。
+    """
+
+    def __init__(self, negative_ttl: float = SCHEDULE_NEGATIVE_TTL,
+                 negative_maxsize: int = SCHEDULE_NEGATIVE_MAXSIZE,
+                 loaded_maxsize: int = SCHEDULE_LOADED_MAXSIZE,
+                 negative_min_age: float = SCHEDULE_NEGATIVE_MIN_AGE):
+        self._lock = threading.Lock()
+        self._options: dict[str, dict] = {}
+        self._selected: dict[str, str] = {}
+        self._channels: dict[str, str] = {}
+        self._teams: dict[str, str] = {}
+        self._tallies: dict[str, dict[str, int]] = {}
+        self._negative: OrderedDict[str, float] = OrderedDict()
+        self._negative_ttl = negative_ttl
+        self._negative_maxsize = negative_maxsize
+        self._negative_min_age = negative_min_age
+        self._loaded: OrderedDict[str, None] = OrderedDict()
+        self._loaded_maxsize = loaded_maxsize
+        self._counters = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "loaded_evictions": 0}
+
+    def load(self, page_size: int = SCHEDULE_INDEX_PAGE_SIZE) -> int:
+        """
+        リマインド未送信のスケジュールを DB からページ単位で読み込む
+        """
+        loaded = 0
+        for rows in get_store().iter_active_schedules(page_size):
+            with self._lock:
+                for row in rows:
+                    self._options[row['main_message_ts']] = row.get('options') or {}
+                    if row.get('selected_emoji'):
+                        self._selected[row['main_message_ts']] = row['selected_emoji']
+                    if row.get('channel_id'):
+                        self._channels[row['main_message_ts']] = row['channel_id']
+                    if row.get('team_id'):
+                        self._teams[row['main_message_ts']] = row['team_id']
+                    self._tallies[row['main_message_ts']] = dict(row.get('vote_counts') or {})
+            loaded += len(rows)
+        logger.info(f"スケジュールインデックスを読み込みました: {loaded}件")
+        return loaded
+
+    def get_options(self, message_ts: str) -> Optional[dict]:
+        """
+        候補日投稿であれば options を、そうでなければ None を返す
+
+        インデックスにもネガティブキャッシュにもない場合のみ DB を参照する。
+        """
+        now = time.monotonic()
+        team_id = current_team_id()
+        with self._lock:
+            options = self._options.get(message_ts)
+            if options is not None:
+                self._counters["hits"] += 1
+                if message_ts in self._loaded:
+                    self._loaded.move_to_end(message_ts)
+                if team_id and self._teams.get(message_ts, team_id) != team_id:
+                    return None
+                return options
+            expires_at = self._negative.get(message_ts)
+            if expires_at is not None:
+                if expires_at > now:
+                    self._negative.move_to_end(message_ts)
+                    self._counters["negative_hits"] += 1
+                    return None
+                del self._negative[message_ts]
+            self._counters["misses"] += 1
+
+        row = get_store().get_schedule_summary(message_ts)
+        if row is None:
+            if not self._is_recent(message_ts):
+                self.add_negative(message_ts)
+            return None
+        self.put(message_ts, row.get('options') or {}, row.get('selected_emoji'), row.get('channel_id'),
+                 row.get('vote_counts'), row.get('team_id'), evictable=True)
+        if team_id and row.get('team_id') not in (None, team_id):
+            return None
+        return row.get('options') or {}
+
+    def put(self, message_ts: str, options: dict, selected_emoji: Optional[str] = None,
+            channel_id: Optional[str] = None, vote_counts: Optional[dict] = None, team_id: Optional[str] = None,
+            evictable: bool = False):
+        """
+        スケジュールを登録する。evictable であれば LRU の上限を超えたときに古いものから取り除く
+        """
+        with self._lock:
+            self._options[message_ts] = options
+            self._negative.pop(message_ts, None)
+            if evictable:
+                self._loaded[message_ts] = None
+                self._loaded.move_to_end(message_ts)
+                while len(self._loaded) > self._loaded_maxsize:
+                    self._remove_locked(self._loaded.popitem(last=False)[0])
+                    self._counters["loaded_evictions"] += 1
+            else:
+                self._loaded.pop(message_ts, None)
+            if selected_emoji:
+                self._selected[message_ts] = selected_emoji
+            if channel_id:
+                self._channels[message_ts] = channel_id
+            if team_id:
+                self._teams[message_ts] = team_id
+            self._tallies[message_ts] = dict(vote_counts or {})
+
+    def mark_decided(self, message_ts: str, selected_emoji: str):
+        with self._lock:
+            self._selected[message_ts] = selected_emoji
+
+    def selected_emoji(self, message_ts: str) -> Optional[str]:
+        with self._lock:
+            return self._selected.get(message_ts)
+
+    def channel(self, message_ts: str) -> Optional[str]:
+        with self._lock:
+            return self._channels.get(message_ts)
+
+    def team(self, message_ts: str) -> Optional[str]:
+        with self._lock:
+            return self._teams.get(message_ts)
+
+    def add_vote(self, message_ts: str, emoji: str, delta: int) -> int:
+        """
+        スタンプの参加者数に差分（+1 / -1）を加え、更新後の人数を返す
+        """
+        with self._lock:
+            tally = self._tallies.get(message_ts)
+            if tally is None:
+                return 0
+            count = max(0, tally.get(emoji, 0) + delta)
+            if count:
+                tally[emoji] = count
+            else:
+                tally.pop(emoji, None)
+            return count
+
+    def set_tally(self, message_ts: str, vote_counts: dict):
+        """
+        リアクションのスナップショットなどから求めた参加者数で集計を置き換える
+        """
+        with self._lock:
+            if message_ts in self._options:
+                self._tallies[message_ts] = {emoji: n for emoji, n in vote_counts.items() if n}
+
+    def tally(self, message_ts: str) -> dict:
+        """
+        スタンプごとの参加者数（{":one:": 3, ...}）を返す（DB は参照しない）
+        """
+        with self._lock:
+            return dict(self._tallies.get(message_ts) or {})
+
+    def remove(self, message_ts: str):
+        with self._lock:
+            self._remove_locked(message_ts)
+            self._loaded.pop(message_ts, None)
+
+    def _remove_locked(self, message_ts: str):
+        self._options.pop(message_ts, None)
+        self._selected.pop(message_ts, None)
+        self._channels.pop(message_ts, None)
+        self._teams.pop(message_ts, None)
+        self._tallies.pop(message_ts, None)
+
+    def _is_recent(self, message_ts: str) -> bool:
+        try:
+            return time.time() - float(message_ts) < self._negative_min_age
+        except ValueError:
+            return False
+
+    def add_negative(self, message_ts: str):
+        with self._lock:
+            self._negative[message_ts] = time.monotonic() + self._negative_ttl
+            self._negative.move_to_end(message_ts)
+            while len(self._negative) > self._negative_maxsize:
+                self._negative.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def active_channels(self) -> dict[str, str]:
+        with self._lock:
+            return {ts: self._channels[ts] for ts in self._options if ts in self._channels}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "active": len(self._options),
+                "loaded": len(self._loaded),
+                "negative": len(self._negative),
+            }
+
+
+# アプリ全体で共有するインデックス
+schedule_index = ScheduleIndex()
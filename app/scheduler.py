@@ -1,5 +1,12 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+import os
 import pytz
 
+# 予定時刻を過ぎてから何秒以内ならジョブを実行するか（起動直後にまとめて登録したリマインドや、混雑で遅れたジョブを取りこぼさないため）
+SCHEDULER_MISFIRE_GRACE_TIME = int(os.getenv("SCHEDULER_MISFIRE_GRACE_TIME", "3600"))
+
 # タイムゾーンを'Asia/Tokyo'に設定してスケジューラを作成
-scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Tokyo'))
\ No newline at end of file
+scheduler = BackgroundScheduler(
+    timezone=pytz.timezone('Asia/Tokyo'),
+    job_defaults={'misfire_grace_time': SCHEDULER_MISFIRE_GRACE_TIME, 'coalesce': True},
+)
@@ -1,117 +1,68 @@
 from fastapi import APIRouter, Request
-from slack_sdk.web import WebClient
-import os, re, logging
+from fastapi.responses import JSONResponse
+import os, re, uuid, socket, logging, asyncio
 from datetime import datetime, timedelta
-import pytz
-from dotenv import load_dotenv
-from .db import supabase
+from .storage import get_store
 from .scheduler import scheduler
+from .event_queue import EventWorkerPool, TeamInflightLimiter
+from .dedup import event_deduplicator
+from .clients import get_slack_client, current_team_id, team_context
+from .metrics import (
+    SLACK_EVENT_ACK_SECONDS, SLACK_EVENT_PROCESSING_SECONDS, SLACK_EVENTS_TOTAL,
+    DATETIME_PARSE_TOTAL, REMINDER_FANOUT_SECONDS, REMINDER_DELIVERIES_TOTAL,
+)
+from .schedule_index import schedule_index, SCHEDULE_INDEX_PAGE_SIZE
+from .participant_buffer import ParticipantWriteBuffer, count_votes
+from .reconcile import ReactionReconciler, fetch_reactions, REACTION_SHED_QUEUE_DEPTH
+from .auto_close import AutoCloseRules
+from .rollups import rollups, POSTS, DECISIONS, DECISION_SECONDS, DECIDED_OPTIONS, DELIVERIES
+from .fanout import fan_out_messages, DELIVERY_DONE
+from .datetime_parser import JST, parse_datetime_text, parse_option_lines, resolve_datetime
 
-load_dotenv(verbose=True)
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# 日本時間のタイムゾーンオブジェクトを定義
-JST = pytz.timezone('Asia/Tokyo')
 
-# 環境変数が正しく設定されているか確認
-bot_token = os.getenv("SLACK_BOT_TOKEN")
-if not bot_token:
-    raise ValueError("SLACK_BOT_TOKEN is not set in environment variables")
-else:
-    logger.info("SLACK_BOT_TOKEN is successfully loaded")
-
-# Slack クライアント
-slack_client = WebClient(token=bot_token)
+# イベント処理モード: "queue"（即時応答してワーカーで処理）または "inline"（処理完了後に応答）
+EVENT_PROCESSING_MODE = os.getenv("EVENT_PROCESSING_MODE", "queue")
+EVENT_WORKER_CONCURRENCY = int(os.getenv("EVENT_WORKER_CONCURRENCY", "4"))
+EVENT_QUEUE_MAXSIZE = int(os.getenv("EVENT_QUEUE_MAXSIZE", "1000"))
+EVENT_QUEUE_PUT_TIMEOUT = float(os.getenv("EVENT_QUEUE_PUT_TIMEOUT", "1.0"))
+# 1つのワークスペースから受け付けて処理中のイベント数の上限（超えた分は 503 を返して Slack の再送に任せる。0 で無効）
+EVENT_TEAM_MAX_INFLIGHT = int(os.getenv("EVENT_TEAM_MAX_INFLIGHT", "0"))
+# 一部の宛先に送信できなかった場合にリマインドを再試行するまでの秒数
+REMINDER_RETRY_DELAY = int(os.getenv("REMINDER_RETRY_DELAY", "300"))
+# リマインドの送信方式: "jobs"（決定ごとにスケジューラのジョブを登録）または "sweep"（定期的に送信予定のものをまとめて確保して送信）
+REMINDER_MODE = os.getenv("REMINDER_MODE", "jobs")
+# sweep 方式で確保を行う間隔（秒）と、何秒先までの送信予定を確保するか
+REMINDER_SWEEP_INTERVAL = float(os.getenv("REMINDER_SWEEP_INTERVAL", "60"))
+REMINDER_SWEEP_LOOKAHEAD = float(os.getenv("REMINDER_SWEEP_LOOKAHEAD", "60"))
+# sweep 方式でまとめて読み込み・送信済みにする件数
+REMINDER_SWEEP_BATCH_SIZE = int(os.getenv("REMINDER_SWEEP_BATCH_SIZE", "100"))
+# sweep 方式で1回に確保するリマインドの上限（残りは次回の確保で送信する）
+REMINDER_SWEEP_MAX_CLAIM = int(os.getenv("REMINDER_SWEEP_MAX_CLAIM", "1000"))
+# sweep 方式で、この秒数以内に送信予定のリマインドを参加者ごとに1通のDMにまとめる（0 でまとめない）
+REMINDER_DIGEST_WINDOW = float(os.getenv("REMINDER_DIGEST_WINDOW", "0"))
+# リマインドを送信するワーカーが持つリースの秒数（期限を過ぎると停止したとみなし、他のワーカーが引き継ぐ）
+REMINDER_LEASE_SECONDS = float(os.getenv("REMINDER_LEASE_SECONDS", "600"))
+# リースの所有者として記録するワーカーの識別子（既定はホスト名・プロセスID・起動ごとの乱数）
+REMINDER_WORKER_ID = os.getenv("REMINDER_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# リースを手放すときに更新するカラム
+REMINDER_LEASE_RELEASE = {'reminder_lease_owner': None, 'reminder_lease_expires_at': None}
+# 停止中に予定時刻を過ぎたリマインドの扱い: "send"（予定の開始前なら起動後すぐに送信）または "skip"（送信しない）
+REMINDER_CATCHUP_POLICY = os.getenv("REMINDER_CATCHUP_POLICY", "send")
+# 起動時に未送信のリマインドを読み込む際、1回に取得する件数
+REMINDER_REHYDRATE_PAGE_SIZE = int(os.getenv("REMINDER_REHYDRATE_PAGE_SIZE", "1000"))
 
 
 def clean_datetime_text(text):
-    text = text.replace('：', ':')
-    text = text.translate(str.maketrans('１２３４５６７８９０', '1234567890'))
-    text = re.sub(r'（[月火水木金土日]）', '', text)
-    text = re.sub(r'\([月火水木金土日]\)', '', text)
-    text = re.sub(r'[月火水木金土日]曜日', '', text)
-    text = re.sub(r'[ぁ-ん]', '', text)
-    # 「月/日」または「月月日日」の形式にマッチさせる
-    m = re.search(r'(\d{1,2})[月/](\d{1,2})日?', text)
-    date_part = f"{m.group(1)}/{m.group(2)}" if m else ''
-    time_part = ''
-    t = re.search(r'(\d{1,2})時半', text)
-    if t:
-        time_part = f"{t.group(1)}:30"
-    else:
-        t = re.search(r'(\d{1,2})時(\d{1,2})分', text)
-        if t:
-            time_part = f"{t.group(1)}:{t.group(2).zfill(2)}"
-        else:
-            t = re.search(r'(\d{1,2})時', text)
-            if t:
-                time_part = f"{t.group(1)}:00"
-            else:
-                t = re.search(r'(\d{1,2}):(\d{2})', text)
-                if t:
-                    time_part = f"{t.group(1)}:{t.group(2)}"
-    if date_part and time_part:
-        return f"{date_part} {time_part}"
-    elif date_part:
-        return date_part
-    elif time_part:
-        return time_part
-    else:
-        return text.strip()
+    """
+    候補日テキストを「月/日 時:分」の形式に整形する
+    """
+    return parse_datetime_text(text).text
 
 def extract_datetime(text: str):
-    cleaned_text = clean_datetime_text(text)
-    now = datetime.now(JST)
-    date_patterns = [
-        r'(\d{1,2})/(\d{1,2})',
-        r'(\d{4})/(\d{1,2})/(\d{1,2})',
-        r'(\d{1,2})月(\d{1,2})日',
-        r'(\d{4})年(\d{1,2})月(\d{1,2})日',
-    ]
-    time_patterns = [
-        r'(\d{1,2}):(\d{2})',
-        r'(\d{1,2})時(\d{1,2})分',
-        r'(\d{1,2})時半',
-        r'(\d{1,2})時',
-    ]
-    date_match = None
-    time_match = None
-    for pattern in date_patterns:
-        date_match = re.search(pattern, cleaned_text)
-        if date_match:
-            break
-    for pattern in time_patterns:
-        time_match = re.search(pattern, cleaned_text)
-        if time_match:
-            break
-    year, month, day = now.year, now.month, now.day
-    hour, minute = 0, 0
-    if date_match:
-        if len(date_match.groups()) == 2:
-            month = int(date_match.group(1))
-            day = int(date_match.group(2))
-        else:
-            year = int(date_match.group(1))
-            month = int(date_match.group(2))
-            day = int(date_match.group(3))
-    if time_match:
-        if len(time_match.groups()) == 2:
-            hour = int(time_match.group(1))
-            minute = int(time_match.group(2))
-        else:
-            hour = int(time_match.group(1))
-            if '半' in time_match.group(0):
-                minute = 30
-    try:
-        # naiveなdatetimeオブジェクトを作成
-        naive_dt = datetime(year, month, day, hour, minute)
-        dt = JST.localize(naive_dt)
-        if dt < now:
-            dt = dt.replace(year=dt.year + 1)
-        return dt
-    except ValueError:
-        return None
+    return resolve_datetime(parse_datetime_text(text))
 
 def normalize_emoji(emoji):
     number_map = {
@@ -126,74 +77,679 @@ def normalize_emoji(emoji):
 
 def extract_datetime_options(text):
     options = {}
-    lines = text.split('\n')
-    for line in lines:
-        match = re.search(r':(\w+):\s*(?:[:：]\s*)?(.+)', line)
-        if match:
-            emoji, datetime_str = match.groups()
-            normalized_emoji = normalize_emoji(emoji)
-            cleaned_str = clean_datetime_text(datetime_str)
-            dt = extract_datetime(cleaned_str)
-            if dt:
-                options[f":{normalized_emoji}:"] = dt
-                logger.info(f"日時を抽出しました: {datetime_str} -> {dt}")
-            else:
-                logger.info(f"日時を解析できませんでした: {datetime_str}")
+    # メッセージ内の候補日行をまとめて解析し、同じ現在時刻を基準に日時を確定する
+    now = datetime.now(JST)
+    for emoji, datetime_str, parsed in parse_option_lines(text):
+        normalized_emoji = normalize_emoji(emoji)
+        dt = resolve_datetime(parsed, now)
+        if dt:
+            options[f":{normalized_emoji}:"] = dt
+            DATETIME_PARSE_TOTAL.inc(result="success")
+            logger.info(f"日時を抽出しました: {datetime_str} -> {dt}")
+        else:
+            DATETIME_PARSE_TOTAL.inc(result="failure")
+            logger.info(f"日時を解析できませんでした: {datetime_str}")
     return options
 
+def to_jst(iso_string: str) -> datetime:
+    """
+    DBに保存したISO形式の日時をJSTのdatetimeに変換する
+    """
+    aware_dt = datetime.fromisoformat(iso_string)
+    if aware_dt.tzinfo is None:
+        # タイムゾーン情報がない場合はJSTとして扱う
+        return JST.localize(aware_dt)
+    # タイムゾーン情報がある場合はJSTに変換
+    return aware_dt.astimezone(JST)
+
+def schedule_reminder(main_message_ts: str, run_date: datetime, job_id: str):
+    """
+    リマインドジョブをスケジューラに登録する（同じIDのジョブがあれば上書き）
+    """
+    return scheduler.add_job(
+        send_reminder,
+        trigger='date',
+        run_date=run_date,
+        args=[main_message_ts],
+        id=job_id,
+        replace_existing=True
+    )
+
+def cancel_reminder_jobs(main_message_ts: str, options: dict):
+    """
+    候補日投稿のリマインドジョブ（候補ごとのジョブと再試行のジョブ）をこのワーカーのスケジューラから取り除く
+    """
+    job_ids = [f"reminder_{main_message_ts}_{emoji.strip(':')}" for emoji in options]
+    for job_id in job_ids + [f"reminder_retry_{main_message_ts}"]:
+        if scheduler.get_job(job_id):
+            scheduler.remove_job(job_id)
+
+def reminder_message(event_datetimes: list) -> str:
+    """
+    リマインドDMの本文を作る（複数の予定をまとめる場合は一覧にする）
+    """
+    if len(event_datetimes) == 1:
+        return (
+            f"🔔 リマインダーです！\n\n"
+            f"明日 **{event_datetimes[0].strftime('%m月%d日 %H:%M')}** からの予定を忘れないでね！"
+        )
+    message = f"🔔 リマインダーです！\n\n近いうちに予定が{len(event_datetimes)}件あります。忘れないでね！\n"
+    for dt in sorted(event_datetimes):
+        message += f"・ **{dt.strftime('%m月%d日 %H:%M')}** から\n"
+    return message
+
+def renew_reminder_leases(message_ts_list: list) -> list:
+    """
+    このワーカーが持つリマインドのリースを延長し、まだリースを持っている main_message_ts を返す
+    """
+    lease_expires_at = datetime.now(JST) + timedelta(seconds=REMINDER_LEASE_SECONDS)
+    return get_store().update_leased_reminders(
+        message_ts_list, REMINDER_WORKER_ID, {'reminder_lease_expires_at': lease_expires_at.isoformat()})
+
+def deliver_reminder(schedule_data: dict):
+    """
+    スケジュール1件分のリマインドDMを参加者に送信する
+
+    全員に送信できたら True、一時的に送れなかった宛先が残っていれば False、
+    送信対象が見つからなければ None を返す。リースは配信状況を記録するたびに延長し、
+    他のワーカーに引き継がれていれば残りの宛先には送信しない（False を返す）。
+    """
+    main_message_ts = schedule_data['main_message_ts']
+    # 参加者リストを取得
+    participants = schedule_data.get('participants', {})
+    selected_emoji = schedule_data.get('selected_emoji')
+
+    if not selected_emoji or selected_emoji not in participants:
+        logger.error(f"参加者情報が見つかりません: {main_message_ts}")
+        return None
+
+    user_ids = participants[selected_emoji]
+
+    # DBのISO形式の文字列をJSTに変換してからフォーマット
+    jst_dt = to_jst(schedule_data['selected_datetime'])
+
+    message = reminder_message([jst_dt])
+
+    # 前回までに送信済み（または送信不能）の宛先は除外して再開する
+    deliveries = schedule_data.get('reminder_deliveries') or {}
+    targets = [u for u in user_ids if deliveries.get(u) not in DELIVERY_DONE]
+
+    def record_deliveries(statuses: dict) -> bool:
+        deliveries.update(statuses)
+        get_store().update_schedule(main_message_ts, {'reminder_deliveries': deliveries})
+        # 送信が長引いてもリースが切れないよう延長し、他のワーカーに引き継がれていれば中断する
+        return bool(renew_reminder_leases([main_message_ts]))
+
+    # 各参加者にDMを並列に送信（スケジュールのワークスペースのクライアントとレート制限を使う）
+    with REMINDER_FANOUT_SECONDS.time(), team_context(schedule_data.get('team_id')):
+        results = fan_out_messages(get_slack_client(), targets, message, on_checkpoint=record_deliveries)
+    for status in results.values():
+        REMINDER_DELIVERIES_TOTAL.inc(status=status)
+        rollups.add(schedule_data.get('channel_id'), DELIVERIES, status, team_id=schedule_data.get('team_id'))
+
+    return all(deliveries.get(u) in DELIVERY_DONE for u in user_ids)
+
+def deliver_reminder_digest(schedules: list) -> dict:
+    """
+    複数のスケジュールのリマインドを、参加者ごとに1通のDMにまとめて送信する
+
+    スケジュールごとに deliver_reminder と同じ True / False / None を返す。リースの扱いも deliver_reminder と同じ。
+    ワークスペースが異なるスケジュールは、ワークスペースごとに分けて送信する。
+    """
+    teams: dict = {}
+    for schedule_data in schedules:
+        teams.setdefault(schedule_data.get('team_id'), []).append(schedule_data)
+    if len(teams) > 1:
+        outcomes = {}
+        for team_schedules in teams.values():
+            outcomes.update(deliver_reminder_digest(team_schedules))
+        return outcomes
+    team_id = next(iter(teams), None)
+    by_ts = {s['main_message_ts']: s for s in schedules}
+    outcomes = {}
+    for main_message_ts, schedule_data in by_ts.items():
+        if schedule_data.get('selected_emoji') not in (schedule_data.get('participants') or {}):
+            logger.error(f"参加者情報が見つかりません: {main_message_ts}")
+            outcomes[main_message_ts] = None
+    deliveries = {ts: s.get('reminder_deliveries') or {} for ts, s in by_ts.items()}
+
+    # 参加者ごとに、まだ送信していないスケジュールをまとめる
+    pending: dict[str, list] = {}
+    for user_id, message_ts_list in get_store().get_reminder_recipients(list(by_ts)).items():
+        targets = [ts for ts in message_ts_list if ts in by_ts and deliveries[ts].get(user_id) not in DELIVERY_DONE]
+        if targets:
+            pending[user_id] = targets
+
+    def render(user_id: str) -> str:
+        return reminder_message([to_jst(by_ts[ts]['selected_datetime']) for ts in pending[user_id]])
+
+    def record_deliveries(statuses: dict) -> bool:
+        touched = set()
+        for user_id, status in statuses.items():
+            for ts in pending[user_id]:
+                deliveries[ts][user_id] = status
+                touched.add(ts)
+        for ts in touched:
+            get_store().update_schedule(ts, {'reminder_deliveries': deliveries[ts]})
+        # まとめたスケジュールのリースを延長し、1件でも他のワーカーに引き継がれていれば中断する
+        return len(renew_reminder_leases(list(by_ts))) == len(by_ts)
+
+    with REMINDER_FANOUT_SECONDS.time(), team_context(team_id):
+        results = fan_out_messages(get_slack_client(), list(pending), render, on_checkpoint=record_deliveries)
+    for user_id, status in results.items():
+        REMINDER_DELIVERIES_TOTAL.inc(status=status)
+        # まとめたDMでも、集計はスケジュールごとの宛先として数える
+        for ts in pending[user_id]:
+            rollups.add(by_ts[ts].get('channel_id'), DELIVERIES, status, team_id=team_id)
+    logger.info(f"リマインドをまとめて送信しました: スケジュール{len(by_ts)}件, DM{len(results)}通")
+
+    for main_message_ts, schedule_data in by_ts.items():
+        if main_message_ts not in outcomes:
+            user_ids = schedule_data['participants'][schedule_data['selected_emoji']]
+            outcomes[main_message_ts] = all(deliveries[main_message_ts].get(u) in DELIVERY_DONE for u in user_ids)
+    return outcomes
+
+def lease_retry_at(row: dict, now: datetime):
+    """
+    他のワーカーが未送信のリマインドのリースを持っていれば、その期限の直後の時刻を返す（なければ None）
+
+    リースを持つワーカーが送信中に停止しても、期限の後に確保し直せるよう再試行の時刻に使う。
+    """
+    if not row or row.get('is_reminder_sent') or not row.get('reminder_job_id'):
+        return None
+    if not row.get('reminder_lease_expires_at') or row.get('reminder_lease_owner') == REMINDER_WORKER_ID:
+        return None
+    return max(to_jst(row['reminder_lease_expires_at']) + timedelta(seconds=1), now)
+
 def send_reminder(main_message_ts: str):
     """
     指定されたスケジュールID（main_message_ts）に基づいてリマインドを送信する
+
+    他のワーカーのリースで確保できない場合や、送信中にエラーになった場合は再試行のジョブを予約する。
     """
     logger.info(f"リマインドジョブを実行します: {main_message_ts}")
     try:
+        store = get_store()
+        now = datetime.now(JST)
+        # 複数のワーカーが同じジョブを持っていても1回だけ送信するよう、リースを取得してから送信する
+        if not store.claim_reminder(main_message_ts, now, REMINDER_WORKER_ID,
+                                    now + timedelta(seconds=REMINDER_LEASE_SECONDS)):
+            # 送信中のワーカーが停止した場合に備え、リースの期限の後に確認し直す
+            retry_dt = lease_retry_at(store.get_schedule(main_message_ts), now)
+            if retry_dt:
+                schedule_reminder(main_message_ts, retry_dt, f"reminder_retry_{main_message_ts}")
+                logger.info(f"他のワーカーが送信中のため、リースの期限後に確認し直します: {main_message_ts}, Time={retry_dt}")
+            else:
+                logger.info(f"リマインドは送信済みか、予約が取り消されています: {main_message_ts}")
+            return
+        # 未書き込みの参加者情報を反映してから読み込む
+        participant_buffer.flush(main_message_ts)
         # DBからスケジュール情報を取得
-        response = supabase.table('schedules').select('*').eq('main_message_ts', main_message_ts).single().execute()
-        schedule_data = response.data
+        schedule_data = store.get_schedule(main_message_ts)
 
         if not schedule_data:
             logger.error(f"リマインド対象のスケジュールが見つかりません: {main_message_ts}")
             return
-        
-        # 参加者リストを取得
-        participants = schedule_data.get('participants', {})
-        selected_emoji = schedule_data.get('selected_emoji')
-
-        if not selected_emoji or selected_emoji not in participants:
-            logger.error(f"参加者情報が見つかりません: {main_message_ts}")
+        # 決定し直す前のジョブなど、予約と合わないジョブでは送信しない
+        reminder_at = schedule_data.get('reminder_at')
+        if not schedule_data.get('reminder_job_id') or (reminder_at and to_jst(reminder_at) > now + timedelta(seconds=1)):
+            store.update_leased_reminders([main_message_ts], REMINDER_WORKER_ID, REMINDER_LEASE_RELEASE)
+            if schedule_data.get('reminder_job_id'):
+                schedule_reminder(main_message_ts, to_jst(reminder_at), schedule_data['reminder_job_id'])
+            logger.info(f"予約と合わないリマインドジョブのため送信しません: {main_message_ts}, reminder_at={reminder_at}")
             return
-        
-        user_ids = participants[selected_emoji]
 
-        # 1. DBからISO形式の文字列を取得
-        iso_string = schedule_data['selected_datetime']
-        
-        # 2. タイムゾーン情報を持ったdatetimeオブジェクトに変換
-        aware_dt = datetime.fromisoformat(iso_string)
+        delivered = deliver_reminder(schedule_data)
+        if delivered is False:
+            # 一時的に送れなかった宛先が残っているので、後で再試行する
+            retry_dt = datetime.now(JST) + timedelta(seconds=REMINDER_RETRY_DELAY)
+            job = schedule_reminder(main_message_ts, retry_dt, f"reminder_retry_{main_message_ts}")
+            # 再起動しても再試行が失われないよう予約内容を保存
+            store.update_leased_reminders([main_message_ts], REMINDER_WORKER_ID, {
+                'reminder_at': retry_dt.isoformat(),
+                'reminder_job_id': job.id,
+                **REMINDER_LEASE_RELEASE
+            })
+            logger.warning(f"未送信の宛先が残っているため再試行を予約しました: {main_message_ts}, Time={retry_dt}")
+        elif delivered:
+            # 全員への送信が完了したら送信済みフラグを更新し、インデックスからも取り除く
+            for message_ts in store.update_leased_reminders([main_message_ts], REMINDER_WORKER_ID,
+                                                            {'is_reminder_sent': True, **REMINDER_LEASE_RELEASE}):
+                schedule_index.remove(message_ts)
+        else:
+            store.update_leased_reminders([main_message_ts], REMINDER_WORKER_ID, REMINDER_LEASE_RELEASE)
+
+    except Exception as e:
+        logger.error(f"リマインド送信中にエラーが発生しました: {e}")
+        # リースを手放し、未送信の宛先を後で送り直す（手放せなくても同じワーカーは確保し直せる）
+        retry_dt = datetime.now(JST) + timedelta(seconds=REMINDER_RETRY_DELAY)
+        try:
+            schedule_reminder(main_message_ts, retry_dt, f"reminder_retry_{main_message_ts}")
+            get_store().update_leased_reminders([main_message_ts], REMINDER_WORKER_ID, REMINDER_LEASE_RELEASE)
+            logger.warning(f"リマインドの再試行を予約しました: {main_message_ts}, Time={retry_dt}")
+        except Exception as e:
+            logger.error(f"リマインドの再試行の予約に失敗しました: {main_message_ts}, Error: {e}")
+
+def reminder_due_at(row: dict):
+    """
+    スケジュールのリマインド予定時刻を返す（reminder_at がない古い行は予定の24時間前とみなす）
+    """
+    if row.get('reminder_at'):
+        return to_jst(row['reminder_at'])
+    if row.get('selected_datetime'):
+        return to_jst(row['selected_datetime']) - timedelta(days=1)
+    return None
+
+def rehydrate_reminders(page_size: int = REMINDER_REHYDRATE_PAGE_SIZE) -> dict:
+    """
+    DBに残っている未送信のリマインドをスケジューラに登録し直す（起動時、スケジューラの開始前に呼び出す）
+
+    停止中に予定時刻を過ぎたものは REMINDER_CATCHUP_POLICY に従い、予定の開始前であれば
+    すぐに送信し、それ以外は予約を取り消して次回以降の起動で対象にならないようにする。
+    停止前のワーカーなどのリースが残っている場合は、その期限の後に送信する。
+    sweep 方式ではジョブは登録せず、reminder_at のない古い行に送信予定時刻を書き込むだけにする。
+    """
+    now = datetime.now(JST)
+    counts = {"scheduled": 0, "caught_up": 0, "skipped": 0}
+    skipped = []
+    backfill = []
+    for rows in get_store().iter_pending_reminders(page_size):
+        for row in rows:
+            main_message_ts = row['main_message_ts']
+            due_at = reminder_due_at(row)
+            if due_at is None:
+                skipped.append(main_message_ts)
+                continue
+            if due_at > now:
+                counts["scheduled"] += 1
+            elif (REMINDER_CATCHUP_POLICY == "send" and row.get('selected_datetime')
+                  and to_jst(row['selected_datetime']) > now):
+                counts["caught_up"] += 1
+            else:
+                skipped.append(main_message_ts)
+                continue
+            if REMINDER_MODE == "sweep":
+                if not row.get('reminder_at'):
+                    backfill.append((main_message_ts, due_at))
+            else:
+                run_date = max(due_at, now)
+                if row.get('reminder_lease_expires_at'):
+                    run_date = max(run_date, to_jst(row['reminder_lease_expires_at']) + timedelta(seconds=1))
+                schedule_reminder(main_message_ts, run_date, row['reminder_job_id'])
+    for main_message_ts, due_at in backfill:
+        get_store().update_schedule(main_message_ts, {'reminder_at': due_at.isoformat()})
+    for main_message_ts in skipped:
+        get_store().update_schedule(main_message_ts, {'reminder_job_id': None})
+        logger.info(f"予定時刻を過ぎたリマインドを取り消しました: {main_message_ts}")
+    counts["skipped"] = len(skipped)
+    logger.info(f"未送信のリマインドを再登録しました: {counts}")
+    return counts
+
+def sweep_reminders(lookahead: float = REMINDER_SWEEP_LOOKAHEAD,
+                    batch_size: int = REMINDER_SWEEP_BATCH_SIZE) -> int:
+    """
+    送信予定時刻が lookahead 秒後までのリマインドをまとめて確保して送信する（sweep 方式で定期実行）
+
+    確保は reminder_at の範囲検索とリースの取得を1回のクエリで行い、スケジュールの読み込みと
+    送信済みフラグの更新は batch_size 件ごとにまとめる。すべてのワーカーで実行してよく、
+    各リマインドはリースを取得したワーカーだけが送信する。送信したリマインドの件数を返す。
+    REMINDER_DIGEST_WINDOW を指定した場合は、その秒数先までのリマインドをまとめて確保し、
+    参加者ごとに1通のDMにまとめて送信する。
+    """
+    store = get_store()
+    now = datetime.now(JST)
+    if REMINDER_DIGEST_WINDOW > 0:
+        lookahead = max(lookahead, REMINDER_DIGEST_WINDOW)
+    claimed = store.claim_due_reminders(
+        now + timedelta(seconds=lookahead), now, REMINDER_WORKER_ID, now + timedelta(seconds=REMINDER_LEASE_SECONDS),
+        REMINDER_SWEEP_MAX_CLAIM)
+    if not claimed:
+        return 0
+    logger.info(f"送信予定のリマインドを確保しました: {len(claimed)}件")
+    if REMINDER_DIGEST_WINDOW > 0:
+        # 同じ参加者へのDMをまとめるため、確保したものを1回で処理する
+        batch_size = max(batch_size, len(claimed))
+
+    sent = 0
+    for start in range(0, len(claimed), batch_size):
+        batch = claimed[start:start + batch_size]
+        if start:
+            # 前のバッチの送信中にリースが切れていないか確認しつつ延長する
+            batch = renew_reminder_leases(batch)
+        # 未書き込みの参加者情報を反映してからまとめて読み込む
+        for main_message_ts in batch:
+            participant_buffer.flush(main_message_ts)
+        outcomes = {}
+        schedules = []
+        for schedule_data in store.get_schedules(batch):
+            selected_datetime = schedule_data.get('selected_datetime')
+            if not selected_datetime or to_jst(selected_datetime) <= now:
+                # 予定が始まっているものは送信せずに予約を取り消す
+                outcomes[schedule_data['main_message_ts']] = None
+            else:
+                schedules.append(schedule_data)
+        if REMINDER_DIGEST_WINDOW > 0:
+            try:
+                outcomes.update(deliver_reminder_digest(schedules))
+            except Exception as e:
+                logger.error(f"リマインドのまとめ送信中にエラーが発生しました: {e}")
+                outcomes.update({s['main_message_ts']: False for s in schedules})
+        else:
+            for schedule_data in schedules:
+                # 前のスケジュールの送信中にリースが切れていれば、引き継いだワーカーに任せる
+                if not renew_reminder_leases([schedule_data['main_message_ts']]):
+                    logger.warning(f"リースが他のワーカーに引き継がれたため送信しません: {schedule_data['main_message_ts']}")
+                    continue
+                try:
+                    outcomes[schedule_data['main_message_ts']] = deliver_reminder(schedule_data)
+                except Exception as e:
+                    logger.error(f"リマインド送信中にエラーが発生しました: {schedule_data['main_message_ts']}, Error: {e}")
+                    outcomes[schedule_data['main_message_ts']] = False
+
+        done = []
+        for main_message_ts, delivered in outcomes.items():
+            if delivered:
+                done.append(main_message_ts)
+            elif delivered is False:
+                # リースを手放し、再試行の時刻になったら次の確保で拾われるようにする
+                retry_dt = datetime.now(JST) + timedelta(seconds=REMINDER_RETRY_DELAY)
+                store.update_leased_reminders([main_message_ts], REMINDER_WORKER_ID, {
+                    'reminder_at': retry_dt.isoformat(),
+                    **REMINDER_LEASE_RELEASE
+                })
+                logger.warning(f"未送信の宛先が残っているため再試行を予約しました: {main_message_ts}, Time={retry_dt}")
+            else:
+                store.update_leased_reminders([main_message_ts], REMINDER_WORKER_ID,
+                                              {'reminder_job_id': None, **REMINDER_LEASE_RELEASE})
+                logger.info(f"送信対象のないリマインドを取り消しました: {main_message_ts}")
+        finished = store.update_leased_reminders(
+            done, REMINDER_WORKER_ID, {'is_reminder_sent': True, **REMINDER_LEASE_RELEASE})
+        # 送信済みのスケジュールはインデックスから取り除く（以降のリアクションでは DB から読み込み直す）
+        for message_ts in finished:
+            schedule_index.remove(message_ts)
+        sent += len(finished)
+    logger.info(f"リマインドを送信しました: {sent}/{len(claimed)}件")
+    return sent
+
+def event_ordering_key(body: dict) -> str:
+    """
+    イベントの処理順序を保証するためのキーを返す
+
+    リアクションは対象メッセージの ts、決定メッセージはスレッドの親 ts を使うことで、
+    同じ候補日投稿（main_message_ts）に関するイベントが同じワーカーで順に処理される。
+    """
+    event = body.get("event", {})
+    if event.get("type") in ("reaction_added", "reaction_removed"):
+        return event.get("item", {}).get("ts", "")
+    if event.get("type") == "app_mention":
+        return event.get("thread_ts") or event.get("ts", "")
+    return body.get("event_id", "")
+
+def process_slack_event(body: dict):
+    """
+    event_callback の中身を処理する（同期処理。ワーカーのスレッドから呼び出される）
+    """
+    event_type = body.get("event", {}).get("type", "unknown")
+    team_id = body.get("team_id")
+    try:
+        # イベントのワークスペースのトークンで Slack を呼び出し、そのワークスペースのスケジュールだけを扱う
+        with SLACK_EVENT_PROCESSING_SECONDS.time(event_type=event_type), team_context(team_id):
+            _process_event(body)
+    finally:
+        team_limiter.release(team_id or "")
+
+def decide_schedule(channel: str, thread_ts: str, emoji_matches: list, user: str = None) -> bool:
+    """
+    候補日投稿のスレッドでの決定を処理する（手動の決定と、自動決定の両方から呼び出す）
+
+    user がない場合（自動決定）は、エラーのエフェメラルメッセージを送らない。決定した場合は True を返す。
+    """
+    # 決定前に未書き込みの参加者情報を反映しておく
+    participant_buffer.flush(thread_ts)
+    # インデックスから候補日投稿の options を取得（未知の ts のみ DB を参照）
+    candidate_options = schedule_index.get_options(thread_ts)
+    if candidate_options is not None:
+        # 取りこぼしたリアクションがあっても正しい参加者で決定できるよう、スナップショットで同期する
+        # （前回の同期以降にイベントがあった場合だけ、待ち時間の上限付きで優先して取得する）
+        reaction_reconciler.reconcile_before_decision(thread_ts, channel)
+        # DBから取得したoptionsは文字列なのでdatetimeオブジェクトに変換する必要がある
+        # ただし、この時点では文字列のままで比較しても問題ない
+        # 実際のdtオブジェクトは、決定ロジックの中で別途取得・生成する
+        decided = []
+        for emoji in emoji_matches:
+            normalized_emoji = emoji
+            m = re.match(r":(\w+):", emoji)
+            if m:
+                normalized_emoji = f":{normalize_emoji(m.group(1))}:"
+            # DBから取得した日時文字列
+        dt_str_from_db = candidate_options.get(normalized_emoji)
         
-        # 3. JSTに変換してからフォーマット
-        if aware_dt.tzinfo is None:
-            # タイムゾーン情報がない場合はJSTとして扱う
-            jst_dt = JST.localize(aware_dt)
+        if dt_str_from_db:
+            # 文字列をdatetimeオブジェクトに変換
+            dt_obj = datetime.fromisoformat(dt_str_from_db)
+            
+            # datetimeオブジェクトを画面表示用の文字列にフォーマット
+            dt_str_for_display = dt_obj.strftime('%Y/%m/%d %H:%M')
+            
+            # decidedリストには、datetimeオブジェクトを格納する
+            decided.append((normalized_emoji, dt_obj, dt_str_for_display))
+        if decided:
+            if len(decided) == 1:
+                emoji, dt_obj, dt_str = decided[0]
+                reminder_dt = dt_obj - timedelta(days=1)
+                reminder_str = reminder_dt.strftime('%Y/%m/%d %H:%M')
+                msg = (f"日時を\n{emoji} {dt_str}\nに決定しました。\n"
+                       f"予定の24時間前（{reminder_str}頃）にリマインドします。")
+            else:
+                msg = "日時を以下で決定しました。\n"
+                for emoji, dt_obj, dt_str in decided:
+                    reminder_dt = dt_obj - timedelta(days=1)
+                    reminder_str = reminder_dt.strftime('%Y/%m/%d %H:%M')
+                    msg += f"・ {emoji} {dt_str} (リマインド: {reminder_str}頃)\n"
+            get_slack_client().chat_postMessage(
+                channel=channel,
+                text=msg,
+                thread_ts=thread_ts
+            )
+
+            if REMINDER_MODE != "sweep":
+                # 決定し直した場合に、前の決定のジョブが古い時刻に送信しないよう取り除く
+                cancel_reminder_jobs(thread_ts, candidate_options)
+            for emoji, dt_obj, dt_str in decided:
+                reminder_dt = dt_obj - timedelta(days=1)
+                reminder = {'reminder_at': None, 'reminder_job_id': None}
+
+                # 過去の日時になっていないかチェック（過ぎていればリマインドは予約せず、決定だけを記録する）
+                if reminder_dt > datetime.now(JST):
+                    job_id = f"reminder_{thread_ts}_{emoji.strip(':')}"
+                    if REMINDER_MODE != "sweep":
+                        schedule_reminder(thread_ts, reminder_dt, job_id)
+                    logger.info(f"リマインドを予約しました: JobID={job_id}, Time={reminder_dt}")
+                    reminder = {'reminder_at': reminder_dt.isoformat(), 'reminder_job_id': job_id}
+
+                # DBにジョブIDなどを保存（決定し直した場合は、前の決定の送信状況を消して新しい参加者に送り直す）
+                get_store().update_schedule(thread_ts, {
+                    'selected_emoji': emoji,
+                    'selected_datetime': dt_obj.isoformat(),
+                    **reminder,
+                    'is_reminder_sent': False,
+                    'reminder_deliveries': {},
+                    **REMINDER_LEASE_RELEASE
+                })
+                record_decision(channel, thread_ts, emoji)
+                schedule_index.mark_decided(thread_ts, emoji)
+            return True
+        if user:
+            get_slack_client().chat_postEphemeral(
+                channel=channel,
+                user=user,
+                text="指定されたスタンプに対応する日時が候補にありません。"
+            )
+        logger.info(f"決定スタンプが候補にありません: {emoji_matches}")
+    else:
+        if user:
+            get_slack_client().chat_postEphemeral(
+                channel=channel,
+                user=user,
+                text="このスレッドは候補日投稿ではありません。"
+            )
+        logger.info("スレッドが候補日投稿ではありません")
+    return False
+
+def check_auto_close(message_ts: str, summary: dict = None):
+    """
+    参加者数の集計から自動決定のルールを評価し、スレッドで決定を提案するか、決定する
+
+    AUTO_CLOSE_MODE が off の場合や、既に決定済みのスケジュールは何もしない。
+    プロセス内の集計は他のワーカーが受けたリアクションを含まないため、ルールに当てはまりそうな場合だけ
+    DB の決定状況と vote_counts（summary）で判定し直し、提案・決定は DB に記録して1つのワーカーだけが行う。
+    """
+    if not auto_close_rules.enabled:
+        return
+    if summary is None:
+        if schedule_index.selected_emoji(message_ts):
+            return
+        options = schedule_index.get_options(message_ts)
+        if not options or auto_close_rules.evaluate(message_ts, options, schedule_index.tally(message_ts)) is None:
+            return
+        participant_buffer.flush(message_ts)
+        summary = get_store().get_schedule_summary(message_ts)
+        if summary is None:
+            return
+    if summary.get('selected_emoji'):
+        # 他のワーカーで決定済み
+        schedule_index.mark_decided(message_ts, summary['selected_emoji'])
+        return
+    options = summary.get('options') or {}
+    channel = summary.get('channel_id')
+    if not options or not channel:
+        return
+    result = auto_close_rules.evaluate(message_ts, options, summary.get('vote_counts') or {})
+    if result is None or auto_close_rules.has_acted(message_ts, result[0]):
+        return
+    emoji, reason = result
+    action = f"{auto_close_rules.mode}:{emoji}"
+    if not get_store().claim_auto_close(message_ts, action):
+        logger.info(f"自動決定の提案・決定は他のワーカーで実行済みです: ts={message_ts}, {emoji}")
+        auto_close_rules.mark_acted(message_ts, emoji)
+        return
+    # 提案・決定を終えてから記録する（失敗した場合は DB の記録も取り消し、次の評価で再び行う）
+    try:
+        if auto_close_rules.mode == "finalize":
+            logger.info(f"自動決定のルールにより決定します: ts={message_ts}, {emoji}（{reason}）")
+            if not decide_schedule(channel, message_ts, [emoji]):
+                raise RuntimeError(f"決定できませんでした: {emoji}")
         else:
-            # タイムゾーン情報がある場合はJSTに変換
-            jst_dt = aware_dt.astimezone(JST)
+            dt_str = datetime.fromisoformat(options[emoji]).strftime('%Y/%m/%d %H:%M')
+            get_slack_client().chat_postMessage(
+                channel=channel,
+                text=(f"{reason}ため、\n{emoji} {dt_str}\nで決定してはいかがでしょうか。\n"
+                      f"決定する場合は、このスレッドでボットにメンションして {emoji} を送ってください。"),
+                thread_ts=message_ts
+            )
+            logger.info(f"自動決定のルールにより決定を提案しました: ts={message_ts}, {emoji}（{reason}）")
+    except Exception:
+        get_store().release_auto_close(message_ts, action)
+        raise
+    auto_close_rules.mark_acted(message_ts, emoji)
+
+def check_auto_close_all():
+    """
+    未決定のすべてのスケジュールについて、DB の vote_counts で自動決定のルールを評価する
 
-        message = (
-            f"🔔 リマインダーです！\n\n"
-            f"明日 **{jst_dt.strftime('%m月%d日 %H:%M')}** からの予定を忘れないでね！"
-        )
+    締め切りの確認と、他のワーカーが受けたリアクションを含めた参加者数の確認のため、スケジューラから定期実行する。
+    """
+    participant_buffer.flush_all()
+    for rows in get_store().iter_active_schedules(SCHEDULE_INDEX_PAGE_SIZE):
+        for row in rows:
+            if row.get('selected_emoji'):
+                continue
+            try:
+                with team_context(row.get('team_id')):
+                    check_auto_close(row['main_message_ts'], row)
+            except Exception as e:
+                logger.error(f"自動決定の評価に失敗しました: ts={row['main_message_ts']}, Error: {e}")
+
+def _process_event(body: dict):
+    event = body.get("event", {})
+    if event.get("type") == "app_mention":
+        user = event["user"]
+        channel = event["channel"]
+        text = event.get("text", "")
+        message_ts = event.get("ts", "")
+        thread_ts = event.get("thread_ts", None)
+
+        if thread_ts:
+            emoji_matches = re.findall(r'(:\w+:)', text)
+            if emoji_matches:
+                decide_schedule(channel, thread_ts, emoji_matches, user)
+                return
+        options = extract_datetime_options(text)
 
-        # 各参加者にDMを送信
-        for user_id in user_ids:
-            slack_client.chat_postMessage(channel=user_id, text=message)
-            logger.info(f"{user_id} にリマインドを送信しました。")
             
-        # 送信済みフラグを更新
-        supabase.table('schedules').update({'is_reminder_sent': True}).eq('main_message_ts', main_message_ts).execute()
+            
+        if options:
+            # 新しい候補日投稿をSupabaseに保存
+            save_new_schedule(message_ts, channel, options)
+            logger.info(f"候補日投稿を記録しました: {message_ts}")
+            logger.info(f"候補日時: {options}")
+            message = f"<@{user}> 候補日を記録しました！\n```"
+            for emoji, dt in options.items():
+                message += f"{emoji}: {dt.strftime('%Y/%m/%d %H:%M')}\n"
+            message += "```"
+            get_slack_client().chat_postEphemeral(channel=channel, user=user, text=message)
+        else:
+            logger.info(f"候補日時が見つかりませんでした: {text}")
+
+    # リアクションが追加された場合の処理
+    elif event.get("type") == "reaction_added":
+        reaction = event.get("reaction", "")
+        user_id = event.get("user", "")
+        item = event.get("item", {})
+        message_ts = item.get("ts", "")
+        # インデックスで該当のスケジュールが存在するか確認（候補日投稿以外は I/O なしで捨てる）
+        schedule_options = schedule_index.get_options(message_ts)
+
+        if schedule_options is not None:
+            normalized_reaction = f":{normalize_emoji(reaction)}:"
+
+            if normalized_reaction in schedule_options:
+                # 書き込みバッファに追加（まとめてDBに反映される）
+                participant_buffer.add(message_ts, normalized_reaction, user_id)
+                record_vote(message_ts, item.get("channel", ""), normalized_reaction, 1)
+                # 次の定期的な同期の対象にする
+                reaction_reconciler.mark_dirty(message_ts, item.get("channel", ""))
+                check_auto_close(message_ts)
+            else:
+                logger.info(f"スケジュールにないスタンプへのリアクションは無視します: {normalized_reaction}")
+        else:
+            logger.info(f"候補日投稿以外のメッセージに対するリアクションは無視します: {message_ts}")
+            
 
-    except Exception as e:
-        logger.error(f"リマインド送信中にエラーが発生しました: {e}")
+    # リアクションが削除された場合の処理
+    elif event.get("type") == "reaction_removed":
+        reaction = event.get("reaction", "")
+        user_id = event.get("user", "")
+        item = event.get("item", {})
+        message_ts = item.get("ts", "")
+        
+        # インデックスで該当のスケジュールが存在するか確認
+        schedule_options = schedule_index.get_options(message_ts)
+        if schedule_options is not None:
+            normalized_reaction = f":{normalize_emoji(reaction)}:"
+            # 書き込みバッファに削除を追加（まとめてDBに反映される）
+            participant_buffer.remove(message_ts, normalized_reaction, user_id)
+            if normalized_reaction in schedule_options:
+                record_vote(message_ts, item.get("channel", ""), normalized_reaction, -1)
+            reaction_reconciler.mark_dirty(message_ts, item.get("channel", ""))
+
+# バックグラウンドでイベントを処理するワーカープール（起動・停止は main.py の lifespan で行う）
+event_pool = EventWorkerPool(
+    process_slack_event,
+    concurrency=EVENT_WORKER_CONCURRENCY,
+    maxsize=EVENT_QUEUE_MAXSIZE,
+    put_timeout=EVENT_QUEUE_PUT_TIMEOUT,
+)
 
 @router.post("/slack/events")
 async def handle_slack_events(req: Request):
@@ -201,239 +757,162 @@ async def handle_slack_events(req: Request):
     if body.get("type") == "url_verification":
         return {"challenge": body["challenge"]}
     if body.get("type") == "event_callback":
-        event = body.get("event", {})
-        if event.get("type") == "app_mention":
-            user = event["user"]
-            channel = event["channel"]
-            text = event.get("text", "")
-            message_ts = event.get("ts", "")
-            thread_ts = event.get("thread_ts", None)
-
-            if thread_ts:
-                emoji_matches = re.findall(r'(:\w+:)', text)
-                if emoji_matches:
-                    response = supabase.table('schedules').select('options').eq('main_message_ts', thread_ts).single().execute()
-                    candidate = response.data 
-                    if candidate and 'options' in candidate:
-                        # DBから取得したoptionsは文字列なのでdatetimeオブジェクトに変換する必要がある
-                        # ただし、この時点では文字列のままで比較しても問題ない
-                        # 実際のdtオブジェクトは、決定ロジックの中で別途取得・生成する
-                        decided = []
-                        for emoji in emoji_matches:
-                            normalized_emoji = emoji
-                            m = re.match(r":(\w+):", emoji)
-                            if m:
-                                normalized_emoji = f":{normalize_emoji(m.group(1))}:"
-                            # DBから取得した日時文字列
-                        dt_str_from_db = candidate["options"].get(normalized_emoji)
-                        
-                        if dt_str_from_db:
-                            # 文字列をdatetimeオブジェクトに変換
-                            dt_obj = datetime.fromisoformat(dt_str_from_db)
-                            
-                            # datetimeオブジェクトを画面表示用の文字列にフォーマット
-                            dt_str_for_display = dt_obj.strftime('%Y/%m/%d %H:%M')
-                            
-                            # decidedリストには、datetimeオブジェクトを格納する
-                            decided.append((normalized_emoji, dt_obj, dt_str_for_display))
-                        if decided:
-                            if len(decided) == 1:
-                                emoji, dt_obj, dt_str = decided[0]
-                                reminder_dt = dt_obj - timedelta(days=1)
-                                reminder_str = reminder_dt.strftime('%Y/%m/%d %H:%M')
-                                msg = (f"日時を\n{emoji} {dt_str}\nに決定しました。\n"
-                                       f"予定の24時間前（{reminder_str}頃）にリマインドします。")
-                            else:
-                                msg = "日時を以下で決定しました。\n"
-                                for emoji, dt_obj, dt_str in decided:
-                                    reminder_dt = dt_obj - timedelta(days=1)
-                                    reminder_str = reminder_dt.strftime('%Y/%m/%d %H:%M')
-                                    msg += f"・ {emoji} {dt_str} (リマインド: {reminder_str}頃)\n"
-                            slack_client.chat_postMessage(
-                                channel=channel,
-                                text=msg,
-                                thread_ts=thread_ts
-                            )
-
-                            for emoji, dt_obj, dt_str in decided:
-                                reminder_dt = dt_obj - timedelta(days=1)
-
-                                # 過去の日時になっていないかチェック
-                                if reminder_dt > datetime.now(JST):
-                                    job_id = f"reminder_{thread_ts}_{emoji.strip(':')}"
-                                    job = scheduler.add_job(
-                                        send_reminder,
-                                        trigger='date',
-                                        run_date=reminder_dt,
-                                        args=[thread_ts],
-                                        id=job_id,
-                                        replace_existing=True # 同じIDのジョブがあれば上書き
-                                    )
-                                    logger.info(f"リマインドを予約しました: JobID={job.id}, Time={reminder_dt}")
-
-                                    # ▼▼▼ デバッグ用のログを追加 ▼▼▼
-                                    logger.info("--- 現在の予約済みジョブ一覧 ---")
-                                    scheduler.print_jobs()
-                                    logger.info("---------------------------------")
-                                    # ▲▲▲ ここまで追加 ▲▲▲
-
-                                    # DBにジョブIDなどを保存
-                                    supabase.table('schedules').update({
-                                        'selected_emoji': emoji,
-                                        'selected_datetime': dt_obj.isoformat(),
-                                        'reminder_job_id': job.id
-                                    }).eq('main_message_ts', thread_ts).execute()
-                        else:
-                            slack_client.chat_postEphemeral(
-                                channel=channel,
-                                user=user,
-                                text="指定されたスタンプに対応する日時が候補にありません。"
-                            )
-                            logger.info(f"決定スタンプが候補にありません: {emoji_matches}")
-                    else:
-                        slack_client.chat_postEphemeral(
-                            channel=channel,
-                            user=user,
-                            text="このスレッドは候補日投稿ではありません。"
-                        )
-                        logger.info("スレッドが候補日投稿ではありません")
-                    return {"ok": True}
-            options = extract_datetime_options(text)
-
-                
-                
-            if options:
-                # 新しい候補日投稿をSupabaseに保存
-                save_new_schedule(message_ts, channel, options)
-                logger.info(f"候補日投稿を記録しました: {message_ts}")
-                logger.info(f"候補日時: {options}")
-                message = f"<@{user}> 候補日を記録しました！\n```"
-                for emoji, dt in options.items():
-                    message += f"{emoji}: {dt.strftime('%Y/%m/%d %H:%M')}\n"
-                message += "```"
-                slack_client.chat_postEphemeral(channel=channel, user=user, text=message)
-            else:
-                logger.info(f"候補日時が見つかりませんでした: {text}")
-
-        # リアクションが追加された場合の処理
-        elif event.get("type") == "reaction_added":
-            reaction = event.get("reaction", "")
-            user_id = event.get("user", "")
-            item = event.get("item", {})
-            message_ts = item.get("ts", "")
-            # データベースに該当のスケジュールが存在するか確認
-            schedule_response = supabase.table('schedules').select('options').eq('main_message_ts', message_ts).single().execute()
-            
-            if schedule_response.data:
-                schedule_options = schedule_response.data.get('options', {})
-                normalized_reaction = f":{normalize_emoji(reaction)}:"
-
-                if normalized_reaction in schedule_options:
-                    # DBを更新する関数を呼び出す
-                    update_participants_in_db(message_ts, normalized_reaction, user_id)
-                else:
-                    logger.info(f"スケジュールにないスタンプへのリアクションは無視します: {normalized_reaction}")
-            else:
-                logger.info(f"候補日投稿以外のメッセージに対するリアクションは無視します: {message_ts}")
-                
-
-        # リアクションが削除された場合の処理
-        elif event.get("type") == "reaction_removed":
-            reaction = event.get("reaction", "")
-            user_id = event.get("user", "")
-            item = event.get("item", {})
-            message_ts = item.get("ts", "")
-            
-            # データベースに該当のスケジュールが存在するか確認
-            schedule_response = supabase.table('schedules').select('options').eq('main_message_ts', message_ts).single().execute()
-            
-            if schedule_response.data:
-                normalized_reaction = f":{normalize_emoji(reaction)}:"
-                # DBから参加者を削除する関数を呼び出す
-                remove_participant_from_db(message_ts, normalized_reaction, user_id)
-
+        event_type = body.get("event", {}).get("type", "unknown")
+        with SLACK_EVENT_ACK_SECONDS.time(event_type=event_type):
+            outcome = await _accept_event(req, body)
+        SLACK_EVENTS_TOTAL.inc(event_type=event_type, outcome=outcome)
+        if outcome == "rejected":
+            # 満杯の場合はSlackに再送してもらう
+            return JSONResponse(status_code=503, content={"ok": False})
     return {"ok": True}
 
+def shed_reaction_event(body: dict) -> bool:
+    """
+    イベントキューが REACTION_SHED_QUEUE_DEPTH 件以上たまっている場合、リアクションのイベントを処理せずに
+    対象メッセージを同期の対象として記録する（参加者は後で reactions.get のスナップショットから書き直す）
+    """
+    event = body.get("event", {})
+    if REACTION_SHED_QUEUE_DEPTH <= 0 or event.get("type") not in ("reaction_added", "reaction_removed"):
+        return False
+    if event_pool.qsize() < REACTION_SHED_QUEUE_DEPTH:
+        return False
+    item = event.get("item", {})
+    reaction_reconciler.shed(item.get("ts", ""), item.get("channel", ""))
+    return True
+
+async def _accept_event(req: Request, body: dict) -> str:
+    """
+    event_callback を受け付け、結果（duplicate / queued / shed / rejected / processed）を返す
+    """
+    event_id = body.get("event_id")
+    # Slackの再送などで処理済みのイベントは、DBやSlackにアクセスする前に捨てる
+    if await event_deduplicator.is_duplicate(
+        event_id,
+        retry_num=req.headers.get("X-Slack-Retry-Num"),
+        retry_reason=req.headers.get("X-Slack-Retry-Reason"),
+    ):
+        return "duplicate"
+    if EVENT_PROCESSING_MODE == "queue" and event_pool.running and shed_reaction_event(body):
+        return "shed"
+    # 1つのワークスペースが処理枠を使い切らないよう、上限を超えたら再送に任せる（処理を終えると process_slack_event で解放）
+    team_id = body.get("team_id") or ""
+    if not team_limiter.try_acquire(team_id):
+        logger.warning(f"ワークスペースの処理中のイベントが上限に達したため受け付けできません: team={team_id}")
+        await event_deduplicator.forget(event_id)
+        return "rejected"
+    if EVENT_PROCESSING_MODE == "queue" and event_pool.running:
+        # キューに積んで即座に200を返し、処理はバックグラウンドのワーカーに任せる
+        if await event_pool.submit(event_ordering_key(body), body):
+            return "queued"
+        team_limiter.release(team_id)
+        if shed_reaction_event(body):
+            return "shed"
+        # 再送を重複扱いしないよう記録を取り消す
+        await event_deduplicator.forget(event_id)
+        return "rejected"
+    try:
+        await asyncio.to_thread(process_slack_event, body)
+    except Exception:
+        await event_deduplicator.forget(event_id)
+        raise
+    return "processed"
+
 def save_new_schedule(message_ts: str, channel_id: str, options: dict):
     """
-    新しい候補日投稿をSupabaseのschedulesテーブルに保存する
+    新しい候補日投稿をschedulesテーブルに保存する
     """
     try:
         options_for_db = {key: dt.isoformat() for key, dt in options.items()}
-        # Supabaseに挿入するデータを作成
+        # 挿入するデータを作成
         insert_data = {
             "main_message_ts": message_ts,
             "channel_id": channel_id,
+            "team_id": current_team_id(),
             "options": options_for_db,
             "participants": {}  # participantsは空のJSONで初期化
         }
         # データの挿入を実行
-        supabase.table('schedules').insert(insert_data).execute()
-        logger.info(f"✅ Supabaseへのスケジュール保存に成功しました。ts: {message_ts}")
+        get_store().insert_schedule(insert_data)
+        schedule_index.put(message_ts, options_for_db, channel_id=channel_id, team_id=current_team_id())
+        rollups.add(channel_id, POSTS)
+        logger.info(f"✅ DBへのスケジュール保存に成功しました。ts: {message_ts}")
     except Exception as e:
-        logger.error(f"❌ Supabaseへのスケジュール保存に失敗しました。ts: {message_ts}, Error: {e}")
+        logger.error(f"❌ DBへのスケジュール保存に失敗しました。ts: {message_ts}, Error: {e}")
 
-def update_participants_in_db(message_ts: str, emoji: str, user_id: str):
+def reconcile_participants(message_ts: str, channel: str, priority: bool = False) -> bool:
     """
-    指定されたスタンプの参加者リストにユーザーを追加/更新する
-    """
-    try:
-        # DBから現在の参加者リストを取得
-        response = supabase.table('schedules').select('participants').eq('main_message_ts', message_ts).single().execute()
-        
-        if not response.data:
-            logger.info(f"DBに該当するスケジュールがありません: {message_ts}")
-            return
+    reactions.get で取得したリアクションのスナップショットから participants を書き直す
 
-        participants = response.data.get('participants', {})
-
-        # 参加者リストを更新
-        if emoji not in participants:
-            participants[emoji] = []
-        
-        # 既に参加者でなければ追加する
-        if user_id not in participants[emoji]:
-            participants[emoji].append(user_id)
-            logger.info(f"参加者を追加: {user_id} -> {emoji}")
-        else:
-            logger.info(f"参加者は既に追加済みです: {user_id} -> {emoji}")
-            return # 更新不要なのでここで処理を終了
-
-        # 更新した参加者リストをDBに保存
-        supabase.table('schedules').update({'participants': participants}).eq('main_message_ts', message_ts).execute()
-        logger.info(f"✅ DBの参加者情報を更新しました: ts={message_ts}")
-
-    except Exception as e:
-        logger.error(f"❌ DBの参加者情報更新に失敗しました: {e}")
-
-def remove_participant_from_db(message_ts: str, emoji: str, user_id: str):
+    候補にあるスタンプのリアクションだけを参加者とし、DBの内容と同じであれば書き込まない。
     """
-    指定されたスタンプの参加者リストからユーザーを削除する
+    with team_context(schedule_index.team(message_ts) or current_team_id()):
+        return _reconcile_participants(message_ts, channel, priority)
+
+def _reconcile_participants(message_ts: str, channel: str, priority: bool = False) -> bool:
+    options = schedule_index.get_options(message_ts)
+    if options is None:
+        return False
+    # ためている差分を先に反映してから比較する
+    participant_buffer.flush(message_ts)
+    snapshot: dict = {}
+    for reaction, user_ids in fetch_reactions(get_slack_client(), channel, message_ts, priority).items():
+        emoji = f":{normalize_emoji(reaction)}:"
+        if emoji in options:
+            users = snapshot.setdefault(emoji, [])
+            users.extend(u for u in user_ids if u not in users)
+    schedule_index.set_tally(message_ts, count_votes(snapshot))
+    schedule_data = get_store().get_schedule(message_ts) or {}
+    current = schedule_data.get('participants') or {}
+    # DB との差分を追加・削除として反映する（他のワーカーが同じ差分を反映済みであれば変更にならない）
+    deltas = [("add", emoji, u) for emoji, users in snapshot.items() for u in users if u not in current.get(emoji, [])]
+    deltas += [("remove", emoji, u) for emoji, users in current.items() for u in users
+               if u not in snapshot.get(emoji, [])]
+    if not deltas or not write_participant_deltas(message_ts, deltas):
+        return False
+    logger.info(f"リアクションのスナップショットで参加者情報を更新しました: ts={message_ts}")
+    return True
+
+def record_vote(message_ts: str, channel: str, emoji: str, delta: int):
     """
-    try:
-        # DBから現在の参加者リストを取得
-        response = supabase.table('schedules').select('participants').eq('main_message_ts', message_ts).single().execute()
-        
-        if not response.data or not response.data.get('participants'):
-            logger.info(f"参加者削除対象のスケジュールまたは参加者リストが見つかりません: {message_ts}")
-            return
+    スタンプの参加者数をインデックスの集計に反映する
 
-        participants = response.data.get('participants')
+    チャンネルごとの集計値は、DB に書き込んで実際に変わった参加者数だけを write_participant_deltas で反映する。
+    """
+    schedule_index.add_vote(message_ts, emoji, delta)
 
-        # 参加者リストを更新
-        if emoji in participants and user_id in participants[emoji]:
-            participants[emoji].remove(user_id)
-            # もしそのスタンプの参加者が誰もいなくなったら、キーごと削除する
-            if not participants[emoji]:
-                del participants[emoji]
-            logger.info(f"参加者を削除: {user_id} -> {emoji}")
-        else:
-            logger.info(f"削除対象の参加者が見つかりません: {user_id} -> {emoji}")
-            return # 更新不要
+def record_decision(channel: str, message_ts: str, emoji: str):
+    """
+    決定を集計値に反映する（決定し直した場合は、決定したスタンプだけを付け替える）
+    """
+    previous = schedule_index.selected_emoji(message_ts)
+    if previous == emoji:
+        return
+    if previous is None:
+        rollups.add(channel, DECISIONS)
+        rollups.add(channel, DECISION_SECONDS, value=max(0.0, datetime.now(JST).timestamp() - float(message_ts)))
+    else:
+        rollups.add(channel, DECIDED_OPTIONS, previous, -1)
+    rollups.add(channel, DECIDED_OPTIONS, emoji)
 
-        # 更新した参加者リストをDBに保存
-        supabase.table('schedules').update({'participants': participants}).eq('main_message_ts', message_ts).execute()
-        logger.info(f"✅ DBの参加者情報を更新（削除）しました: ts={message_ts}")
+def write_participant_deltas(message_ts: str, deltas: list) -> bool:
+    """
+    ためておいた参加者の追加/削除をまとめてDBに反映する
 
-    except Exception as e:
-        logger.error(f"❌ DBの参加者情報更新（削除）に失敗しました: {e}")
\ No newline at end of file
+    DB の書き込みで変わった vote_counts だけを集計値に反映するため、複数のワーカーが同じ差分を
+    書き込んでも二重に数えない。変更があれば True を返す。
+    """
+    change = get_store().apply_participant_deltas(message_ts, deltas)
+    if not change:
+        return False
+    rollups.record_tally_change(change['channel_id'], change['before'], change['after'], team_id=change['team_id'])
+    logger.info(f"✅ DBの参加者情報を更新しました: ts={message_ts}, 差分{len(deltas)}件")
+    return True
+
+# リアクションの差分を短時間ためてまとめて書き込むバッファ（シャットダウン時に main.py から flush_all する）
+participant_buffer = ParticipantWriteBuffer(write_participant_deltas)
+# リアクションのスナップショットで参加者を書き直す対象の管理
+reaction_reconciler = ReactionReconciler(reconcile_participants)
+# ワークスペースごとの処理中のイベント数の制限
+team_limiter = TeamInflightLimiter(EVENT_TEAM_MAX_INFLIGHT)
+# 参加者数の集計による自動決定のルール（AUTO_CLOSE_MODE が off の場合は何もしない）
+auto_close_rules = AutoCloseRules()
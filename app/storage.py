@@ -0,0 +1,856 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+from .participant_buffer import count_votes
+from .metrics import InstrumentedStore
+
+logger = logging.getLogger(__name__)
+
+# 永続化先: "supabase"（既定）または "sqlite"（外部サービスなしで動かす場合）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+# SQLite のファイルパス（":memory:" でプロセス内のみ）
+SQLITE_PATH = os.getenv("SQLITE_PATH", "stamp_scheduler.db")
+
+# schedules_archive に移した理由（決定済みで予定日時を過ぎた / 決定されないまま放置された）
+ARCHIVE_DECIDED = "decided"
+ARCHIVE_ABANDONED = "abandoned"
+
+
+class ScheduleStore(ABC):
+    """
+    schedules テーブルなど、ボットの永続化データへのアクセスをまとめたインターフェース
+
+    participants は常に {":one:": ["U012A3BC4", ...]} の形で返す。
+    participants を書き込む際は、スタンプごとの参加者数 vote_counts（{":one:": 3, ...}）も同時に更新する。
+    """
+
+    @abstractmethod
+    def insert_schedule(self, row: dict):
+        """新しい候補日投稿を保存する"""
+
+    @abstractmethod
+    def get_schedule(self, message_ts: str) -> Optional[dict]:
+        """スケジュールの全カラムを取得する。存在しなければ None"""
+
+    @abstractmethod
+    def get_schedule_summary(self, message_ts: str) -> Optional[dict]:
+        """options, selected_emoji, channel_id, team_id, vote_counts だけを取得する。存在しなければ None"""
+
+    @abstractmethod
+    def iter_active_schedules(self, page_size: int) -> Iterator[list]:
+        """リマインド未送信のスケジュール（main_message_ts, options, selected_emoji, channel_id, team_id, vote_counts）をページ単位で返す"""
+
+    @abstractmethod
+    def iter_pending_reminders(self, page_size: int) -> Iterator[list]:
+        """リマインドを予約済みで未送信のスケジュール（main_message_ts, selected_datetime, reminder_at, reminder_job_id, reminder_lease_expires_at）をページ単位で返す"""
+
+    @abstractmethod
+    def iter_schedules(self, page_size: int, after: Optional[str] = None, team_id: Optional[str] = None) -> Iterator[list]:
+        """main_message_ts が after より後のスケジュールの全カラムを、main_message_ts の順にページ単位で返す（エクスポート用）"""
+
+    @abstractmethod
+    def get_schedules(self, message_ts_list: list) -> list:
+        """複数のスケジュールの全カラムをまとめて取得する"""
+
+    @abstractmethod
+    def get_reminder_recipients(self, message_ts_list: list) -> dict:
+        """複数のスケジュールの決定したスタンプの参加者をユーザーごとにまとめる（{user_id: [main_message_ts, ...]}）"""
+
+    @abstractmethod
+    def update_schedule(self, message_ts: str, fields: dict):
+        """指定したカラムを更新する"""
+
+    @abstractmethod
+    def claim_due_reminders(self, until: datetime, now: datetime, owner: str, lease_expires_at: datetime,
+                            limit: int) -> list:
+        """
+        reminder_at が until 以前の未送信のリマインドのリースを、reminder_at の早い順に最大 limit 件
+        owner として取得し、取得した main_message_ts を返す
+
+        他のワーカーがリースを持っていても、期限（now）を過ぎていれば停止したとみなして引き継ぐ。
+        """
+
+    @abstractmethod
+    def claim_reminder(self, message_ts: str, now: datetime, owner: str, lease_expires_at: datetime) -> bool:
+        """未送信のリマインド1件のリースを取得する。他のワーカーが有効なリースを持っていれば False"""
+
+    @abstractmethod
+    def update_leased_reminders(self, message_ts_list: list, owner: str, fields: dict) -> list:
+        """owner がリースを持っているスケジュールだけを更新し、更新できた main_message_ts を返す"""
+
+    @abstractmethod
+    def claim_auto_close(self, message_ts: str, action: str) -> bool:
+        """
+        未決定のスケジュールに自動決定の提案・決定（action）を記録する。
+        決定済みか、同じ action が記録済み（他のワーカーが行った）であれば False
+        """
+
+    @abstractmethod
+    def release_auto_close(self, message_ts: str, action: str):
+        """提案・決定に失敗した場合に、記録した action を取り消して他のワーカーが行えるようにする"""
+
+    @abstractmethod
+    def apply_participant_deltas(self, message_ts: str, deltas: list) -> Optional[dict]:
+        """
+        参加者の追加/削除（("add" | "remove", emoji, user_id)）を到着順に反映する
+
+        変更があれば、同じ書き込みの中で求めた vote_counts の変化（channel_id, team_id, before, after）を返し、
+        変更がないかスケジュールがなければ None を返す。
+        """
+
+    @abstractmethod
+    def archive_schedules(self, decided_before: Optional[datetime], abandoned_before: Optional[datetime],
+                          limit: int) -> list:
+        """
+        決定した日時が decided_before より前のスケジュールと、決定されないまま created_at が abandoned_before より前の
+        スケジュールを最大 limit 件 schedules_archive に移し、移した行（main_message_ts, reason, bytes, archived_bytes）を返す
+        """
+
+    @abstractmethod
+    def claim_event(self, event_id: str, expires_at: datetime) -> bool:
+        """イベントの受信を記録する。初めての event_id なら True、記録済みなら False"""
+
+    @abstractmethod
+    def release_event(self, event_id: str):
+        """イベントの受信記録を取り消す"""
+
+    @abstractmethod
+    def purge_events(self, before: datetime) -> int:
+        """期限切れのイベント受信記録を削除し、削除件数を返す"""
+
+    @abstractmethod
+    def get_installation(self, team_id: str) -> Optional[dict]:
+        """ワークスペースのインストール情報（team_id, team_name, bot_token, bot_user_id）を取得する。なければ None"""
+
+    @abstractmethod
+    def save_installation(self, installation: dict):
+        """ワークスペースのインストール情報を保存する（同じ team_id があれば上書きする）"""
+
+    @abstractmethod
+    def increment_rollups(self, rows: list):
+        """集計値（team_id, channel_id, metric, dimension, value）に value を加算する（なければ作成する）"""
+
+    @abstractmethod
+    def get_rollups(self, team_id: Optional[str] = None, channel_id: Optional[str] = None) -> list:
+        """集計値の行（team_id, channel_id, metric, dimension, value）を取得する"""
+
+
+class SupabaseStore(ScheduleStore):
+    """
+    Supabase の schedules テーブル（participants は JSONB）を使う実装
+    """
+    backend_name = "supabase"
+
+    def __init__(self, client=None):
+        if client is None:
+            from .clients import get_supabase
+            client = get_supabase()
+        self.client = client
+
+    def _table(self):
+        return self.client.table('schedules')
+
+    def insert_schedule(self, row: dict):
+        if 'participants' in row:
+            row = {'vote_counts': count_votes(row['participants'] or {}), **row}
+        self._table().insert(row).execute()
+
+    def get_schedule(self, message_ts: str) -> Optional[dict]:
+        response = self._table().select('*').eq('main_message_ts', message_ts).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def get_schedule_summary(self, message_ts: str) -> Optional[dict]:
+        response = self._table().select('options, selected_emoji, channel_id, team_id, vote_counts') \
+            .eq('main_message_ts', message_ts).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def iter_active_schedules(self, page_size: int) -> Iterator[list]:
+        last_ts = None
+        while True:
+            query = self._table().select('main_message_ts, options, selected_emoji, channel_id, team_id, vote_counts') \
+                .eq('is_reminder_sent', False).order('main_message_ts').limit(page_size)
+            if last_ts is not None:
+                query = query.gt('main_message_ts', last_ts)
+            rows = query.execute().data or []
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            last_ts = rows[-1]['main_message_ts']
+
+    def iter_pending_reminders(self, page_size: int) -> Iterator[list]:
+        last_ts = None
+        while True:
+            query = self._table().select('main_message_ts, selected_datetime, reminder_at, reminder_job_id, reminder_lease_expires_at') \
+                .eq('is_reminder_sent', False).not_.is_('reminder_job_id', 'null') \
+                .order('main_message_ts').limit(page_size)
+            if last_ts is not None:
+                query = query.gt('main_message_ts', last_ts)
+            rows = query.execute().data or []
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            last_ts = rows[-1]['main_message_ts']
+
+    # in フィルタは URL に入るため、1回のリクエストで指定する件数を抑える
+    IN_CHUNK_SIZE = 200
+
+    def iter_schedules(self, page_size: int, after: Optional[str] = None, team_id: Optional[str] = None) -> Iterator[list]:
+        last_ts = after
+        while True:
+            query = self._table().select('*').order('main_message_ts').limit(page_size)
+            if last_ts is not None:
+                query = query.gt('main_message_ts', last_ts)
+            if team_id is not None:
+                query = query.eq('team_id', team_id)
+            rows = query.execute().data or []
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            last_ts = rows[-1]['main_message_ts']
+
+    def _select_in(self, columns: str, message_ts_list: list) -> list:
+        rows = []
+        for start in range(0, len(message_ts_list), self.IN_CHUNK_SIZE):
+            chunk = message_ts_list[start:start + self.IN_CHUNK_SIZE]
+            rows.extend(self._table().select(columns).in_('main_message_ts', chunk).execute().data or [])
+        return rows
+
+    def get_schedules(self, message_ts_list: list) -> list:
+        return self._select_in('*', message_ts_list)
+
+    def get_reminder_recipients(self, message_ts_list: list) -> dict:
+        # participants は JSONB なので、決定したスタンプの参加者だけを取り出して反転する
+        recipients: dict = {}
+        for row in self._select_in('main_message_ts, selected_emoji, participants', message_ts_list):
+            for user_id in (row.get('participants') or {}).get(row.get('selected_emoji'), []):
+                recipients.setdefault(user_id, []).append(row['main_message_ts'])
+        return recipients
+
+    def update_schedule(self, message_ts: str, fields: dict):
+        if 'participants' in fields:
+            fields = {'vote_counts': count_votes(fields['participants'] or {}), **fields}
+        self._table().update(fields).eq('main_message_ts', message_ts).execute()
+
+    def _due_reminders_filter(self, query, until: datetime, now: datetime):
+        return query.eq('is_reminder_sent', False).not_.is_('reminder_job_id', 'null') \
+            .lte('reminder_at', until.isoformat()) \
+            .or_(f'reminder_lease_owner.is.null,reminder_lease_expires_at.lt."{now.isoformat()}"')
+
+    def claim_due_reminders(self, until: datetime, now: datetime, owner: str, lease_expires_at: datetime,
+                            limit: int) -> list:
+        # 件数を絞った候補を選び、同じ条件付きの UPDATE で取得するため、他のワーカーと同じ行を取り合わない
+        candidates = self._due_reminders_filter(self._table().select('main_message_ts'), until, now) \
+            .order('reminder_at').limit(limit).execute().data or []
+        message_ts_list = [row['main_message_ts'] for row in candidates]
+        claimed = []
+        for i in range(0, len(message_ts_list), self.IN_CHUNK_SIZE):
+            response = self._due_reminders_filter(self._table().update({
+                'reminder_lease_owner': owner,
+                'reminder_lease_expires_at': lease_expires_at.isoformat(),
+            }).in_('main_message_ts', message_ts_list[i:i + self.IN_CHUNK_SIZE]), until, now).execute()
+            claimed += [row['main_message_ts'] for row in response.data or []]
+        return claimed
+
+    def claim_reminder(self, message_ts: str, now: datetime, owner: str, lease_expires_at: datetime) -> bool:
+        response = self._table().update({
+            'reminder_lease_owner': owner,
+            'reminder_lease_expires_at': lease_expires_at.isoformat(),
+        }).eq('main_message_ts', message_ts).eq('is_reminder_sent', False) \
+            .or_(f'reminder_lease_owner.is.null,reminder_lease_owner.eq."{owner}",'
+                 f'reminder_lease_expires_at.lt."{now.isoformat()}"') \
+            .execute()
+        return bool(response.data)
+
+    def claim_auto_close(self, message_ts: str, action: str) -> bool:
+        response = self._table().update({'auto_close_action': action}) \
+            .eq('main_message_ts', message_ts).is_('selected_emoji', 'null') \
+            .or_(f'auto_close_action.is.null,auto_close_action.neq."{action}"') \
+            .execute()
+        return bool(response.data)
+
+    def release_auto_close(self, message_ts: str, action: str):
+        self._table().update({'auto_close_action': None}) \
+            .eq('main_message_ts', message_ts).eq('auto_close_action', action).execute()
+
+    def update_leased_reminders(self, message_ts_list: list, owner: str, fields: dict) -> list:
+        if not message_ts_list:
+            return []
+        # in フィルタは URL に入るため、IN_CHUNK_SIZE 件ずつ更新する
+        updated = []
+        for i in range(0, len(message_ts_list), self.IN_CHUNK_SIZE):
+            response = self._table().update(fields).in_('main_message_ts', message_ts_list[i:i + self.IN_CHUNK_SIZE]) \
+                .eq('reminder_lease_owner', owner).execute()
+            updated += [row['main_message_ts'] for row in response.data or []]
+        return updated
+
+    def apply_participant_deltas(self, message_ts: str, deltas: list) -> Optional[dict]:
+        # 読み込みと更新を別のリクエストにすると複数のプロセスの更新が失われるため、
+        # データベース関数で行をロックし、participants と vote_counts を1回で更新する
+        response = self.client.rpc('apply_participant_deltas', {
+            'target_ts': message_ts,
+            'deltas': [{'op': op, 'emoji': emoji, 'user_id': user_id} for op, emoji, user_id in deltas],
+        }).execute()
+        return response.data or None
+
+    def archive_schedules(self, decided_before: Optional[datetime], abandoned_before: Optional[datetime],
+                          limit: int) -> list:
+        rows = []
+        if decided_before is not None:
+            rows += [(row, ARCHIVE_DECIDED) for row in self._table().select('*')
+                     .lt('selected_datetime', decided_before.isoformat())
+                     .order('main_message_ts').limit(limit).execute().data or []]
+        if abandoned_before is not None and len(rows) < limit:
+            rows += [(row, ARCHIVE_ABANDONED) for row in self._table().select('*')
+                     .is_('selected_emoji', 'null').lt('created_at', abandoned_before.isoformat())
+                     .order('main_message_ts').limit(limit - len(rows)).execute().data or []]
+        if not rows:
+            return []
+        # アーカイブへの書き込みは upsert なので、削除の前に失敗しても次回にやり直せる
+        self.client.table('schedules_archive').upsert([{
+            'main_message_ts': row['main_message_ts'], 'team_id': row.get('team_id'),
+            'channel_id': row.get('channel_id'), 'reason': reason, 'created_at': row.get('created_at'), 'data': row,
+        } for row, reason in rows]).execute()
+        message_ts_list = [row['main_message_ts'] for row, _ in rows]
+        for i in range(0, len(message_ts_list), self.IN_CHUNK_SIZE):
+            self._table().delete().in_('main_message_ts', message_ts_list[i:i + self.IN_CHUNK_SIZE]).execute()
+        # jsonb はデータベース側で圧縮されるため、アーカイブの大きさは JSON のまま数える
+        moved = []
+        for row, reason in rows:
+            size = len(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+            moved.append({'main_message_ts': row['main_message_ts'], 'reason': reason, 'bytes': size,
+                          'archived_bytes': size})
+        return moved
+
+    def claim_event(self, event_id: str, expires_at: datetime) -> bool:
+        try:
+            self.client.table('slack_event_receipts').insert(
+                {'event_id': event_id, 'expires_at': expires_at.isoformat()}).execute()
+            return True
+        except Exception as e:
+            # 主キー重複（unique_violation）は受信済み
+            if getattr(e, 'code', None) == '23505':
+                return False
+            raise
+
+    def release_event(self, event_id: str):
+        self.client.table('slack_event_receipts').delete().eq('event_id', event_id).execute()
+
+    def purge_events(self, before: datetime) -> int:
+        response = self.client.table('slack_event_receipts').delete().lt('expires_at', before.isoformat()).execute()
+        return len(response.data or [])
+
+    def get_installation(self, team_id: str) -> Optional[dict]:
+        response = self.client.table('installations').select('*').eq('team_id', team_id).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def save_installation(self, installation: dict):
+        self.client.table('installations').upsert(installation).execute()
+
+    def increment_rollups(self, rows: list):
+        # 加算は PostgREST の upsert ではできないため、データベース関数で1回にまとめて行う
+        self.client.rpc('increment_schedule_rollups', {'rows': [
+            {'team_id': t, 'channel_id': c, 'metric': m, 'dimension': d, 'value': v} for t, c, m, d, v in rows
+        ]}).execute()
+
+    def get_rollups(self, team_id: Optional[str] = None, channel_id: Optional[str] = None) -> list:
+        query = self.client.table('schedule_rollups').select('team_id, channel_id, metric, dimension, value')
+        if team_id is not None:
+            query = query.eq('team_id', team_id)
+        if channel_id is not None:
+            query = query.eq('channel_id', channel_id)
+        return query.execute().data or []
+
+
+class SQLiteStore(ScheduleStore):
+    """
+    SQLite を使うローカル実装
+
+    参加表明は (main_message_ts, emoji, user_id) の正規化したテーブルに持ち、
+    追加・削除は1行の INSERT / DELETE で済ませる。participants は読み込み時に組み立てる。
+    """
+    backend_name = "sqlite"
+
+    # JSON 文字列として保存するカラム
+    JSON_COLUMNS = {'options', 'reminder_deliveries', 'vote_counts'}
+    BOOL_COLUMNS = {'is_reminder_sent'}
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS schedules (
+        main_message_ts TEXT PRIMARY KEY,
+        channel_id TEXT,
+        team_id TEXT,
+        options TEXT NOT NULL DEFAULT '{}',
+        selected_emoji TEXT,
+        selected_datetime TEXT,
+        reminder_job_id TEXT,
+        reminder_at TEXT,
+        reminder_lease_owner TEXT,
+        reminder_lease_expires_at TEXT,
+        is_reminder_sent INTEGER NOT NULL DEFAULT 0,
+        reminder_deliveries TEXT NOT NULL DEFAULT '{}',
+        vote_counts TEXT NOT NULL DEFAULT '{}',
+        auto_close_action TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE TABLE IF NOT EXISTS votes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        main_message_ts TEXT NOT NULL REFERENCES schedules(main_message_ts) ON DELETE CASCADE,
+        emoji TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        UNIQUE (main_message_ts, emoji, user_id)
+    );
+    CREATE INDEX IF NOT EXISTS schedules_active_idx ON schedules (is_reminder_sent, main_message_ts);
+    CREATE TABLE IF NOT EXISTS slack_event_receipts (
+        event_id TEXT PRIMARY KEY,
+        expires_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS schedules_archive (
+        main_message_ts TEXT PRIMARY KEY,
+        team_id TEXT,
+        channel_id TEXT,
+        reason TEXT NOT NULL,
+        created_at TEXT,
+        archived_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+        data BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS schedule_rollups (
+        team_id TEXT NOT NULL DEFAULT '',
+        channel_id TEXT NOT NULL DEFAULT '',
+        metric TEXT NOT NULL,
+        dimension TEXT NOT NULL DEFAULT '',
+        value REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (team_id, channel_id, metric, dimension)
+    );
+    CREATE TABLE IF NOT EXISTS installations (
+        team_id TEXT PRIMARY KEY,
+        team_name TEXT,
+        bot_token TEXT NOT NULL,
+        bot_user_id TEXT,
+        installed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    """
+
+    # 既存のデータベースファイルに後から追加したカラム（テーブル, カラム, 定義）
+    MIGRATIONS = (
+        ('schedules', 'reminder_at', 'TEXT'),
+        ('schedules', 'reminder_lease_owner', 'TEXT'),
+        ('schedules', 'reminder_lease_expires_at', 'TEXT'),
+        ('schedules', 'vote_counts', "TEXT NOT NULL DEFAULT '{}'"),
+        ('schedules', 'team_id', 'TEXT'),
+        ('schedules', 'auto_close_action', 'TEXT'),
+    )
+    # 追加したカラムを使うインデックス（マイグレーションの後に作成する）
+    INDEXES = """
+    CREATE INDEX IF NOT EXISTS schedules_reminder_due_idx ON schedules (is_reminder_sent, reminder_at);
+    """
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(self.SCHEMA)
+            self._migrate()
+            self._conn.executescript(self.INDEXES)
+
+    def _migrate(self):
+        for table, column, definition in self.MIGRATIONS:
+            columns = {row['name'] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                logger.info(f"SQLite のテーブルにカラムを追加しました: {table}.{column}")
+
+    @contextmanager
+    def _transaction(self):
+        # 複数プロセスで同じファイルを使う場合に、読み込み後の書き込みで競合しないよう最初に書き込みロックを取る
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _decode(self, row: sqlite3.Row) -> dict:
+        data = dict(row)
+        for column in self.JSON_COLUMNS & data.keys():
+            data[column] = json.loads(data[column]) if data[column] else {}
+        for column in self.BOOL_COLUMNS & data.keys():
+            data[column] = bool(data[column])
+        return data
+
+    def _encode(self, fields: dict) -> dict:
+        encoded = {}
+        for column, value in fields.items():
+            if column in self.JSON_COLUMNS:
+                value = json.dumps(value, ensure_ascii=False)
+            elif column in self.BOOL_COLUMNS:
+                value = int(bool(value))
+            encoded[column] = value
+        return encoded
+
+    def _placeholders(self, values: list) -> str:
+        return ", ".join("?" for _ in values)
+
+    def _participants(self, message_ts: str) -> dict:
+        participants: dict = {}
+        rows = self._conn.execute(
+            "SELECT emoji, user_id FROM votes WHERE main_message_ts = ? ORDER BY seq", (message_ts,))
+        for row in rows:
+            participants.setdefault(row['emoji'], []).append(row['user_id'])
+        return participants
+
+    def _update_vote_counts(self, message_ts: str):
+        # votes の集計で vote_counts を書き直す（participants を書き込むトランザクションの中で呼ぶ）
+        self._conn.execute(
+            "UPDATE schedules SET vote_counts = (SELECT COALESCE(json_group_object(emoji, n), '{}') FROM "
+            "(SELECT emoji, COUNT(*) AS n FROM votes WHERE main_message_ts = ? GROUP BY emoji)) "
+            "WHERE main_message_ts = ?", (message_ts, message_ts))
+
+    def insert_schedule(self, row: dict):
+        participants = row.get('participants') or {}
+        fields = self._encode({k: v for k, v in row.items() if k not in ('participants', 'vote_counts')})
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        with self._transaction():
+            self._conn.execute(f"INSERT INTO schedules ({columns}) VALUES ({placeholders})", tuple(fields.values()))
+            for emoji, user_ids in participants.items():
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO votes (main_message_ts, emoji, user_id) VALUES (?, ?, ?)",
+                    [(row['main_message_ts'], emoji, u) for u in user_ids])
+            if participants:
+                self._update_vote_counts(row['main_message_ts'])
+
+    def get_schedule(self, message_ts: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM schedules WHERE main_message_ts = ?", (message_ts,)).fetchone()
+            if row is None:
+                return None
+            data = self._decode(row)
+            data['participants'] = self._participants(message_ts)
+        return data
+
+    def get_schedule_summary(self, message_ts: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT options, selected_emoji, channel_id, team_id, vote_counts FROM schedules "
+                "WHERE main_message_ts = ?",
+                (message_ts,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def iter_active_schedules(self, page_size: int) -> Iterator[list]:
+        last_ts = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT main_message_ts, options, selected_emoji, channel_id, team_id, vote_counts FROM schedules "
+                    "WHERE is_reminder_sent = 0 AND main_message_ts > ? ORDER BY main_message_ts LIMIT ?",
+                    (last_ts, page_size)).fetchall()
+            rows = [self._decode(r) for r in rows]
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            last_ts = rows[-1]['main_message_ts']
+
+    def iter_pending_reminders(self, page_size: int) -> Iterator[list]:
+        last_ts = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT main_message_ts, selected_datetime, reminder_at, reminder_job_id, reminder_lease_expires_at FROM schedules "
+                    "WHERE is_reminder_sent = 0 AND reminder_job_id IS NOT NULL AND main_message_ts > ? "
+                    "ORDER BY main_message_ts LIMIT ?",
+                    (last_ts, page_size)).fetchall()
+            rows = [dict(r) for r in rows]
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            last_ts = rows[-1]['main_message_ts']
+
+    def iter_schedules(self, page_size: int, after: Optional[str] = None, team_id: Optional[str] = None) -> Iterator[list]:
+        last_ts = after or ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM schedules WHERE main_message_ts > ? AND (? IS NULL OR team_id = ?) "
+                    "ORDER BY main_message_ts LIMIT ?", (last_ts, team_id, team_id, page_size)).fetchall()
+                schedules = {row['main_message_ts']: {**self._decode(row), 'participants': {}} for row in rows}
+                if schedules:
+                    votes = self._conn.execute(
+                        f"SELECT main_message_ts, emoji, user_id FROM votes WHERE main_message_ts IN "
+                        f"({self._placeholders(list(schedules))}) ORDER BY seq", list(schedules)).fetchall()
+                    for vote in votes:
+                        schedules[vote['main_message_ts']]['participants'].setdefault(vote['emoji'], []).append(
+                            vote['user_id'])
+            if schedules:
+                yield list(schedules.values())
+            if len(rows) < page_size:
+                return
+            last_ts = rows[-1]['main_message_ts']
+
+    def get_schedules(self, message_ts_list: list) -> list:
+        schedules = {}
+        for start in range(0, len(message_ts_list), 500):
+            chunk = message_ts_list[start:start + 500]
+            placeholders = self._placeholders(chunk)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT * FROM schedules WHERE main_message_ts IN ({placeholders})", chunk).fetchall()
+                votes = self._conn.execute(
+                    f"SELECT main_message_ts, emoji, user_id FROM votes WHERE main_message_ts IN ({placeholders}) "
+                    "ORDER BY seq", chunk).fetchall()
+            for row in rows:
+                schedules[row['main_message_ts']] = {**self._decode(row), 'participants': {}}
+            for vote in votes:
+                schedules[vote['main_message_ts']]['participants'].setdefault(vote['emoji'], []).append(vote['user_id'])
+        return list(schedules.values())
+
+    def get_reminder_recipients(self, message_ts_list: list) -> dict:
+        recipients: dict = {}
+        for start in range(0, len(message_ts_list), 500):
+            chunk = message_ts_list[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT v.user_id, v.main_message_ts FROM votes v "
+                    "JOIN schedules s ON s.main_message_ts = v.main_message_ts AND s.selected_emoji = v.emoji "
+                    f"WHERE v.main_message_ts IN ({self._placeholders(chunk)}) ORDER BY v.user_id, v.seq",
+                    chunk).fetchall()
+            for row in rows:
+                recipients.setdefault(row['user_id'], []).append(row['main_message_ts'])
+        return recipients
+
+    def update_schedule(self, message_ts: str, fields: dict):
+        fields = dict(fields)
+        participants = fields.pop('participants', None)
+        if participants is not None:
+            fields.pop('vote_counts', None)
+        encoded = self._encode(fields)
+        with self._transaction():
+            if encoded:
+                assignments = ", ".join(f"{column} = ?" for column in encoded)
+                self._conn.execute(f"UPDATE schedules SET {assignments} WHERE main_message_ts = ?",
+                                   (*encoded.values(), message_ts))
+            if participants is not None:
+                # participants を丸ごと置き換える（互換用）
+                self._conn.execute("DELETE FROM votes WHERE main_message_ts = ?", (message_ts,))
+                for emoji, user_ids in participants.items():
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO votes (main_message_ts, emoji, user_id) VALUES (?, ?, ?)",
+                        [(message_ts, emoji, u) for u in user_ids])
+                self._update_vote_counts(message_ts)
+
+    def apply_participant_deltas(self, message_ts: str, deltas: list) -> Optional[dict]:
+        changed = False
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT channel_id, team_id, vote_counts FROM schedules WHERE main_message_ts = ?",
+                (message_ts,)).fetchone()
+            if row is None:
+                return None
+            for op, emoji, user_id in deltas:
+                if op == "add":
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO votes (main_message_ts, emoji, user_id) "
+                        "SELECT main_message_ts, ?, ? FROM schedules WHERE main_message_ts = ?",
+                        (emoji, user_id, message_ts))
+                else:
+                    cursor = self._conn.execute(
+                        "DELETE FROM votes WHERE main_message_ts = ? AND emoji = ? AND user_id = ?",
+                        (message_ts, emoji, user_id))
+                changed = changed or cursor.rowcount > 0
+            if not changed:
+                return None
+            self._update_vote_counts(message_ts)
+            after = self._conn.execute(
+                "SELECT vote_counts FROM schedules WHERE main_message_ts = ?", (message_ts,)).fetchone()
+        return {'channel_id': row['channel_id'], 'team_id': row['team_id'],
+                'before': json.loads(row['vote_counts'] or '{}'), 'after': json.loads(after['vote_counts'] or '{}')}
+
+    def claim_due_reminders(self, until: datetime, now: datetime, owner: str, lease_expires_at: datetime,
+                            limit: int) -> list:
+        with self._transaction():
+            rows = self._conn.execute(
+                "SELECT main_message_ts FROM schedules "
+                "WHERE is_reminder_sent = 0 AND reminder_job_id IS NOT NULL AND reminder_at <= ? "
+                "AND (reminder_lease_owner IS NULL OR reminder_lease_expires_at < ?) "
+                "ORDER BY reminder_at LIMIT ?",
+                (until.isoformat(), now.isoformat(), limit)).fetchall()
+            claimed = [row['main_message_ts'] for row in rows]
+            for start in range(0, len(claimed), 500):
+                chunk = claimed[start:start + 500]
+                self._conn.execute(
+                    "UPDATE schedules SET reminder_lease_owner = ?, reminder_lease_expires_at = ? "
+                    f"WHERE main_message_ts IN ({self._placeholders(chunk)})",
+                    (owner, lease_expires_at.isoformat(), *chunk))
+        return claimed
+
+    def claim_reminder(self, message_ts: str, now: datetime, owner: str, lease_expires_at: datetime) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE schedules SET reminder_lease_owner = ?, reminder_lease_expires_at = ? "
+                "WHERE main_message_ts = ? AND is_reminder_sent = 0 "
+                "AND (reminder_lease_owner IS NULL OR reminder_lease_owner = ? OR reminder_lease_expires_at < ?)",
+                (owner, lease_expires_at.isoformat(), message_ts, owner, now.isoformat()))
+        return cursor.rowcount > 0
+
+    def claim_auto_close(self, message_ts: str, action: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE schedules SET auto_close_action = ? WHERE main_message_ts = ? AND selected_emoji IS NULL "
+                "AND (auto_close_action IS NULL OR auto_close_action != ?)", (action, message_ts, action))
+        return cursor.rowcount > 0
+
+    def release_auto_close(self, message_ts: str, action: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE schedules SET auto_close_action = NULL WHERE main_message_ts = ? AND auto_close_action = ?",
+                (message_ts, action))
+
+    def update_leased_reminders(self, message_ts_list: list, owner: str, fields: dict) -> list:
+        encoded = self._encode(fields)
+        assignments = ", ".join(f"{column} = ?" for column in encoded)
+        updated = []
+        with self._transaction():
+            for start in range(0, len(message_ts_list), 500):
+                chunk = message_ts_list[start:start + 500]
+                placeholders = self._placeholders(chunk)
+                rows = self._conn.execute(
+                    f"SELECT main_message_ts FROM schedules WHERE main_message_ts IN ({placeholders}) "
+                    "AND reminder_lease_owner = ?", (*chunk, owner)).fetchall()
+                held = [row['main_message_ts'] for row in rows]
+                if held:
+                    self._conn.execute(
+                        f"UPDATE schedules SET {assignments} WHERE main_message_ts IN ({self._placeholders(held)})",
+                        (*encoded.values(), *held))
+                updated.extend(held)
+        return updated
+
+    def archive_schedules(self, decided_before: Optional[datetime], abandoned_before: Optional[datetime],
+                          limit: int) -> list:
+        decided = decided_before.isoformat() if decided_before else None
+        abandoned = abandoned_before.isoformat() if abandoned_before else None
+        moved = []
+        with self._transaction():
+            # タイムゾーン付きの ISO 形式の文字列を datetime() で UTC に揃えて比べる
+            rows = self._conn.execute(
+                "SELECT * FROM schedules WHERE "
+                "(? IS NOT NULL AND selected_datetime IS NOT NULL AND datetime(selected_datetime) < datetime(?)) OR "
+                "(? IS NOT NULL AND selected_emoji IS NULL AND datetime(created_at) < datetime(?)) "
+                "ORDER BY main_message_ts LIMIT ?", (decided, decided, abandoned, abandoned, limit)).fetchall()
+            for row in rows:
+                data = self._decode(row)
+                data['participants'] = self._participants(data['main_message_ts'])
+                reason = ARCHIVE_ABANDONED if data.get('selected_emoji') is None else ARCHIVE_DECIDED
+                # participants を含む全カラムを1つの JSON にまとめ、zlib で圧縮して保存する
+                raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+                payload = zlib.compress(raw, 9)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO schedules_archive (main_message_ts, team_id, channel_id, reason, "
+                    "created_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (data['main_message_ts'], data.get('team_id'), data.get('channel_id'), reason,
+                     data.get('created_at'), payload))
+                moved.append({'main_message_ts': data['main_message_ts'], 'reason': reason, 'bytes': len(raw),
+                              'archived_bytes': len(payload)})
+            if moved:
+                # votes は外部キーの ON DELETE CASCADE で一緒に削除される
+                message_ts_list = [m['main_message_ts'] for m in moved]
+                self._conn.execute(
+                    f"DELETE FROM schedules WHERE main_message_ts IN ({self._placeholders(message_ts_list)})",
+                    message_ts_list)
+        return moved
+
+    def claim_event(self, event_id: str, expires_at: datetime) -> bool:
+        now = datetime.now(expires_at.tzinfo).isoformat()
+        with self._transaction():
+            self._conn.execute(
+                "DELETE FROM slack_event_receipts WHERE event_id = ? AND expires_at < ?", (event_id, now))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO slack_event_receipts (event_id, expires_at) VALUES (?, ?)",
+                (event_id, expires_at.isoformat()))
+        return cursor.rowcount > 0
+
+    def release_event(self, event_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM slack_event_receipts WHERE event_id = ?", (event_id,))
+
+    def purge_events(self, before: datetime) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM slack_event_receipts WHERE expires_at < ?", (before.isoformat(),))
+        return cursor.rowcount
+
+    def get_installation(self, team_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM installations WHERE team_id = ?", (team_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def increment_rollups(self, rows: list):
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT INTO schedule_rollups (team_id, channel_id, metric, dimension, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(team_id, channel_id, metric, dimension) DO UPDATE SET value = value + excluded.value",
+                rows)
+
+    def get_rollups(self, team_id: Optional[str] = None, channel_id: Optional[str] = None) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT team_id, channel_id, metric, dimension, value FROM schedule_rollups "
+                "WHERE (? IS NULL OR team_id = ?) AND (? IS NULL OR channel_id = ?)",
+                (team_id, team_id, channel_id, channel_id)).fetchall()
+        return [dict(r) for r in rows]
+
+    def save_installation(self, installation: dict):
+        columns = ", ".join(installation)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in installation if column != 'team_id')
+        with self._transaction():
+            self._conn.execute(
+                f"INSERT INTO installations ({columns}) VALUES ({self._placeholders(list(installation))}) "
+                f"ON CONFLICT(team_id) DO UPDATE SET {updates}", tuple(installation.values()))
+
+
+_store: Optional[ScheduleStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ScheduleStore:
+    """
+    STORAGE_BACKEND に応じたストアを返す（初回呼び出し時に作成する）
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if STORAGE_BACKEND == "sqlite":
+                    store = SQLiteStore()
+                    logger.info(f"SQLite ストアを使用します: {store.path}")
+                else:
+                    store = SupabaseStore()
+                # 各メソッドの所要時間とエラー数を記録する
+                _store = InstrumentedStore(store, store.backend_name)
+    return _store
+
+
+def set_store(store: ScheduleStore):
+    """
+    使用するストアを差し替える（ベンチマークやローカル実行用）
+    """
+    global _store
+    _store = InstrumentedStore(store, getattr(store, 'backend_name', type(store).__name__))
@@ -0,0 +1,231 @@
+"""
+候補日テキスト解析のマイクロベンチマーク
+
+正解データ（datetime_corpus.py）と旧実装との差分を検証したうえで、
+30件以上の候補日を含む投稿の解析時間を旧実装と比較する。
+
+    python -m benchmarks.bench_datetime_parser [--repeat 200] [--fuzz 20000]
+"""
+import argparse
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from app.datetime_parser import (
+    JST, parse_datetime_text, parse_option_lines, resolve_datetime, parse_cache_info, _parse_normalized,
+)
+from .datetime_corpus import CORPUS, NOW
+
+
+# --- 旧実装（比較用にそのまま保持） -------------------------------------------
+
+def legacy_clean_datetime_text(text):
+    text = text.replace('：', ':')
+    text = text.translate(str.maketrans('１２３４５６７８９０', '1234567890'))
+    text = re.sub(r'（[月火水木金土日]）', '', text)
+    text = re.sub(r'\([月火水木金土日]\)', '', text)
+    text = re.sub(r'[月火水木金土日]曜日', '', text)
+    text = re.sub(r'[ぁ-ん]', '', text)
+    m = re.search(r'(\d{1,2})[月/](\d{1,2})日?', text)
+    date_part = f"{m.group(1)}/{m.group(2)}" if m else ''
+    time_part = ''
+    t = re.search(r'(\d{1,2})時半', text)
+    if t:
+        time_part = f"{t.group(1)}:30"
+    else:
+        t = re.search(r'(\d{1,2})時(\d{1,2})分', text)
+        if t:
+            time_part = f"{t.group(1)}:{t.group(2).zfill(2)}"
+        else:
+            t = re.search(r'(\d{1,2})時', text)
+            if t:
+                time_part = f"{t.group(1)}:00"
+            else:
+                t = re.search(r'(\d{1,2}):(\d{2})', text)
+                if t:
+                    time_part = f"{t.group(1)}:{t.group(2)}"
+    if date_part and time_part:
+        return f"{date_part} {time_part}"
+    elif date_part:
+        return date_part
+    elif time_part:
+        return time_part
+    else:
+        return text.strip()
+
+
+def legacy_extract_datetime(text, now):
+    cleaned_text = legacy_clean_datetime_text(text)
+    date_patterns = [
+        r'(\d{1,2})/(\d{1,2})',
+        r'(\d{4})/(\d{1,2})/(\d{1,2})',
+        r'(\d{1,2})月(\d{1,2})日',
+        r'(\d{4})年(\d{1,2})月(\d{1,2})日',
+    ]
+    time_patterns = [
+        r'(\d{1,2}):(\d{2})',
+        r'(\d{1,2})時(\d{1,2})分',
+        r'(\d{1,2})時半',
+        r'(\d{1,2})時',
+    ]
+    date_match = None
+    time_match = None
+    for pattern in date_patterns:
+        date_match = re.search(pattern, cleaned_text)
+        if date_match:
+            break
+    for pattern in time_patterns:
+        time_match = re.search(pattern, cleaned_text)
+        if time_match:
+            break
+    year, month, day = now.year, now.month, now.day
+    hour, minute = 0, 0
+    if date_match:
+        if len(date_match.groups()) == 2:
+            month = int(date_match.group(1))
+            day = int(date_match.group(2))
+        else:
+            year = int(date_match.group(1))
+            month = int(date_match.group(2))
+            day = int(date_match.group(3))
+    if time_match:
+        if len(time_match.groups()) == 2:
+            hour = int(time_match.group(1))
+            minute = int(time_match.group(2))
+        else:
+            hour = int(time_match.group(1))
+            if '半' in time_match.group(0):
+                minute = 30
+    try:
+        naive_dt = datetime(year, month, day, hour, minute)
+        dt = JST.localize(naive_dt)
+        if dt < now:
+            dt = dt.replace(year=dt.year + 1)
+        return dt
+    except ValueError:
+        return None
+
+
+def legacy_extract_datetime_options(text, now):
+    options = {}
+    for line in text.split('\n'):
+        match = re.search(r':(\w+):\s*(?:[:：]\s*)?(.+)', line)
+        if match:
+            emoji, datetime_str = match.groups()
+            cleaned_str = legacy_clean_datetime_text(datetime_str)
+            dt = legacy_extract_datetime(cleaned_str, now)
+            if dt:
+                options[f":{emoji}:"] = dt
+    return options
+
+
+def extract_datetime_options(text, now):
+    options = {}
+    for emoji, _, parsed in parse_option_lines(text):
+        dt = resolve_datetime(parsed, now)
+        if dt:
+            options[f":{emoji}:"] = dt
+    return options
+
+
+# --- 検証 ---------------------------------------------------------------------
+
+def _as_tuple(dt):
+    return None if dt is None else (dt.year, dt.month, dt.day, dt.hour, dt.minute)
+
+
+def check_corpus() -> int:
+    failures = 0
+    for text, expected_text, expected_dt in CORPUS:
+        parsed = parse_datetime_text(text)
+        actual_dt = _as_tuple(resolve_datetime(parsed, NOW))
+        legacy_dt = _as_tuple(legacy_extract_datetime(text, NOW))
+        if parsed.text != expected_text or actual_dt != expected_dt or legacy_dt != expected_dt:
+            failures += 1
+            print(f"NG {text!r}: text={parsed.text!r} (期待値 {expected_text!r}), "
+                  f"dt={actual_dt} (期待値 {expected_dt}, 旧実装 {legacy_dt})")
+    print(f"正解データ: {len(CORPUS) - failures}/{len(CORPUS)} 件一致")
+    return failures
+
+
+def check_fuzz(count: int, seed: int = 0) -> int:
+    """
+    候補日に現れる文字をランダムに並べ、旧実装と結果が一致するかを確かめる
+    """
+    rng = random.Random(seed)
+    alphabet = list('0123456789１２３４:：/ 月火水木金土日曜時半分（）()のからご') + ['午前', '〜']
+    failures = 0
+    for _ in range(count):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 16)))
+        parsed = parse_datetime_text(text)
+        expected_text = legacy_clean_datetime_text(text)
+        actual_dt = _as_tuple(resolve_datetime(parsed, NOW))
+        legacy_dt = _as_tuple(legacy_extract_datetime(expected_text, NOW))
+        if parsed.text != expected_text or actual_dt != legacy_dt:
+            failures += 1
+            if failures <= 10:
+                print(f"NG {text!r}: {parsed.text!r} / 旧実装 {expected_text!r}, {actual_dt} / {legacy_dt}")
+    print(f"ランダム入力: {count - failures}/{count} 件が旧実装と一致")
+    return failures
+
+
+# --- 計測 ---------------------------------------------------------------------
+
+def build_message(days: int = 31) -> str:
+    """
+    1か月分の候補日（曜日・全角数字・時半などを混在）を含む投稿を作る
+    """
+    weekdays = '月火水木金土日'
+    start = datetime(2026, 5, 1)
+    lines = ["<@U0BOT> 来月の定例の候補日です"]
+    for i in range(days):
+        d = start + timedelta(days=i)
+        wd = weekdays[d.weekday()]
+        variants = [
+            f"{d.month}/{d.day}({wd}) 10:00〜",
+            f"{d.month}月{d.day}日（{wd}）14時半から",
+            f"{d.month}/{d.day} {wd}曜日 １８：３０",
+            f"{d.month}月{d.day}日 9時15分",
+        ]
+        lines.append(f":emoji{i}: {variants[i % len(variants)]}")
+    lines.append("スタンプで出欠お願いします！")
+    return '\n'.join(lines)
+
+
+def bench(label: str, func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<28} {elapsed * 1e6:10.1f} us/投稿")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--fuzz", type=int, default=20000)
+    args = parser.parse_args()
+
+    failures = check_corpus() + check_fuzz(args.fuzz)
+    if failures:
+        raise SystemExit(1)
+
+    message = build_message()
+    now = datetime.now(JST)
+    assert legacy_extract_datetime_options(message, now) == extract_datetime_options(message, now)
+    print(f"\n{message.count(chr(10)) - 1} 件の候補日を含む投稿の解析時間")
+
+    legacy = bench("旧実装", lambda: legacy_extract_datetime_options(message, now), args.repeat)
+
+    def cold():
+        _parse_normalized.cache_clear()
+        extract_datetime_options(message, now)
+    new_cold = bench("新実装（キャッシュなし）", cold, args.repeat)
+    new_warm = bench("新実装（キャッシュあり）", lambda: extract_datetime_options(message, now), args.repeat)
+    print(f"\n速度比: キャッシュなし {legacy / new_cold:.1f}x, キャッシュあり {legacy / new_warm:.1f}x")
+    print(f"キャッシュ: {parse_cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+リマインドのまとめ送信（REMINDER_DIGEST_WINDOW）による Slack 呼び出し回数の比較
+
+同じ時間帯に送信予定のリマインドを持つスケジュールと、複数のスケジュールに参加するユーザーを用意し、
+sweep 方式で1件ずつ送信した場合と参加者ごとにまとめた場合の chat.postMessage の回数と所要時間を比べる。
+
+    python -m benchmarks.bench_digest --schedules 200 --users 500 --votes-per-user 4
+"""
+import os
+
+# 実際のクライアントを作らせないためのダミー値（app を import する前に設定する）
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from .fakes import CallCounter, FakeSlackClient, FakeSupabase
+
+
+def seed(store, args, rng: random.Random):
+    """
+    window 内に送信予定のリマインドを持つ決定済みスケジュールを作る
+    """
+    from app.datetime_parser import JST
+
+    now = datetime.now(JST)
+    participants = {i: [] for i in range(args.schedules)}
+    for u in range(args.users):
+        for i in rng.sample(range(args.schedules), min(args.votes_per_user, args.schedules)):
+            participants[i].append(f"U{u:05d}")
+    for i in range(args.schedules):
+        reminder_at = now + timedelta(seconds=rng.uniform(0, args.window))
+        event_at = reminder_at + timedelta(days=1)
+        ts = f"{1700000000 + i}.000100"
+        store.insert_schedule({
+            'main_message_ts': ts,
+            'channel_id': 'C0BENCH',
+            'options': {':one:': event_at.isoformat()},
+            'participants': {':one:': participants[i]},
+            'selected_emoji': ':one:',
+            'selected_datetime': event_at.isoformat(),
+            'reminder_at': reminder_at.isoformat(),
+            'reminder_job_id': f"reminder_{ts}_one",
+        })
+
+
+def run(args, digest: bool) -> dict:
+    from app import slack_events, fanout
+    from app.clients import set_slack_client
+    from app.storage import SupabaseStore, SQLiteStore, set_store
+
+    counter = CallCounter()
+    if args.storage == "sqlite":
+        store = SQLiteStore(":memory:")
+    else:
+        store = SupabaseStore(FakeSupabase(CallCounter()))
+    seed(store, args, random.Random(args.seed))
+    set_store(store)
+    set_slack_client(FakeSlackClient(counter, args.slack_latency_ms / 1000))
+    slack_events.REMINDER_DIGEST_WINDOW = args.window if digest else 0
+    # レート制限で待たないようにする（呼び出し回数だけを比べる）
+    fanout._buckets.clear()
+    fanout.SLACK_METHOD_LIMITS["chat.postMessage"] = (1e9, 1e9)
+
+    start = time.perf_counter()
+    sent = slack_events.sweep_reminders(lookahead=args.window)
+    elapsed = time.perf_counter() - start
+    return {
+        "sent": sent,
+        "post_message": sum(n for (_, kind, name), n in counter.counts.items()
+                            if kind == "slack" and name == "chat.postMessage"),
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schedules", type=int, default=200, help="送信予定のリマインドを持つスケジュール数")
+    parser.add_argument("--users", type=int, default=500, help="参加者の数")
+    parser.add_argument("--votes-per-user", type=int, default=4, help="1人が参加するスケジュール数")
+    parser.add_argument("--window", type=float, default=3600, help="まとめる時間幅（秒）")
+    parser.add_argument("--storage", choices=["supabase", "sqlite"], default="sqlite",
+                        help="ストア（supabase はインメモリの代替実装）")
+    parser.add_argument("--slack-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    individual = run(args, digest=False)
+    digest = run(args, digest=True)
+    print(f"{'方式':<10} {'送信済み':>8} {'postMessage':>12} {'所要時間(秒)':>12}")
+    for name, r in (("個別", individual), ("まとめ", digest)):
+        print(f"{name:<10} {r['sent']:>8} {r['post_message']:>12} {r['seconds']:>12.2f}")
+    if individual["post_message"]:
+        print(f"Slack 呼び出しの削減率: {1 - digest['post_message'] / individual['post_message']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+/slack/events の負荷試験・レイテンシ計測
+
+合成した Slack イベント（候補日投稿・リアクションの集中・スレッドでの決定）を
+プロセス内の FastAPI アプリに送り、Slack Web API と Supabase は遅延を指定できる代替実装に差し替えて、
+イベント種別ごとの応答・処理レイテンシ（p50/p95/p99）、スループット、DB / Slack の呼び出し回数を集計する。
+
+    python -m benchmarks.bench_events --posts 20 --reactions 2000 --db-latency-ms 30 --output before.json
+    python -m benchmarks.bench_events --compare before.json after.json
+"""
+import os
+
+# 実際のクライアントを作らせないためのダミー値（app を import する前に設定する）
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+import httpx
+from .fakes import CallCounter, CountingStore, FakeSlackClient, FakeSupabase, current_event_type
+
+EMOJIS = ["one", "two", "three", "four", "five"]
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def install_fakes(storage: str, db_latency: float, slack_latency: float):
+    """
+    アプリが参照している Slack クライアントとストアを代替実装に差し替える
+    """
+    from app.clients import set_slack_client
+    from app.storage import SupabaseStore, SQLiteStore, set_store
+
+    counter = CallCounter()
+    if storage == "sqlite":
+        # 正規化した投票テーブルを持つ SQLite ストアをメモリ上で使い、呼び出し単位で遅延を入れる
+        set_store(CountingStore(SQLiteStore(":memory:"), counter, db_latency))
+    else:
+        set_store(SupabaseStore(FakeSupabase(counter, db_latency)))
+    set_slack_client(FakeSlackClient(counter, slack_latency))
+    return counter
+
+
+# --- イベント生成 -------------------------------------------------------------
+
+def _envelope(event: dict, label: str, seq: int) -> dict:
+    return {
+        "type": "event_callback",
+        "team_id": "T0BENCH",
+        "event_id": f"Ev{seq:08d}",
+        "event_time": int(time.time()),
+        "event": event,
+        # 集計用（アプリ側では参照しない）
+        "_bench_label": label,
+    }
+
+
+def final_reactions(phases) -> dict:
+    """
+    生成したイベントを順に適用した後の、候補日投稿ごとのリアクション（reactions.get が返すべき状態）
+    """
+    state: dict = {}
+    for _, events in phases:
+        for body in events:
+            event = body["event"]
+            if body["_bench_label"] not in ("reaction_added", "reaction_removed"):
+                continue
+            users = state.setdefault(event["item"]["ts"], {}).setdefault(event["reaction"], [])
+            if event["type"] == "reaction_added" and event["user"] not in users:
+                users.append(event["user"])
+            elif event["type"] == "reaction_removed" and event["user"] in users:
+                users.remove(event["user"])
+    return state
+
+
+def build_stream(args, rng: random.Random) -> list[tuple[str, list[dict]]]:
+    """
+    (フェーズ名, イベントのリスト) を順に返す
+    """
+    seq = iter(range(1, 10**9))
+    base = datetime.now() + timedelta(days=30)
+    posts = []
+    post_events = []
+    for i in range(args.posts):
+        ts = f"1700000000.{i:06d}"
+        lines = [f"<@UBOT> 第{i}回 定例の候補日です"]
+        for j, emoji in enumerate(EMOJIS[:args.options]):
+            d = base + timedelta(days=j)
+            lines.append(f":{emoji}: {d.month}/{d.day}（月）{10 + j}時半〜")
+        posts.append(ts)
+        post_events.append(_envelope({
+            "type": "app_mention", "user": "UOWNER", "channel": "CBENCH",
+            "text": "\n".join(lines), "ts": ts,
+        }, "candidate_post", next(seq)))
+
+    reaction_events = []
+    voted = []
+    for _ in range(args.reactions):
+        if rng.random() < args.unrelated_ratio:
+            reaction_events.append(_envelope({
+                "type": "reaction_added", "user": f"U{rng.randint(0, args.users):05d}",
+                "reaction": rng.choice(["thumbsup", "eyes", "one"]),
+                "item": {"type": "message", "channel": "CBENCH", "ts": f"1600000000.{rng.randint(0, 10**6):06d}"},
+            }, "reaction_unrelated", next(seq)))
+            continue
+        if voted and rng.random() < args.remove_ratio:
+            ts, emoji, user = voted.pop(rng.randrange(len(voted)))
+            event_type, label = "reaction_removed", "reaction_removed"
+        else:
+            ts, emoji, user = rng.choice(posts), rng.choice(EMOJIS[:args.options]), f"U{rng.randint(0, args.users):05d}"
+            voted.append((ts, emoji, user))
+            event_type, label = "reaction_added", "reaction_added"
+        reaction_events.append(_envelope({
+            "type": event_type, "user": user, "reaction": emoji,
+            "item": {"type": "message", "channel": "CBENCH", "ts": ts},
+        }, label, next(seq)))
+
+    decision_events = [
+        _envelope({
+            "type": "app_mention", "user": "UOWNER", "channel": "CBENCH",
+            "text": f"<@UBOT> 日程は :{rng.choice(EMOJIS[:args.options])}: にします",
+            "ts": f"1800000000.{i:06d}", "thread_ts": ts,
+        }, "decision", next(seq))
+        for i, ts in enumerate(posts)
+    ]
+    return [("posts", post_events), ("reactions", reaction_events), ("decisions", decision_events)]
+
+
+# --- 実行 ---------------------------------------------------------------------
+
+async def run(args) -> dict:
+    counter = install_fakes(args.storage, args.db_latency_ms / 1000, args.slack_latency_ms / 1000)
+    from app import slack_events
+    from app.clients import get_slack_client
+    from app.main import app
+
+    processing = defaultdict(list)
+    completed = 0
+
+    original_handler = slack_events.process_slack_event
+
+    def timed_handler(body: dict):
+        nonlocal completed
+        label = body.get("_bench_label", "unknown")
+        current_event_type.set(label)
+        try:
+            return original_handler(body)
+        finally:
+            processing[label].append(time.perf_counter() - body["_bench_sent_at"])
+            completed += 1
+
+    # inline モードはモジュールの関数を、queue モードはワーカープールのハンドラを差し替える
+    slack_events.process_slack_event = timed_handler
+    slack_events.event_pool._handler = timed_handler
+    slack_events.REACTION_SHED_QUEUE_DEPTH = args.shed_queue_depth
+
+    rng = random.Random(args.seed)
+    phases = build_stream(args, rng)
+    expected = final_reactions(phases)
+    get_slack_client().reactions = expected
+    ack = defaultdict(list)
+    status = defaultdict(int)
+    sent = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+
+            async def send(body: dict):
+                nonlocal sent
+                async with semaphore:
+                    body["_bench_sent_at"] = time.perf_counter()
+                    start = time.perf_counter()
+                    response = await client.post("/slack/events", json=body)
+                    ack[body["_bench_label"]].append(time.perf_counter() - start)
+                    status[response.status_code] += 1
+                    if response.status_code == 200:
+                        sent += 1
+
+            started = time.perf_counter()
+            for name, events in phases:
+                phase_start = time.perf_counter()
+                await asyncio.gather(*(send(body) for body in events))
+                # 次のフェーズに進む前に、受け付けたイベントの処理完了を待つ（処理しなかったイベントは除く）
+                while completed < sent - slack_events.reaction_reconciler.stats()["shed"]:
+                    await asyncio.sleep(0.005)
+                logging.getLogger(__name__).info(
+                    f"{name}: {len(events)}件 {time.perf_counter() - phase_start:.2f}秒")
+            elapsed = time.perf_counter() - started
+
+    # 決定時の同期も含めて、最終的な参加者がリアクションの状態と一致しているか
+    from app.storage import get_store
+    matched = 0
+    for ts, reactions in expected.items():
+        stored = (get_store().get_schedule(ts) or {}).get("participants") or {}
+        truth = {f":{name}:": set(users) for name, users in reactions.items() if users}
+        matched += {k: set(v) for k, v in stored.items() if v} == truth
+
+    db_calls = counter.by_event_type("db")
+    slack_calls = counter.by_event_type("slack")
+    results = {}
+    for label in sorted(set(ack) | set(processing)):
+        n = len(ack[label])
+        results[label] = {
+            "events": n,
+            "ack_p50_ms": percentile(ack[label], 50) * 1000,
+            "ack_p95_ms": percentile(ack[label], 95) * 1000,
+            "ack_p99_ms": percentile(ack[label], 99) * 1000,
+            "processing_p50_ms": percentile(processing[label], 50) * 1000,
+            "processing_p95_ms": percentile(processing[label], 95) * 1000,
+            "processing_p99_ms": percentile(processing[label], 99) * 1000,
+            "db_calls": db_calls.get(label, 0),
+            "slack_calls": slack_calls.get(label, 0),
+            "db_calls_per_event": db_calls.get(label, 0) / n if n else 0.0,
+            "slack_calls_per_event": slack_calls.get(label, 0) / n if n else 0.0,
+        }
+    total = sum(len(v) for v in ack.values())
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "elapsed_s": elapsed,
+        "throughput_eps": total / elapsed if elapsed else 0.0,
+        "status_codes": dict(status),
+        "shed_events": slack_events.reaction_reconciler.stats()["shed"],
+        "participants_matched": f"{matched}/{len(expected)}",
+        "background": {
+            "db_calls": db_calls.get("background", 0),
+            "slack_calls": slack_calls.get("background", 0),
+        },
+        "results": results,
+    }
+
+
+# --- 出力 ---------------------------------------------------------------------
+
+COLUMNS = [
+    ("events", "件数", "{:>7.0f}"),
+    ("ack_p50_ms", "応答p50", "{:>9.2f}"),
+    ("ack_p99_ms", "応答p99", "{:>9.2f}"),
+    ("processing_p50_ms", "処理p50", "{:>9.2f}"),
+    ("processing_p95_ms", "処理p95", "{:>9.2f}"),
+    ("processing_p99_ms", "処理p99", "{:>9.2f}"),
+    ("db_calls_per_event", "DB/件", "{:>7.2f}"),
+    ("slack_calls_per_event", "Slack/件", "{:>8.2f}"),
+]
+
+
+def print_report(report: dict):
+    header = f"{'イベント種別':<20}" + "".join(f"{title:>10}" for _, title, _ in COLUMNS)
+    print(header)
+    for label, row in report["results"].items():
+        print(f"{label:<20}" + "".join(f"{fmt.format(row[key]):>10}" for key, _, fmt in COLUMNS))
+    print(f"\n合計 {report['elapsed_s']:.2f}秒, スループット {report['throughput_eps']:.1f} イベント/秒, "
+          f"ステータス {report['status_codes']}")
+    print(f"処理しなかったリアクション {report.get('shed_events', 0)}件, "
+          f"参加者がリアクションと一致した投稿 {report.get('participants_matched', '-')}")
+    print(f"イベント処理外（バッファの書き込み等）: DB {report['background']['db_calls']}回, "
+          f"Slack {report['background']['slack_calls']}回")
+    print("レイテンシの単位はミリ秒")
+
+
+def print_comparison(before: dict, after: dict):
+    keys = ["ack_p50_ms", "ack_p99_ms", "processing_p50_ms", "processing_p95_ms", "processing_p99_ms",
+            "db_calls_per_event", "slack_calls_per_event"]
+    print(f"{'イベント種別':<20}{'指標':<24}{'before':>12}{'after':>12}{'変化':>10}")
+    for label in sorted(set(before["results"]) | set(after["results"])):
+        b = before["results"].get(label, {})
+        a = after["results"].get(label, {})
+        for key in keys:
+            bv, av = b.get(key, 0.0), a.get(key, 0.0)
+            change = f"{(av - bv) / bv * 100:+.1f}%" if bv else "-"
+            print(f"{label:<20}{key:<24}{bv:>12.2f}{av:>12.2f}{change:>10}")
+    bt, at = before["throughput_eps"], after["throughput_eps"]
+    print(f"\nスループット: {bt:.1f} -> {at:.1f} イベント/秒 ({(at - bt) / bt * 100:+.1f}%)" if bt else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=20, help="候補日投稿の数")
+    parser.add_argument("--options", type=int, default=5, help="1投稿あたりの候補数（最大5）")
+    parser.add_argument("--reactions", type=int, default=2000, help="リアクションイベントの数")
+    parser.add_argument("--users", type=int, default=200, help="リアクションするユーザー数")
+    parser.add_argument("--unrelated-ratio", type=float, default=0.5, help="候補日投稿以外へのリアクションの割合")
+    parser.add_argument("--remove-ratio", type=float, default=0.1, help="リアクション削除の割合")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時に送るリクエスト数")
+    parser.add_argument("--storage", choices=["supabase", "sqlite"], default="supabase",
+                        help="supabase: JSONB を読み書きする代替実装 / sqlite: 正規化した投票テーブル")
+    parser.add_argument("--db-latency-ms", type=float, default=20.0)
+    parser.add_argument("--slack-latency-ms", type=float, default=50.0)
+    parser.add_argument("--shed-queue-depth", type=int, default=0,
+                        help="キューがこの件数以上のときリアクションを処理せず同期に任せる（0 で無効）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果を JSON で保存するパス")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="保存した2つの結果を比較する")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        print_comparison(before, after)
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+起動時のリマインド再登録（rehydrate_reminders）の所要時間の計測
+
+未送信のリマインドを持つスケジュールを件数を変えてストアに用意し、
+DB からのページ読み込みとスケジューラへの登録、スケジューラ開始までの時間を測る。
+件数に対して 1 件あたりの時間がほぼ一定であることを確認する。
+--mode sweep では、ジョブを登録しない sweep 方式の起動時間とジョブ数を確認できる。
+
+    python -m benchmarks.bench_rehydrate --sizes 1000 10000 50000
+    python -m benchmarks.bench_rehydrate --sizes 1000 10000 50000 --mode sweep
+"""
+import os
+
+# 実際のクライアントを作らせないためのダミー値（app を import する前に設定する）
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+from .fakes import CallCounter, FakeSupabase
+
+
+def seed(store, size: int, overdue_ratio: float):
+    """
+    未来のリマインドと、停止中に予定時刻を過ぎたリマインドを持つスケジュールを作る
+    """
+    from app.datetime_parser import JST
+
+    now = datetime.now(JST)
+    overdue = int(size * overdue_ratio)
+    for i in range(size):
+        if i < overdue:
+            # 予定の開始前（すぐに送信）と開始後（取り消し）を半々にする
+            event_at = now + timedelta(hours=6) if i % 2 else now - timedelta(hours=6)
+        else:
+            event_at = now + timedelta(days=2, minutes=i)
+        ts = f"{1700000000 + i}.000100"
+        store.insert_schedule({
+            'main_message_ts': ts,
+            'channel_id': 'C0BENCH',
+            'options': {':one:': event_at.isoformat()},
+            'participants': {':one:': ['U0BENCH']},
+            'selected_emoji': ':one:',
+            'selected_datetime': event_at.isoformat(),
+            'reminder_at': (event_at - timedelta(days=1)).isoformat(),
+            'reminder_job_id': f"reminder_{ts}_one",
+        })
+
+
+def run(size: int, storage: str, page_size: int, overdue_ratio: float, mode: str) -> dict:
+    from app import slack_events
+    from app.scheduler import scheduler
+    from app.storage import SupabaseStore, SQLiteStore, set_store
+
+    if storage == "sqlite":
+        store = SQLiteStore(":memory:")
+    else:
+        store = SupabaseStore(FakeSupabase(CallCounter()))
+    seed(store, size, overdue_ratio)
+    set_store(store)
+    slack_events.REMINDER_MODE = mode
+
+    start = time.perf_counter()
+    counts = slack_events.rehydrate_reminders(page_size)
+    rehydrated = time.perf_counter()
+    scheduler.start(paused=True)
+    started = time.perf_counter()
+    jobs = len(scheduler.get_jobs())
+    scheduler.shutdown(wait=False)
+    scheduler.remove_all_jobs()
+    return {
+        "size": size,
+        **counts,
+        "jobs": jobs,
+        "rehydrate_ms": (rehydrated - start) * 1000,
+        "scheduler_start_ms": (started - rehydrated) * 1000,
+        "per_row_us": (started - start) / max(size, 1) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="未送信のリマインド件数")
+    parser.add_argument("--storage", choices=["supabase", "sqlite"], default="sqlite",
+                        help="ストア（supabase はインメモリの代替実装）")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--mode", choices=["jobs", "sweep"], default="jobs", help="リマインドの送信方式")
+    parser.add_argument("--overdue-ratio", type=float, default=0.1, help="停止中に予定時刻を過ぎたリマインドの割合")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"{'件数':>8} {'ジョブ':>8} {'登録':>8} {'即時送信':>8} {'取り消し':>8} {'再登録(ms)':>12} {'開始(ms)':>10} {'1件あたり(µs)':>14}")
+    for size in args.sizes:
+        r = run(size, args.storage, args.page_size, args.overdue_ratio, args.mode)
+        print(f"{r['size']:>8} {r['jobs']:>8} {r['scheduled']:>8} {r['caught_up']:>8} {r['skipped']:>8} "
+              f"{r['rehydrate_ms']:>12.1f} {r['scheduler_start_ms']:>10.1f} {r['per_row_us']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+起動時間と HTTP 接続の使い回しの計測
+
+1. 認証情報の環境変数なしで app.main を import する時間（新しいプロセスで --repeat 回）
+2. ローカルの HTTP サーバーに対して Slack / Supabase のクライアントで --calls 回呼び出し、
+   1回あたりの時間とサーバー側で受け付けた TCP 接続数を、接続を使い回さない従来の WebClient と比べる
+
+    python -m benchmarks.bench_startup --calls 200
+"""
+import os
+
+# 実際のサーバーに接続させないためのダミー値（app を import する前に設定する）
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Slack Web API と PostgREST のどちらにも空の成功応答を返す（keep-alive に対応）
+    """
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を分けて書き込むため、Nagle アルゴリズムによる遅延を避ける
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        body = b"[]" if self.path.startswith("/rest/") else json.dumps({"ok": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PATCH = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure_import(repeat: int) -> list[float]:
+    """
+    認証情報を外した環境の新しいプロセスで app.main の import にかかる時間（秒）
+    """
+    env = {k: v for k, v in os.environ.items() if k not in ("SLACK_BOT_TOKEN", "SUPABASE_URL", "SUPABASE_KEY")}
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        results.append(float(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def measure_calls(server, name: str, call, calls: int) -> dict:
+    server.connections = 0
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    elapsed = time.perf_counter() - start
+    return {"name": name, "per_call_ms": elapsed / calls * 1000, "connections": server.connections}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="クライアントごとの呼び出し回数")
+    parser.add_argument("--repeat", type=int, default=3, help="import 時間を測る回数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    imports = measure_import(args.repeat)
+    print(f"認証情報なしでの app.main の import: 中央値 {statistics.median(imports) * 1000:.0f} ms（{args.repeat}回）")
+
+    server = start_server()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SUPABASE_URL"] = base
+
+    from slack_sdk import WebClient
+    from app.clients import PooledWebClient, get_supabase, close_clients
+
+    urllib_client = WebClient(token="xoxb-benchmark", base_url=f"{base}/api/")
+    pooled_client = PooledWebClient(token="xoxb-benchmark", base_url=f"{base}/api/")
+    start = time.perf_counter()
+    supabase = get_supabase()
+    created_ms = (time.perf_counter() - start) * 1000
+    table = supabase.table("schedules")
+
+    results = [
+        measure_calls(server, "Slack（urllib、接続ごと）", lambda: urllib_client.api_test(), args.calls),
+        measure_calls(server, "Slack（接続プール）", lambda: pooled_client.api_test(), args.calls),
+        measure_calls(server, "Supabase（接続プール）",
+                      lambda: table.select("main_message_ts").eq("main_message_ts", "0").execute(), args.calls),
+    ]
+    print(f"Supabase クライアントの作成: {created_ms:.1f} ms")
+    print(f"{'クライアント':<28} {'1回あたり(ms)':>14} {'TCP接続数':>10}")
+    for r in results:
+        print(f"{r['name']:<28} {r['per_call_ms']:>14.2f} {r['connections']:>10}")
+    pooled_client.close()
+    close_clients()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
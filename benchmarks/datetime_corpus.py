@@ -0,0 +1,52 @@
+"""
+候補日テキストの解析結果の正解データ
+
+(入力, clean_datetime_text の結果, 基準時刻 NOW で確定した (年, 月, 日, 時, 分) または None)
+"""
+from datetime import datetime
+from app.datetime_parser import JST
+
+# 正解データの基準となる現在時刻
+NOW = JST.localize(datetime(2026, 1, 15, 12, 0))
+
+CORPUS = [
+    ('7/10 10:00', '7/10 10:00', (2026, 7, 10, 10, 0)),
+    ('7月10日 10:00', '7/10 10:00', (2026, 7, 10, 10, 0)),
+    ('７月１０日 １０：００', '7/10 10:00', (2026, 7, 10, 10, 0)),
+    ('7/10(木) 14:00', '7/10 14:00', (2026, 7, 10, 14, 0)),
+    ('7/10（木）14時', '7/10 14:00', (2026, 7, 10, 14, 0)),
+    ('7月10日(木)14時半', '7/10 14:30', (2026, 7, 10, 14, 30)),
+    ('7月10日 14時30分', '7/10 14:30', (2026, 7, 10, 14, 30)),
+    ('7月10日 14時5分', '7/10 14:05', (2026, 7, 10, 14, 5)),
+    ('7月10日 14時05分', '7/10 14:05', (2026, 7, 10, 14, 5)),
+    ('07/01 09:00', '07/01 09:00', (2026, 7, 1, 9, 0)),
+    ('月曜日 10:00〜', '10:00', (2027, 1, 15, 10, 0)),
+    ('月曜 10:00〜', '10:00', (2027, 1, 15, 10, 0)),
+    ('火曜 14:00〜', '14:00', (2026, 1, 15, 14, 0)),
+    ('12/25 9時', '12/25 9:00', (2026, 12, 25, 9, 0)),
+    ('12/25', '12/25', (2026, 12, 25, 0, 0)),
+    ('12月25日', '12/25', (2026, 12, 25, 0, 0)),
+    ('14:00', '14:00', (2026, 1, 15, 14, 0)),
+    ('9時半から', '9:30', (2027, 1, 15, 9, 30)),
+    ('１２月３日（水）１８：３０〜', '12/3 18:30', (2026, 12, 3, 18, 30)),
+    ('１２月３日(水)', '12/3', (2026, 12, 3, 0, 0)),
+    ('8/1 午前10時', '8/1 10:00', (2026, 8, 1, 10, 0)),
+    ('8月1日の19時から', '8/1 19:00', (2026, 8, 1, 19, 0)),
+    ('10/5 10:00-12:00', '10/5 10:00', (2026, 10, 5, 10, 0)),
+    ('7/10 10時 or 11:00', '7/10 10:00', (2026, 7, 10, 10, 0)),
+    ('7/10 11:00 or 10時半', '7/10 10:30', (2026, 7, 10, 10, 30)),
+    ('2025/7/10 10:00', '25/7 10:00', None),
+    ('未定', '未定', (2027, 1, 15, 0, 0)),
+    ('13/40 10:00', '13/40 10:00', None),
+    ('7/10 25時', '7/10 25:00', None),
+    ('7/10 10時75分', '7/10 10:75', None),
+    ('  7/10  ', '7/10', (2026, 7, 10, 0, 0)),
+    ('7/10 10:00（オンライン）', '7/10 10:00', (2026, 7, 10, 10, 0)),
+    ('３/３ ９時半', '3/3 9:30', (2026, 3, 3, 9, 30)),
+    ('6月30日(月) 9:05', '6/30 9:05', (2026, 6, 30, 9, 5)),
+    ('4/1（金）', '4/1', (2026, 4, 1, 0, 0)),
+    ('水曜日の15時', '15:00', (2026, 1, 15, 15, 0)),
+    ('1/15 11:59', '1/15 11:59', (2027, 1, 15, 11, 59)),
+    ('1/15 12:01', '1/15 12:01', (2026, 1, 15, 12, 1)),
+    ('2/29 10:00', '2/29 10:00', None),
+]
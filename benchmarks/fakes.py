@@ -0,0 +1,343 @@
+"""
+ベンチマーク用の Slack Web API / Supabase の代替実装
+
+どちらも呼び出しごとに指定した遅延を入れ、呼び出し回数を「現在処理中のイベント種別」ごとに数える。
+"""
+import contextvars
+import copy
+import itertools
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+# 現在処理中のイベント種別（ワーカーのスレッドにも引き継がれる）
+current_event_type = contextvars.ContextVar("current_event_type", default="background")
+
+
+class CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def record(self, kind: str, name: str):
+        with self._lock:
+            self.counts[(current_event_type.get(), kind, name)] += 1
+
+    def by_event_type(self, kind: str) -> dict:
+        result: Counter = Counter()
+        with self._lock:
+            for (event_type, k, _), n in self.counts.items():
+                if k == kind:
+                    result[event_type] += n
+        return dict(result)
+
+
+class FakeSlackClient:
+    """
+    slack_sdk.WebClient の代わりに使う。送信内容は保持しない
+
+    reactions には reactions.get で返すリアクション（{ts: {リアクション名: [user_id, ...]}}）を設定できる。
+    """
+
+    def __init__(self, counter: CallCounter, latency: float = 0.0):
+        self._counter = counter
+        self._latency = latency
+        self._ts = itertools.count(1)
+        self.reactions: dict = {}
+
+    def _call(self, method: str, **kwargs):
+        self._counter.record("slack", method)
+        if self._latency:
+            time.sleep(self._latency)
+        return {"ok": True, "ts": f"9999999999.{next(self._ts):06d}", "channel": kwargs.get("channel")}
+
+    def chat_postMessage(self, **kwargs):
+        return self._call("chat.postMessage", **kwargs)
+
+    def chat_postEphemeral(self, **kwargs):
+        return self._call("chat.postEphemeral", **kwargs)
+
+    def reactions_get(self, **kwargs):
+        response = self._call("reactions.get", **kwargs)
+        reactions = self.reactions.get(kwargs.get("timestamp"), {})
+        response["message"] = {"reactions": [
+            {"name": name, "users": list(users), "count": len(users)} for name, users in reactions.items() if users
+        ]}
+        return response
+
+    def __getattr__(self, name):
+        # 未実装のメソッドも呼び出し回数だけは数える
+        method = name.replace("_", ".", 1)
+        return lambda **kwargs: self._call(method, **kwargs)
+
+
+class FakeQuery:
+    """
+    postgrest のクエリビルダのうち、このアプリが使う部分だけを実装したもの
+    """
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._payload = None
+        self._filters = []
+        self._order = None
+        self._limit = None
+        self._offset = 0
+        self._single = False
+        self._maybe_single = False
+        self._negate = False
+
+    # --- 操作 ---
+    def select(self, *columns, **kwargs):
+        self._op = "select"
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self._op, self._payload = "upsert", payload
+        return self
+
+    def update(self, payload, **kwargs):
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    # --- フィルタ ---
+    def _filter(self, func):
+        if self._negate:
+            self._negate = False
+            self._filters.append(lambda r: not func(r))
+        else:
+            self._filters.append(func)
+        return self
+
+    @property
+    def not_(self):
+        # 次のフィルタを否定する
+        self._negate = True
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda r: r.get(column) == value)
+
+    def neq(self, column, value):
+        return self._filter(lambda r: r.get(column) != value)
+
+    def gt(self, column, value):
+        return self._filter(lambda r: r.get(column) is not None and r.get(column) > value)
+
+    def gte(self, column, value):
+        return self._filter(lambda r: r.get(column) is not None and r.get(column) >= value)
+
+    def lt(self, column, value):
+        return self._filter(lambda r: r.get(column) is not None and r.get(column) < value)
+
+    def lte(self, column, value):
+        return self._filter(lambda r: r.get(column) is not None and r.get(column) <= value)
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        return self._filter(lambda r: r.get(column) is expected or r.get(column) == expected)
+
+    def or_(self, filters: str, **kwargs):
+        # "col.op.value,col.op.value" 形式（is / eq / neq / lt / lte / gt / gte のみ）
+        conditions = []
+        for part in re.findall(r'(?:[^,"]|"[^"]*")+', filters):
+            column, op, value = part.split('.', 2)
+            value = value.strip('"')
+            if op == 'is':
+                value = None if value == 'null' else value
+            conditions.append((column, op, value))
+        ops = {
+            'is': lambda a, b: a is b or a == b, 'eq': lambda a, b: a == b, 'neq': lambda a, b: a != b,
+            'lt': lambda a, b: a is not None and a < b, 'lte': lambda a, b: a is not None and a <= b,
+            'gt': lambda a, b: a is not None and a > b, 'gte': lambda a, b: a is not None and a >= b,
+        }
+        return self._filter(lambda r: any(ops[op](r.get(column), value) for column, op, value in conditions))
+
+    def in_(self, column, values):
+        values = list(values)
+        return self._filter(lambda r: r.get(column) in values)
+
+    def order(self, column, desc=False, **kwargs):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, size, **kwargs):
+        self._limit = size
+        return self
+
+    def range(self, start, end, **kwargs):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def maybe_single(self):
+        self._maybe_single = True
+        return self
+
+    def execute(self):
+        self._db.counter.record("db", f"{self._table}.{self._op}")
+        if self._db.latency:
+            time.sleep(self._db.latency)
+        with self._db.lock:
+            data = self._execute()
+        if self._single or self._maybe_single:
+            if not data:
+                if self._single:
+                    raise Exception("JSON object requested, multiple (or no) rows returned")
+                return None
+            data = data[0]
+        return SimpleNamespace(data=data, count=None)
+
+    def _execute(self):
+        rows = self._db.tables.setdefault(self._table, [])
+        if self._op in ("insert", "upsert"):
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            inserted = []
+            for row in payload:
+                key = self._db.primary_keys.get(self._table)
+                existing = next((r for r in rows if key and r.get(key) == row.get(key)), None)
+                if existing is not None:
+                    if self._op == "insert":
+                        raise Exception(f"duplicate key value violates unique constraint ({key})")
+                    existing.update(copy.deepcopy(row))
+                    inserted.append(copy.deepcopy(existing))
+                else:
+                    row = {**self._db.column_defaults(self._table), **copy.deepcopy(row)}
+                    rows.append(row)
+                    inserted.append(copy.deepcopy(row))
+            return inserted
+        matched = [r for r in rows if all(f(r) for f in self._filters)]
+        if self._op == "update":
+            for r in matched:
+                r.update(copy.deepcopy(self._payload))
+            return [copy.deepcopy(r) for r in matched]
+        if self._op == "delete":
+            removed = {id(r) for r in matched}
+            self._db.tables[self._table] = [r for r in rows if id(r) not in removed]
+            return [copy.deepcopy(r) for r in matched]
+        if self._order:
+            column, desc = self._order
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        matched = matched[self._offset:]
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        return [copy.deepcopy(r) for r in matched]
+
+
+class CountingStore:
+    """
+    任意の ScheduleStore をラップし、メソッド呼び出しごとに遅延を入れて回数を数える
+    """
+
+    def __init__(self, store, counter: CallCounter, latency: float = 0.0):
+        self._store = store
+        self._counter = counter
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self._counter.record("db", name)
+            if self._latency:
+                time.sleep(self._latency)
+            return attr(*args, **kwargs)
+        return call
+
+
+class FakeSupabase:
+    """
+    supabase.Client の代わりに使うインメモリのテーブル
+    """
+
+    def __init__(self, counter: CallCounter, latency: float = 0.0):
+        self.counter = counter
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tables: dict[str, list] = {}
+        self.primary_keys = {"schedules": "main_message_ts", "installations": "team_id",
+                             "schedules_archive": "main_message_ts"}
+
+    def column_defaults(self, table: str) -> dict:
+        if table == "schedules":
+            return {
+                "participants": {},
+                "is_reminder_sent": False,
+                "reminder_deliveries": {},
+                "vote_counts": {},
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+        return {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> "FakeRpc":
+        return FakeRpc(self, name, params)
+
+
+class FakeRpc:
+    """
+    README に定義を載せているデータベース関数のうち、このアプリが使うものを実装したもの
+    """
+
+    def __init__(self, db: FakeSupabase, name: str, params: dict):
+        self._db = db
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        self._db.counter.record("db", f"rpc.{self._name}")
+        if self._db.latency:
+            time.sleep(self._db.latency)
+        function = getattr(self, f"_{self._name}", None)
+        if function is None:
+            raise Exception(f"function {self._name} does not exist")
+        with self._db.lock:
+            return SimpleNamespace(data=function(**self._params), count=None)
+
+    def _increment_schedule_rollups(self, rows: list):
+        table = self._db.tables.setdefault("schedule_rollups", [])
+        for row in rows:
+            key = tuple(row[c] for c in ("team_id", "channel_id", "metric", "dimension"))
+            existing = next((r for r in table if tuple(r[c] for c in (
+                "team_id", "channel_id", "metric", "dimension")) == key), None)
+            if existing is None:
+                table.append(dict(row))
+            else:
+                existing["value"] += row["value"]
+        return None
+
+    def _apply_participant_deltas(self, target_ts: str, deltas: list) -> Optional[dict]:
+        from app.participant_buffer import apply_participant_deltas, count_votes
+
+        row = next((r for r in self._db.tables.get("schedules", []) if r["main_message_ts"] == target_ts), None)
+        if row is None:
+            return None
+        participants = copy.deepcopy(row.get("participants") or {})
+        before = count_votes(participants)
+        if not apply_participant_deltas(participants, [(d["op"], d["emoji"], d["user_id"]) for d in deltas]):
+            return None
+        row["participants"] = participants
+        row["vote_counts"] = count_votes(participants)
+        return {"channel_id": row.get("channel_id"), "team_id": row.get("team_id"),
+                "before": before, "after": dict(row["vote_counts"])}
@@ -0,0 +1,22 @@
+import pytest
+
+from app import clients, storage
+from app.storage import SQLiteStore
+
+
+@pytest.fixture
+def store():
+    return SQLiteStore(":memory:")
+
+
+@pytest.fixture
+def app_store(store, monkeypatch):
+    """
+    アプリ全体で使うストアと Slack クライアントを、テストの間だけ SQLite と代替実装に差し替える
+    """
+    from benchmarks.fakes import CallCounter, FakeSlackClient
+
+    counter = CallCounter()
+    monkeypatch.setattr(storage, "_store", store)
+    monkeypatch.setattr(clients, "_slack_client", FakeSlackClient(counter))
+    return store, counter
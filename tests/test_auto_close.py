@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import slack_events
+from app.auto_close import AutoCloseRules
+from app.datetime_parser import JST
+
+
+@pytest.fixture
+def rules(monkeypatch):
+    rules = AutoCloseRules(mode="propose", min_votes=2, deadline_hours=0, min_lead=1)
+    monkeypatch.setattr(slack_events, "auto_close_rules", rules)
+    return rules
+
+
+def add_voted(store, message_ts):
+    event_at = datetime.now(JST) + timedelta(days=3)
+    store.insert_schedule({
+        'main_message_ts': message_ts, 'channel_id': 'C1',
+        'options': {':one:': event_at.isoformat(), ':two:': (event_at + timedelta(days=1)).isoformat()},
+        'participants': {':one:': ["U1", "U2"]},
+    })
+    return store.get_schedule_summary(message_ts)
+
+
+def test_failed_proposal_is_retried(app_store, rules, monkeypatch):
+    store, counter = app_store
+    summary = add_voted(store, "1.0")
+    client = slack_events.get_slack_client()
+    post = client.chat_postMessage
+
+    def fail(**kwargs):
+        raise RuntimeError("slack unavailable")
+
+    monkeypatch.setattr(client, "chat_postMessage", fail)
+    with pytest.raises(RuntimeError):
+        slack_events.check_auto_close("1.0", summary)
+    # 失敗した提案は記録されず、次の評価で再び提案する
+    assert not rules.has_acted("1.0", ':one:')
+    assert store.get_schedule("1.0")['auto_close_action'] is None
+
+    monkeypatch.setattr(client, "chat_postMessage", post)
+    slack_events.check_auto_close("1.0", summary)
+    assert rules.has_acted("1.0", ':one:')
+    assert store.get_schedule("1.0")['auto_close_action'] == "propose::one:"
+    slack_events.check_auto_close("1.0", summary)
+    assert sum(n for key, n in counter.counts.items() if key[-1] == "chat.postMessage") == 1
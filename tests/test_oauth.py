@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import oauth
+
+
+@pytest.fixture
+def client(app_store, monkeypatch):
+    monkeypatch.setattr(oauth, "SLACK_CLIENT_ID", "client-id")
+    monkeypatch.setattr(oauth, "SLACK_CLIENT_SECRET", "client-secret")
+    monkeypatch.setattr(oauth, "SLACK_OAUTH_REDIRECT_URI", "https://testserver/slack/oauth/callback")
+    slack = SimpleNamespace(oauth_v2_access=lambda **kwargs: {
+        "team": {"id": "T1", "name": "Team"}, "access_token": "xoxb-1", "bot_user_id": "B1"})
+    monkeypatch.setattr(oauth, "new_slack_client", lambda: slack)
+    app = FastAPI()
+    app.include_router(oauth.router)
+    return TestClient(app, base_url="https://testserver")
+
+
+def start_install(client) -> str:
+    response = client.get("/slack/install", follow_redirects=False)
+    assert response.status_code == 307
+    return dict(p.split("=", 1) for p in response.headers["location"].split("?", 1)[1].split("&"))["state"]
+
+
+def test_callback_requires_the_browser_that_started_install(client, app_store):
+    store, _ = app_store
+    state = start_install(client)
+
+    # 他のブラウザ（Cookie がない）に渡された state は受け付けない
+    other = TestClient(client.app, base_url="https://testserver")
+    assert other.get("/slack/oauth/callback", params={"code": "c", "state": state}).status_code == 400
+    assert store.get_installation("T1") is None
+
+    response = client.get("/slack/oauth/callback", params={"code": "c", "state": state})
+    assert response.status_code == 200
+    assert store.get_installation("T1")['bot_token'] == "xoxb-1"
+
+
+def test_callback_rejects_state_issued_for_another_browser(client):
+    state = start_install(client)
+    start_install(client)  # 同じブラウザで始め直すと、Cookie は新しい乱数に変わる
+
+    assert client.get("/slack/oauth/callback", params={"code": "c", "state": state}).status_code == 400
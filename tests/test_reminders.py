@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import slack_events
+from app.datetime_parser import JST
+from app.scheduler import scheduler
+
+
+@pytest.fixture(autouse=True)
+def clear_jobs():
+    yield
+    scheduler.remove_all_jobs()
+
+
+def post_count(counter) -> int:
+    return sum(n for key, n in counter.counts.items() if key[-1] == "chat.postMessage")
+
+
+def add_decided(store, message_ts, reminder_at, participants=("U1", "U2")):
+    event_at = reminder_at + timedelta(days=1)
+    store.insert_schedule({
+        'main_message_ts': message_ts, 'channel_id': 'C1',
+        'options': {':one:': event_at.isoformat()}, 'participants': {':one:': list(participants)},
+    })
+    store.update_schedule(message_ts, {
+        'selected_emoji': ':one:', 'selected_datetime': event_at.isoformat(),
+        'reminder_at': reminder_at.isoformat(), 'reminder_job_id': f"reminder_{message_ts}_one",
+    })
+
+
+# --- 停止したワーカーのリース ---
+
+def test_reminder_blocked_by_stale_lease_is_sent_after_it_expires(app_store):
+    store, counter = app_store
+    now = datetime.now(JST)
+    add_decided(store, "1.0", now - timedelta(hours=1))
+    # 停止前のワーカーが送信中のままリースを残している
+    lease_expires_at = now + timedelta(minutes=10)
+    assert store.claim_reminder("1.0", now, "old-pid", lease_expires_at)
+
+    slack_events.rehydrate_reminders()
+    assert scheduler.get_job("reminder_1.0_one").trigger.run_date > lease_expires_at
+    slack_events.send_reminder("1.0")
+    assert post_count(counter) == 0
+    assert scheduler.get_job("reminder_retry_1.0").trigger.run_date > lease_expires_at
+
+    # リースの期限の後に実行されると送信できる
+    store.update_schedule("1.0", {'reminder_lease_expires_at': (now - timedelta(seconds=1)).isoformat()})
+    slack_events.send_reminder("1.0")
+    assert post_count(counter) == 2
+    assert store.get_schedule("1.0")['is_reminder_sent'] is True
+
+
+def test_reminder_error_releases_lease_and_schedules_retry(app_store, monkeypatch):
+    store, counter = app_store
+    add_decided(store, "2.0", datetime.now(JST) - timedelta(minutes=1))
+
+    def fail(schedule_data):
+        raise RuntimeError("slack unavailable")
+
+    monkeypatch.setattr(slack_events, "deliver_reminder", fail)
+    slack_events.send_reminder("2.0")
+    row = store.get_schedule("2.0")
+    assert row['reminder_lease_owner'] is None and row['is_reminder_sent'] is False
+    assert scheduler.get_job("reminder_retry_2.0") is not None
+
+
+# --- sweep 方式のリース延長 ---
+
+def test_digest_sweep_stops_when_lease_is_taken_over(app_store, monkeypatch):
+    from app import clients, fanout
+
+    store, counter = app_store
+    monkeypatch.setattr(slack_events, "REMINDER_DIGEST_WINDOW", 60)
+    monkeypatch.setattr(fanout, "get_rate_limiter", lambda method: fanout.TokenBucket(1e6, 1e6))
+    users = [f"U{i}" for i in range(120)]
+    add_decided(store, "3.0", datetime.now(JST) - timedelta(seconds=1), participants=users)
+
+    client = clients._slack_client
+    post = client.chat_postMessage
+
+    def post_then_lose_lease(**kwargs):
+        # 送信中にリースが切れ、他のワーカーが確保し直した状況
+        if post_count(counter) >= 30:
+            store.update_schedule("3.0", {'reminder_lease_owner': "other"})
+        return post(**kwargs)
+
+    monkeypatch.setattr(client, "chat_postMessage", post_then_lose_lease)
+    assert slack_events.sweep_reminders() == 0
+    # 最初のチェックポイントで中断し、残りの宛先には送信しない
+    assert post_count(counter) == fanout.REMINDER_FANOUT_CHECKPOINT
+    row = store.get_schedule("3.0")
+    assert row['is_reminder_sent'] is False and row['reminder_lease_owner'] == "other"
+    assert len(row['reminder_deliveries']) == fanout.REMINDER_FANOUT_CHECKPOINT
+
+
+# --- 決定し直し ---
+
+def test_redecision_cancels_previous_reminder_job(app_store, monkeypatch):
+    store, counter = app_store
+    monkeypatch.setattr(slack_events, "REMINDER_MODE", "jobs")
+    first = datetime.now(JST) + timedelta(days=2)
+    store.insert_schedule({
+        'main_message_ts': "4.0", 'channel_id': 'C1',
+        'options': {':one:': first.isoformat(), ':two:': (first + timedelta(days=3)).isoformat()},
+        'participants': {':one:': ["U1"], ':two:': ["U2"]},
+    })
+    assert slack_events.decide_schedule("C1", "4.0", [":one:"])
+    assert scheduler.get_job("reminder_4.0_one") is not None
+
+    assert slack_events.decide_schedule("C1", "4.0", [":two:"])
+    assert scheduler.get_job("reminder_4.0_one") is None
+    assert scheduler.get_job("reminder_4.0_two") is not None
+
+    # 他のワーカーに残った前の決定のジョブが実行されても、予約の時刻より前には送信しない
+    sent_before = post_count(counter)
+    slack_events.send_reminder("4.0")
+    assert post_count(counter) == sent_before
+    row = store.get_schedule("4.0")
+    assert row['is_reminder_sent'] is False and row['reminder_lease_owner'] is None
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from app import slack_events
+from app.datetime_parser import JST
+from app.rollups import RollupBuffer, VOTES, RESPONDED_POSTS
+
+
+def pending(buffer: RollupBuffer) -> dict:
+    return {(metric, dimension): value for _, _, metric, dimension, value in buffer.pending()}
+
+
+def test_votes_are_counted_once_when_several_workers_sync(app_store, monkeypatch):
+    store, _ = app_store
+    buffer = RollupBuffer()
+    monkeypatch.setattr(slack_events, "rollups", buffer)
+    event_at = datetime.now(JST) + timedelta(days=3)
+    store.insert_schedule({'main_message_ts': "1.0", 'channel_id': 'C1',
+                           'options': {':one:': event_at.isoformat()}, 'participants': {}})
+
+    # 同じリアクションの差分を2つのワーカーが書き込んでも、変わったのは1回だけ
+    assert slack_events.write_participant_deltas("1.0", [("add", ':one:', "U1")])
+    assert not slack_events.write_participant_deltas("1.0", [("add", ':one:', "U1")])
+    assert pending(buffer) == {(VOTES, ':one:'): 1, (RESPONDED_POSTS, ''): 1}
+
+    # スナップショットでの同期も、DB に反映された差分だけを数える
+    slack_events.get_slack_client().reactions = {"1.0": {"one": ["U1", "U2"]}}
+    assert slack_events.reconcile_participants("1.0", "C1")
+    assert not slack_events.reconcile_participants("1.0", "C1")
+    assert pending(buffer) == {(VOTES, ':one:'): 2, (RESPONDED_POSTS, ''): 1}
+    assert store.get_schedule("1.0")['vote_counts'] == {':one:': 2}
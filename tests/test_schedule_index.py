@@ -0,0 +1,16 @@
+import time
+
+from app.schedule_index import ScheduleIndex
+
+
+def test_recent_unknown_ts_is_not_negatively_cached(app_store):
+    store, _ = app_store
+    index = ScheduleIndex(negative_min_age=300)
+    recent, old = f"{time.time() - 5:.6f}", f"{time.time() - 3600:.6f}"
+
+    assert index.get_options(recent) is None and index.get_options(old) is None
+    assert index.stats()['negative'] == 1
+    # 別のワーカーが保存した後のリアクションは候補日投稿として扱う
+    store.insert_schedule({'main_message_ts': recent, 'channel_id': 'C1', 'options': {':one:': "x"},
+                           'participants': {}})
+    assert index.get_options(recent) == {':one:': "x"}
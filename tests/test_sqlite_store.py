@@ -0,0 +1,200 @@
+import json
+import sqlite3
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from app.storage import SQLiteStore, ARCHIVE_DECIDED, ARCHIVE_ABANDONED
+
+NOW = datetime(2026, 1, 10, 12, 0, tzinfo=timezone.utc)
+LEASE = timedelta(minutes=10)
+
+
+def add_schedule(store, message_ts, **fields):
+    store.insert_schedule({
+        'main_message_ts': message_ts,
+        'channel_id': 'C1',
+        'options': {':one:': (NOW + timedelta(days=3)).isoformat()},
+        'participants': fields.pop('participants', {}),
+        **fields,
+    })
+
+
+def add_due_reminder(store, message_ts, reminder_at):
+    add_schedule(store, message_ts)
+    store.update_schedule(message_ts, {'reminder_job_id': f"reminder_{message_ts}",
+                                       'reminder_at': reminder_at.isoformat()})
+
+
+# --- claim_reminder: リースの compare-and-set と期限切れの引き継ぎ ---
+
+def test_claim_reminder_is_exclusive_until_lease_expires(store):
+    add_due_reminder(store, "1.0", NOW)
+
+    assert store.claim_reminder("1.0", NOW, "worker-a", NOW + LEASE)
+    # 他のワーカーは有効なリースを奪えないが、同じワーカーは取り直せる
+    assert not store.claim_reminder("1.0", NOW + timedelta(minutes=1), "worker-b", NOW + LEASE)
+    assert store.claim_reminder("1.0", NOW + timedelta(minutes=1), "worker-a", NOW + LEASE * 2)
+    assert store.get_schedule("1.0")['reminder_lease_owner'] == "worker-a"
+
+
+def test_claim_reminder_takes_over_expired_lease(store):
+    add_due_reminder(store, "1.0", NOW)
+    assert store.claim_reminder("1.0", NOW, "worker-a", NOW + LEASE)
+
+    later = NOW + LEASE + timedelta(seconds=1)
+    assert store.claim_reminder("1.0", later, "worker-b", later + LEASE)
+    # リースを失ったワーカーの書き込みは反映されない
+    assert store.update_leased_reminders(["1.0"], "worker-a", {'is_reminder_sent': True}) == []
+    assert store.get_schedule("1.0")['is_reminder_sent'] is False
+    assert store.update_leased_reminders(["1.0"], "worker-b", {'is_reminder_sent': True}) == ["1.0"]
+    assert store.get_schedule("1.0")['is_reminder_sent'] is True
+
+
+def test_claim_reminder_skips_sent_reminder(store):
+    add_due_reminder(store, "1.0", NOW)
+    store.update_schedule("1.0", {'is_reminder_sent': True})
+
+    assert not store.claim_reminder("1.0", NOW, "worker-a", NOW + LEASE)
+
+
+# --- claim_due_reminders / update_leased_reminders ---
+
+def test_claim_due_reminders_respects_window_limit_and_leases(store):
+    for i in range(5):
+        add_due_reminder(store, f"{i}.0", NOW - timedelta(minutes=5 - i))
+    add_due_reminder(store, "9.0", NOW + timedelta(hours=1))
+
+    first = store.claim_due_reminders(NOW, NOW, "worker-a", NOW + LEASE, 3)
+    # reminder_at の早い順に limit 件まで確保する
+    assert first == ["0.0", "1.0", "2.0"]
+    second = store.claim_due_reminders(NOW, NOW, "worker-b", NOW + LEASE, 10)
+    assert sorted(second) == ["3.0", "4.0"]
+    assert store.claim_due_reminders(NOW, NOW, "worker-c", NOW + LEASE, 10) == []
+
+    # 期限切れのリースは送信済みにしていない行だけ引き継がれる
+    store.update_leased_reminders(first, "worker-a", {'is_reminder_sent': True, 'reminder_lease_owner': None})
+    later = NOW + LEASE + timedelta(seconds=1)
+    assert sorted(store.claim_due_reminders(later, later, "worker-c", later + LEASE, 10)) == ["3.0", "4.0"]
+
+
+def test_update_leased_reminders_only_updates_held_rows(store):
+    ts_list = [f"{i}.0" for i in range(1200)]
+    for ts in ts_list:
+        add_due_reminder(store, ts, NOW)
+    claimed = store.claim_due_reminders(NOW, NOW, "worker-a", NOW + LEASE, 1000)
+    assert len(claimed) == 1000
+
+    # 確保していない行を含めて渡しても、リースを持つ行だけを更新して返す
+    updated = store.update_leased_reminders(ts_list, "worker-a", {'is_reminder_sent': True})
+    assert sorted(updated) == sorted(claimed)
+    unclaimed = set(ts_list) - set(claimed)
+    assert not any(store.get_schedule(ts)['is_reminder_sent'] for ts in list(unclaimed)[:10])
+
+
+# --- マイグレーション ---
+
+LEGACY_SCHEMA = """
+CREATE TABLE schedules (
+    main_message_ts TEXT PRIMARY KEY,
+    channel_id TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    selected_emoji TEXT,
+    selected_datetime TEXT,
+    reminder_job_id TEXT,
+    is_reminder_sent INTEGER NOT NULL DEFAULT 0,
+    reminder_deliveries TEXT NOT NULL DEFAULT '{}',
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+"""
+
+
+def test_migrations_add_columns_to_legacy_database(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO schedules (main_message_ts, channel_id, options) VALUES (?, ?, ?)",
+                 ("1.0", "C1", json.dumps({':one:': NOW.isoformat()})))
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStore(path)
+    columns = {row['name'] for row in store._conn.execute("PRAGMA table_info(schedules)")}
+    assert {column for _, column, _ in SQLiteStore.MIGRATIONS} <= columns
+    indexes = {row['name'] for row in store._conn.execute("PRAGMA index_list(schedules)")}
+    assert "schedules_reminder_due_idx" in indexes
+
+    row = store.get_schedule("1.0")
+    assert row['vote_counts'] == {} and row['reminder_lease_owner'] is None
+    store.apply_participant_deltas("1.0", [("add", ':one:', "U1")])
+    assert store.get_schedule("1.0")['participants'] == {':one:': ["U1"]}
+
+    # 2回目以降の起動ではカラムを追加しない
+    SQLiteStore(path)
+
+
+# --- archive_schedules ---
+
+def archived(store, message_ts):
+    row = store._conn.execute(
+        "SELECT reason, data FROM schedules_archive WHERE main_message_ts = ?", (message_ts,)).fetchone()
+    return row['reason'], json.loads(zlib.decompress(row['data']))
+
+
+def test_archive_schedules_moves_decided_and_abandoned_in_batches(store):
+    old = (NOW - timedelta(days=60)).isoformat()
+    add_schedule(store, "1.0", participants={':one:': ["U1", "U2"]}, created_at=old)
+    store.update_schedule("1.0", {'selected_emoji': ':one:',
+                                  'selected_datetime': (NOW - timedelta(days=40)).isoformat()})
+    add_schedule(store, "2.0", participants={':one:': ["U3"]}, created_at=old)
+    add_schedule(store, "3.0", created_at=NOW.isoformat())
+    add_schedule(store, "4.0", created_at=old)
+    store.update_schedule("4.0", {'selected_emoji': ':one:',
+                                  'selected_datetime': (NOW + timedelta(days=1)).isoformat()})
+
+    decided_before, abandoned_before = NOW - timedelta(days=30), NOW - timedelta(days=30)
+    first = store.archive_schedules(decided_before, abandoned_before, 1)
+    second = store.archive_schedules(decided_before, abandoned_before, 10)
+    assert [(m['main_message_ts'], m['reason']) for m in first + second] == [
+        ("1.0", ARCHIVE_DECIDED), ("2.0", ARCHIVE_ABANDONED)]
+    assert all(m['archived_bytes'] > 0 and m['bytes'] > 0 for m in first + second)
+    assert store.archive_schedules(decided_before, abandoned_before, 10) == []
+
+    # 予定日時前の決定済みと最近の投稿は残り、移した行の参加表明も削除される
+    assert store.get_schedule("1.0") is None and store.get_schedule("2.0") is None
+    assert store.get_schedule("3.0") is not None and store.get_schedule("4.0") is not None
+    assert store._conn.execute(
+        "SELECT COUNT(*) FROM votes WHERE main_message_ts IN ('1.0', '2.0')").fetchone()[0] == 0
+    reason, data = archived(store, "1.0")
+    assert reason == ARCHIVE_DECIDED and data['participants'] == {':one:': ["U1", "U2"]}
+
+
+def test_archive_schedules_disabled_reason_is_skipped(store):
+    add_schedule(store, "1.0", created_at=(NOW - timedelta(days=60)).isoformat())
+
+    assert store.archive_schedules(NOW, None, 10) == []
+    assert store.get_schedule("1.0") is not None
+
+
+# --- 決定し直し ---
+
+def test_redecision_resets_reminder_state(app_store, monkeypatch):
+    from app import slack_events
+
+    store, _ = app_store
+    monkeypatch.setattr(slack_events, "REMINDER_MODE", "sweep")
+    future = datetime.now(timezone.utc) + timedelta(days=3)
+    store.insert_schedule({
+        'main_message_ts': "500.0", 'channel_id': 'C1',
+        'options': {':one:': future.isoformat(), ':two:': (future + timedelta(days=1)).isoformat()},
+        'participants': {':one:': ["U1"], ':two:': ["U2"]},
+    })
+    assert slack_events.decide_schedule("C1", "500.0", [":one:"])
+    store.update_schedule("500.0", {'is_reminder_sent': True, 'reminder_deliveries': {"U1": "sent"}})
+
+    assert slack_events.decide_schedule("C1", "500.0", [":two:"])
+    row = store.get_schedule("500.0")
+    assert row['selected_emoji'] == ':two:'
+    assert row['is_reminder_sent'] is False and row['reminder_deliveries'] == {}
+    # 決定し直したリマインドは再び確保の対象になる
+    due = datetime.fromisoformat(row['reminder_at'])
+    assert store.claim_due_reminders(due, due, "worker-a", due + LEASE, 10) == ["500.0"]
@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.storage import SupabaseStore
+from benchmarks.fakes import CallCounter, FakeSupabase
+
+
+def test_participant_deltas_from_several_processes_are_not_lost():
+    db = FakeSupabase(CallCounter(), latency=0.001)
+    # プロセスごとのストア（書き込みバッファのロックは共有しない）
+    stores = [SupabaseStore(db) for _ in range(4)]
+    stores[0].insert_schedule({'main_message_ts': "1.0", 'channel_id': 'C1', 'options': {}, 'participants': {}})
+
+    def vote(i):
+        return stores[i % len(stores)].apply_participant_deltas("1.0", [("add", ':one:', f"U{i}")])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(vote, range(40)))
+    row = stores[0].get_schedule("1.0")
+    assert sorted(row['participants'][':one:']) == sorted(f"U{i}" for i in range(40))
+    assert row['vote_counts'] == {':one:': 40}
+
+    assert not stores[1].apply_participant_deltas("1.0", [("add", ':one:', "U0")])
+    change = stores[2].apply_participant_deltas("1.0", [("remove", ':one:', "U0"), ("add", ':two:', "U0")])
+    assert change == {'channel_id': 'C1', 'team_id': None,
+                      'before': {':one:': 40}, 'after': {':one:': 39, ':two:': 1}}
+    assert stores[3].get_schedule("1.0")['vote_counts'] == {':one:': 39, ':two:': 1}